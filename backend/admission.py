@@ -0,0 +1,253 @@
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Token buckets per route class, keyed by what they count: the client address
+# before anything else runs, the account once the request body is parsed. A
+# bucket holds ``count`` tokens and refills at ``count`` per ``period``.
+RATE_LIMITS = {
+    "login": {"ip": "30/minute", "account": "10/minute"},
+    "register": {"ip": "10/minute", "account": "3/minute"},
+    "contact": {"ip": "5/minute", "account": "3/minute"},
+}
+
+# Requests of a class allowed in flight at once; beyond that they are shed with a
+# 503. Login and register spend most of their time in bcrypt, so a burst of them
+# must not take every connection and executor slot from the storefront.
+CONCURRENCY_LIMITS = {
+    "login": 16,
+    "register": 8,
+    "contact": 8,
+}
+
+ROUTE_CLASSES = {
+    ("POST", "/api/auth/login"): "login",
+    ("POST", "/api/auth/register"): "register",
+    ("POST", "/api/contact"): "contact",
+}
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many requests")
+        self.retry_after = retry_after
+
+
+class RateLimit:
+    """``count`` requests per ``period`` seconds, allowing bursts of up to ``count``."""
+
+    __slots__ = ("capacity", "rate")
+
+    def __init__(self, count: int, period: float):
+        self.capacity = float(count)
+        self.rate = count / period
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        """``"10/minute"`` or ``"10/60"``."""
+        count, _, period = spec.partition("/")
+        seconds = PERIODS.get(period.strip()) or float(period)
+        return cls(int(count), seconds)
+
+    def retry_after(self, tokens: float) -> int:
+        return max(1, math.ceil((1 - tokens) / self.rate))
+
+
+class MemoryBuckets:
+    """Token buckets in this process, the least recently used forgotten beyond ``max_keys``."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit) -> Optional[int]:
+        """Spend a token from ``key``'s bucket; None if there was one, else seconds until there is."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.capacity, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return None
+        return limit.retry_after(bucket[0])
+
+
+class MongoBuckets:
+    """Token buckets shared by every worker, one ``rate_limits`` document per key.
+
+    Refill and spend happen in a single pipeline update, so concurrent workers
+    never both take the last token. Documents expire through a TTL index once a
+    bucket would be full again. A denied key is also remembered locally until
+    its retry time, so a burst against one key costs one round trip, not one per
+    request.
+    """
+
+    def __init__(self, db, max_keys: int = 100_000):
+        self.collection = db.rate_limits
+        self.max_keys = max_keys
+        self._denied: "OrderedDict[str, float]" = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit) -> Optional[int]:
+        denied_until = self._denied.get(key)
+        if denied_until is not None:
+            if denied_until > time.monotonic():
+                return max(1, math.ceil(denied_until - time.monotonic()))
+            del self._denied[key]
+
+        now = time.time()
+        tokens = {"$min": [limit.capacity, {"$add": [
+            {"$ifNull": ["$tokens", limit.capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, limit.rate]},
+        ]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": tokens, "updated": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": datetime.fromtimestamp(now + limit.capacity / limit.rate, timezone.utc),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return None
+        retry_after = limit.retry_after(bucket["tokens"])
+        self._denied[key] = time.monotonic() + retry_after
+        if len(self._denied) > self.max_keys:
+            self._denied.popitem(last=False)
+        return retry_after
+
+
+class Admission:
+    """Admission control for the routes listed in ``ROUTE_CLASSES``.
+
+    ``admit`` runs in AdmissionMiddleware before the request body is read: it
+    checks the client address bucket and the route class concurrency cap.
+    Handlers call ``check_account`` once the body has named the account. A
+    rejected request is counted in ``metrics`` as shed, by route class and reason.
+    """
+
+    def __init__(self, buckets, metrics=None, enabled: bool = True, trusted_proxies: int = 0,
+                 rate_limits: Optional[Dict[str, Dict[str, str]]] = None,
+                 concurrency_limits: Optional[Dict[str, int]] = None):
+        self.buckets = buckets
+        self.metrics = metrics
+        self.enabled = enabled
+        # how many proxies in front of us append to X-Forwarded-For
+        self.trusted_proxies = trusted_proxies
+        self.rate_limits = {
+            route_class: {scope: RateLimit.parse(spec) for scope, spec in limits.items()}
+            for route_class, limits in (rate_limits or RATE_LIMITS).items()
+        }
+        self.concurrency_limits = concurrency_limits or CONCURRENCY_LIMITS
+        self.in_flight: Dict[str, int] = {route_class: 0 for route_class in self.concurrency_limits}
+
+    def client_address(self, scope) -> str:
+        if self.trusted_proxies:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    hops = [hop.strip() for hop in value.decode("latin-1").split(",")]
+                    return hops[max(0, len(hops) - self.trusted_proxies)]
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _take(self, route_class: str, scope_name: str, key: str):
+        limit = self.rate_limits.get(route_class, {}).get(scope_name)
+        if limit is None:
+            return
+        try:
+            retry_after = await self.buckets.take(f"{route_class}:{scope_name}:{key}", limit)
+        except PyMongoError as e:
+            # fail open: a rate limiter outage must not take logins down with it
+            logger.warning("Rate limit check failed: %s", e)
+            return
+        if retry_after is not None:
+            self._shed(route_class, f"{scope_name}_rate")
+            raise RateLimited(retry_after)
+
+    def _shed(self, route_class: str, reason: str):
+        if self.metrics is not None:
+            self.metrics.observe_shed(route_class, reason)
+
+    async def admit(self, route_class: str, scope) -> bool:
+        """Take a concurrency slot for the request; False if the class is saturated.
+
+        Raises RateLimited when the client address has used up its bucket.
+        """
+        await self._take(route_class, "ip", self.client_address(scope))
+        cap = self.concurrency_limits.get(route_class)
+        if cap is None:
+            return True
+        if self.in_flight[route_class] >= cap:
+            self._shed(route_class, "concurrency")
+            return False
+        self.in_flight[route_class] += 1
+        return True
+
+    def release(self, route_class: str):
+        if route_class in self.in_flight:
+            self.in_flight[route_class] -= 1
+
+    async def check_account(self, route_class: str, account: str):
+        """Raise RateLimited if ``account`` has used up its bucket for this route class."""
+        if self.enabled:
+            await self._take(route_class, "account", account.strip().lower())
+
+
+class AdmissionMiddleware:
+    """Sheds requests to rate-limited or saturated route classes before they reach a handler."""
+
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        route_class = None
+        if scope["type"] == "http" and self.admission.enabled:
+            route_class = ROUTE_CLASSES.get((scope["method"], scope["path"]))
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            admitted = await self.admission.admit(route_class, scope)
+        except RateLimited as e:
+            await _reject(send, 429, "Too many requests, please retry later", e.retry_after)
+            return
+        if not admitted:
+            await _reject(send, 503, "Server busy, please retry", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.release(route_class)
+
+
+async def _reject(send, status: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(retry_after).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
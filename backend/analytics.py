@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from checkout import supports_transactions
+
+logger = logging.getLogger(__name__)
+
+# One document per day x category x product, and one per day
+BY_PRODUCT = "sales_by_product"
+BY_DAY = "sales_by_day"
+UNCATEGORIZED = "Uncategorized"
+
+SWEEP_INTERVAL = 60.0
+# Orders younger than this are left to the request that placed them
+SWEEP_GRACE = timedelta(seconds=30)
+SWEEP_BATCH = 1000
+# ``rolled_up`` of an order being added without a transaction; a claim older than
+# CLAIM_TIMEOUT belongs to a caller that died and is taken over by the sweep
+ROLLING = "rolling"
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def order_day(order: dict) -> str:
+    # created_at is a UTC isoformat string, so its date part is the UTC day
+    return order["created_at"][:10]
+
+
+def rollup_operations(order: dict):
+    """The increments one order contributes to each rollup collection."""
+    day = order_day(order)
+    lines: Dict[str, dict] = {}
+    for line in order["products"]:
+        entry = lines.setdefault(line["product_id"], {
+            "category": line.get("category") or UNCATEGORIZED, "name": line["name"], "units": 0, "revenue": 0.0})
+        entry["units"] += line["quantity"]
+        entry["revenue"] += line["price"] * line["quantity"]
+
+    by_product = [
+        UpdateOne(
+            {"day": day, "category": line["category"], "product_id": product_id},
+            {"$inc": {"units": line["units"], "revenue": line["revenue"], "orders": 1},
+             "$set": {"name": line["name"]}},
+            upsert=True,
+        )
+        for product_id, line in lines.items()
+    ]
+    by_day = UpdateOne(
+        {"day": day},
+        {"$inc": {"orders": 1, "units": sum(line["units"] for line in lines.values()),
+                  "revenue": sum(line["revenue"] for line in lines.values())}},
+        upsert=True,
+    )
+    return by_product, by_day
+
+
+async def record_order(db, order: dict) -> bool:
+    """Add ``order`` to the rollups once, however many workers or sweeps try.
+
+    Only the caller that moves the order's ``rolled_up`` flag off False applies
+    the increments. With transactions the flag and the increments commit
+    together. Without, the order is claimed as ``"rolling"`` first and marked
+    done once the increments are in; a failed caller hands the claim back, and a
+    claim left by a crash is taken over by the sweep after ``CLAIM_TIMEOUT``. A
+    crash between the increments and the mark can then count the order twice
+    until the next rebuild.
+    """
+    by_product, by_day = rollup_operations(order)
+    if await supports_transactions(db.client):
+        async def run(session):
+            claimed = await db.orders.update_one({"id": order["id"], "rolled_up": False},
+                                                 {"$set": {"rolled_up": True}}, session=session)
+            if not claimed.modified_count:
+                return False
+            await db[BY_PRODUCT].bulk_write(by_product, ordered=False, session=session)
+            await db[BY_DAY].bulk_write([by_day], session=session)
+            return True
+
+        async with await db.client.start_session() as session:
+            return await session.with_transaction(run)
+
+    now = datetime.now(timezone.utc)
+    claimed_at = now.isoformat()
+    claimed = await db.orders.update_one(
+        {"id": order["id"], "$or": [
+            {"rolled_up": False},
+            {"rolled_up": ROLLING, "rollup_claimed_at": {"$lt": (now - CLAIM_TIMEOUT).isoformat()}},
+        ]},
+        {"$set": {"rolled_up": ROLLING, "rollup_claimed_at": claimed_at}},
+    )
+    if not claimed.modified_count:
+        return False
+    mine = {"id": order["id"], "rolled_up": ROLLING, "rollup_claimed_at": claimed_at}
+    try:
+        await db[BY_PRODUCT].bulk_write(by_product, ordered=False)
+        await db[BY_DAY].bulk_write([by_day])
+    except PyMongoError:
+        try:
+            await db.orders.update_one(mine, {"$set": {"rolled_up": False}, "$unset": {"rollup_claimed_at": ""}})
+        except PyMongoError:
+            pass  # the claim times out instead
+        raise
+    await db.orders.update_one(mine, {"$set": {"rolled_up": True}, "$unset": {"rollup_claimed_at": ""}})
+    return True
+
+
+async def record_order_logged(db, order: dict):
+    try:
+        await record_order(db, order)
+    except PyMongoError as e:
+        logger.warning("Could not add order %s to the sales rollups, the sweep will retry: %s", order["id"], e)
+
+
+async def sweep(db) -> int:
+    """Roll up orders that their request did not get to (crash, Mongo error) or claimed and never finished."""
+    now = datetime.now(timezone.utc)
+    pending = {"rolled_up": False, "created_at": {"$lt": (now - SWEEP_GRACE).isoformat()}}
+    abandoned = {"rolled_up": ROLLING, "rollup_claimed_at": {"$lt": (now - CLAIM_TIMEOUT).isoformat()}}
+    recorded = 0
+    for query in (pending, abandoned):
+        async for order in db.orders.find(query, {"_id": 0, "id": 1, "products": 1, "created_at": 1}).limit(SWEEP_BATCH):
+            recorded += await record_order(db, order)
+    return recorded
+
+
+async def rebuild(db, before_day: Optional[str] = None) -> dict:
+    """Recompute the rollups of every day before ``before_day`` (default: today, UTC) from ``orders``.
+
+    Days from ``before_day`` on are left to incremental maintenance, so orders
+    placed while the rebuild runs are neither lost nor counted twice. Rebuilt
+    documents replace the live ones in place and leftovers from earlier runs are
+    deleted afterwards, so reports never see an empty or half-built day. Counts
+    and categories follow ``rollup_operations``, so a rebuilt day matches one
+    maintained incrementally; order lines from before categories were recorded
+    on orders are Uncategorized.
+    """
+    before_day = before_day or datetime.now(timezone.utc).date().isoformat()
+    run = uuid.uuid4().hex
+    older = {"created_at": {"$lt": before_day}}
+
+    # Claim the older orders first, so a concurrent sweep cannot add them on top
+    await db.orders.update_many({**older, "rolled_up": {"$ne": True}},
+                                {"$set": {"rolled_up": True}, "$unset": {"rollup_claimed_at": ""}})
+
+    await db.orders.aggregate([
+        {"$match": older},
+        {"$unwind": "$products"},
+        {"$group": {
+            # the same fallback as rollup_operations: a line without a category is Uncategorized
+            "_id": {"day": {"$substrCP": ["$created_at", 0, 10]},
+                    "category": {"$cond": [{"$gt": [{"$ifNull": ["$products.category", ""]}, ""]},
+                                           "$products.category", UNCATEGORIZED]},
+                    "product_id": "$products.product_id"},
+            "name": {"$last": "$products.name"},
+            "units": {"$sum": "$products.quantity"},
+            "revenue": {"$sum": {"$multiply": ["$products.price", "$products.quantity"]}},
+            # orders, not lines: an order with two lines of one product counts once
+            "order_ids": {"$addToSet": "$id"},
+        }},
+        {"$project": {"_id": 0, "day": "$_id.day", "category": "$_id.category", "product_id": "$_id.product_id",
+                      "name": 1, "units": 1, "revenue": 1, "orders": {"$size": "$order_ids"}, "rebuild": run}},
+        {"$merge": {"into": BY_PRODUCT, "on": ["day", "category", "product_id"],
+                    "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ], allowDiskUse=True).to_list(None)
+
+    await db.orders.aggregate([
+        {"$match": older},
+        {"$group": {
+            "_id": {"$substrCP": ["$created_at", 0, 10]},
+            "orders": {"$sum": 1},
+            "units": {"$sum": {"$sum": "$products.quantity"}},
+            "revenue": {"$sum": "$total_amount"},
+        }},
+        {"$project": {"_id": 0, "day": "$_id", "orders": 1, "units": 1, "revenue": 1, "rebuild": run}},
+        {"$merge": {"into": BY_DAY, "on": "day", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ], allowDiskUse=True).to_list(None)
+
+    stale = {"day": {"$lt": before_day}, "rebuild": {"$ne": run}}
+    removed = (await db[BY_PRODUCT].delete_many(stale)).deleted_count
+    removed += (await db[BY_DAY].delete_many(stale)).deleted_count
+    return {
+        "before_day": before_day,
+        "product_rows": await db[BY_PRODUCT].count_documents({"day": {"$lt": before_day}}),
+        "days": await db[BY_DAY].count_documents({"day": {"$lt": before_day}}),
+        "stale_removed": removed,
+    }
+
+
+class SalesRollups:
+    """Report queries over the rollup collections, and the sweep that keeps them complete."""
+
+    def __init__(self, sweep_interval: float = SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def start(self, db):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever(db))
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_forever(self, db):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                recorded = await sweep(db)
+                if recorded:
+                    logger.info("Sales rollup sweep added %d orders", recorded)
+            except PyMongoError as e:
+                logger.warning("Sales rollup sweep failed: %s", e)
+
+    # Reports
+
+    async def daily(self, db, start: str, end: str) -> List[dict]:
+        return await db[BY_DAY].find(
+            {"day": {"$gte": start, "$lte": end}}, {"_id": 0, "rebuild": 0}
+        ).sort("day", 1).to_list(None)
+
+    async def revenue_by_category(self, db, start: str, end: str) -> List[dict]:
+        return await db[BY_PRODUCT].aggregate([
+            {"$match": {"day": {"$gte": start, "$lte": end}}},
+            {"$group": {"_id": {"day": "$day", "category": "$category"},
+                        "units": {"$sum": "$units"}, "revenue": {"$sum": "$revenue"}}},
+            {"$project": {"_id": 0, "day": "$_id.day", "category": "$_id.category", "units": 1, "revenue": 1}},
+            {"$sort": {"day": 1, "revenue": -1}},
+        ]).to_list(None)
+
+    async def top_products(self, db, start: str, end: str, limit: int = 10, by: str = "units") -> List[dict]:
+        return await db[BY_PRODUCT].aggregate([
+            {"$match": {"day": {"$gte": start, "$lte": end}}},
+            {"$group": {"_id": "$product_id", "name": {"$last": "$name"}, "category": {"$last": "$category"},
+                        "units": {"$sum": "$units"}, "revenue": {"$sum": "$revenue"}, "orders": {"$sum": "$orders"}}},
+            {"$sort": {by: -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "product_id": "$_id", "name": 1, "category": 1,
+                          "units": 1, "revenue": 1, "orders": 1}},
+        ]).to_list(limit)
+
+    async def inventory(self, db, days: int = 7, limit: int = 50) -> List[dict]:
+        """Products sold in the last ``days`` days, those closest to running out first."""
+        today = datetime.now(timezone.utc).date()
+        start = (today - timedelta(days=days - 1)).isoformat()
+        sold = await db[BY_PRODUCT].aggregate([
+            {"$match": {"day": {"$gte": start, "$lte": today.isoformat()}}},
+            {"$group": {"_id": "$product_id", "units": {"$sum": "$units"}}},
+        ]).to_list(None)
+        units = {row["_id"]: row["units"] for row in sold}
+        products = await db.products.find(
+            {"id": {"$in": list(units)}}, {"_id": 0, "id": 1, "name": 1, "category": 1, "stock": 1}
+        ).to_list(None)
+
+        report = []
+        for product in products:
+            per_day = units[product["id"]] / days
+            report.append({
+                "product_id": product["id"], "name": product["name"], "category": product.get("category"),
+                "stock": product["stock"], "units_sold": units[product["id"]], "units_per_day": round(per_day, 2),
+                "days_of_cover": round(product["stock"] / per_day, 1),
+            })
+        report.sort(key=lambda row: row["days_of_cover"])
+        return report[:limit]
+
+
+def day_range(start: Optional[date], end: Optional[date], default_days: int = 7):
+    """``(start, end)`` as ISO days, defaulting to the last ``default_days`` days (UTC)."""
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=default_days - 1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start.isoformat(), end.isoformat()
+
+
+async def _main(before_day: Optional[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    result = await rebuild(db, before_day)
+    print(f"Rebuilt sales rollups before {result['before_day']}: {result['days']} days, "
+          f"{result['product_rows']} day x category x product rows, {result['stale_removed']} stale rows removed")
+    client.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the sales rollups from the orders collection")
+    parser.add_argument("--before", help="rebuild days before this YYYY-MM-DD (default: today, UTC)")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.before)))
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+
+import jwt
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+USER_PROJECTION = {"_id": 0, "password": 0}
+CLAIM_FIELDS = ("email", "phone", "name")
+
+
+class AuthCache:
+    """Fast path for get_current_user.
+
+    Verified token payloads are kept in an LRU keyed by the token's SHA-256
+    until the token expires, and user profiles are cached for a short TTL.
+    With ``trust_claims`` the profile embedded in the token is used directly
+    and Mongo is only consulted for the revocation list, which is polled in
+    the background. Revocations made in or broadcast to this process are kept
+    through a few polls, so a poll that does not see them yet cannot undo them.
+    """
+
+    def __init__(self, max_tokens: int = 10000, user_ttl: float = 30, max_users: int = 10000,
+                 trust_claims: bool = False, revocation_poll_interval: float = 10):
+        self.max_tokens = max_tokens
+        self.user_ttl = user_ttl
+        self.max_users = max_users
+        self.trust_claims = trust_claims
+        self.revocation_poll_interval = revocation_poll_interval
+
+        self._tokens: "OrderedDict[str, dict]" = OrderedDict()
+        self._users: "OrderedDict[str, tuple]" = OrderedDict()
+        self._revoked_jtis: Set[str] = set()
+        self._revoked_before: Dict[str, float] = {}
+        # revocations marked locally, with when they were marked, until the polled view must include them
+        self._recent_jtis: Dict[str, float] = {}
+        self._recent_users: Dict[str, Tuple[float, float]] = {}
+        self.revocation_grace = max(60.0, 3 * revocation_poll_interval)
+        self._poller: Optional[asyncio.Task] = None
+
+        self.token_hits = 0
+        self.token_misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+        self.claims_used = 0
+
+    # Tokens
+
+    def decode_token(self, token: str, secret: str, algorithm: str) -> dict:
+        """Verify ``token`` once and serve the payload from memory until it expires.
+
+        Raises the same jwt exceptions as ``jwt.decode``.
+        """
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        payload = self._tokens.get(key)
+        if payload is not None:
+            if payload.get("exp", 0) > time.time():
+                self._tokens.move_to_end(key)
+                self.token_hits += 1
+                return payload
+            del self._tokens[key]
+
+        self.token_misses += 1
+        payload = jwt.decode(token, secret, algorithms=[algorithm])
+        self._tokens[key] = payload
+        if len(self._tokens) > self.max_tokens:
+            self._tokens.popitem(last=False)
+        return payload
+
+    # Users
+
+    def user_from_claims(self, payload: dict) -> Optional[dict]:
+        if not self.trust_claims or not all(field in payload for field in CLAIM_FIELDS):
+            return None
+        self.claims_used += 1
+        return {"id": payload["sub"], **{field: payload[field] for field in CLAIM_FIELDS}}
+
+    async def get_user(self, db, user_id: str) -> Optional[dict]:
+        entry = self._users.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            self._users.move_to_end(user_id)
+            self.user_hits += 1
+            return entry[0]
+
+        self.user_misses += 1
+        user = await db.users.find_one({"id": user_id}, USER_PROJECTION)
+        if user is not None:
+            self._users[user_id] = (user, time.monotonic() + self.user_ttl)
+            self._users.move_to_end(user_id)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return user
+
+    def invalidate_user(self, user_id: str):
+        self._users.pop(user_id, None)
+
+    # Revocation
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload.get("jti") in self._revoked_jtis:
+            return True
+        revoked_before = self._revoked_before.get(payload.get("sub"))
+        return revoked_before is not None and payload.get("iat", 0) <= revoked_before
+
+    async def revoke_token(self, db, payload: dict):
+        """Revoke one token (logout). The record expires together with the token."""
+        self.mark_token_revoked(payload["jti"])
+        await db.revoked_tokens.insert_one({
+            "jti": payload["jti"],
+            "user_id": payload["sub"],
+            "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc)
+        })
+
+    async def revoke_user(self, db, user_id: str, max_token_age: float) -> float:
+        """Revoke every token issued to ``user_id`` so far (forced logout); returns the cut-off time."""
+        now = time.time()
+        self.mark_user_revoked(user_id, now)
+        await db.revoked_tokens.insert_one({
+            "user_id": user_id,
+            "revoked_before": now,
+            "expires_at": datetime.fromtimestamp(now + max_token_age, timezone.utc)
+        })
+        return now
+
+    def mark_token_revoked(self, jti: str):
+        """Reject ``jti`` in this process; used to apply a revocation made by another worker."""
+        self._revoked_jtis.add(jti)
+        self._recent_jtis[jti] = time.monotonic()
+
+    def mark_user_revoked(self, user_id: str, revoked_before: float):
+        self._revoked_before[user_id] = max(self._revoked_before.get(user_id, 0), revoked_before)
+        self._recent_users[user_id] = (self._revoked_before[user_id], time.monotonic())
+        self.invalidate_user(user_id)
+
+    async def refresh_revocations(self, db):
+        jtis, revoked_before = set(), {}
+        async for record in db.revoked_tokens.find({"expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 0}):
+            if "jti" in record:
+                jtis.add(record["jti"])
+            else:
+                user_id = record["user_id"]
+                revoked_before[user_id] = max(revoked_before.get(user_id, 0), record["revoked_before"])
+
+        # a poll that read revoked_tokens before a revocation made here was written does not include it
+        cutoff = time.monotonic() - self.revocation_grace
+        self._recent_jtis = {jti: at for jti, at in self._recent_jtis.items() if at > cutoff}
+        self._recent_users = {user_id: entry for user_id, entry in self._recent_users.items() if entry[1] > cutoff}
+        jtis.update(self._recent_jtis)
+        for user_id, (before, _) in self._recent_users.items():
+            revoked_before[user_id] = max(revoked_before.get(user_id, 0), before)
+        self._revoked_jtis = jtis
+        self._revoked_before = revoked_before
+
+    def start(self, db):
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll_revocations(db))
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+    async def _poll_revocations(self, db):
+        while True:
+            try:
+                await self.refresh_revocations(db)
+            except PyMongoError as e:
+                logger.warning("Could not refresh token revocations: %s", e)
+            await asyncio.sleep(self.revocation_poll_interval)
+
+    def stats(self) -> dict:
+        token_lookups = self.token_hits + self.token_misses
+        user_lookups = self.user_hits + self.user_misses
+        return {
+            "token_hits": self.token_hits,
+            "token_misses": self.token_misses,
+            "token_hit_rate": self.token_hits / token_lookups if token_lookups else 0.0,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "user_hit_rate": self.user_hits / user_lookups if user_lookups else 0.0,
+            "claims_used": self.claims_used,
+            "db_lookups_avoided": self.user_hits + self.claims_used,
+            "revoked_tokens": len(self._revoked_jtis),
+            "revoked_users": len(self._revoked_before),
+        }
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile
+
+CHUNK_SIZE = 255 * 1024
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class BlobStore(ABC):
+    """Content-addressed blob storage.
+
+    Blobs are written from an async iterator of chunks and identified by the
+    SHA-256 of their content, so storing the same bytes twice keeps one copy.
+    """
+
+    @abstractmethod
+    async def put(self, chunks: AsyncIterator[bytes], max_size: Optional[int] = None) -> dict:
+        ...
+
+    @abstractmethod
+    async def size(self, blob_hash: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def read(self, blob_hash: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Stream bytes ``start`` to ``end`` (inclusive) of a blob in chunks."""
+
+    @abstractmethod
+    async def delete(self, blob_hash: str):
+        ...
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db, bucket_name: str = "prescription_blobs"):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def _find(self, blob_hash: str) -> Optional[dict]:
+        return await self.files.find_one({"filename": blob_hash}, sort=[("uploadDate", -1)])
+
+    async def put(self, chunks, max_size=None):
+        digest = hashlib.sha256()
+        size = 0
+        upload = self.bucket.open_upload_stream(f"pending-{uuid.uuid4()}")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise BlobTooLarge()
+                digest.update(chunk)
+                await upload.write(chunk)
+            await upload.close()
+        except BaseException:
+            await upload.abort()
+            raise
+
+        blob_hash = digest.hexdigest()
+        if await self._find(blob_hash):
+            await self.bucket.delete(upload._id)
+        else:
+            await self.bucket.rename(upload._id, blob_hash)
+        return {"hash": blob_hash, "size": size}
+
+    async def size(self, blob_hash):
+        found = await self._find(blob_hash)
+        return found["length"] if found else None
+
+    async def read(self, blob_hash, start=0, end=None):
+        try:
+            download = await self.bucket.open_download_stream_by_name(blob_hash)
+        except NoFile:
+            return
+        end = download.length - 1 if end is None else end
+        download.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await download.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, blob_hash):
+        async for found in self.files.find({"filename": blob_hash}, {"_id": 1}):
+            await self.bucket.delete(found["_id"])
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs on the local filesystem under ``root/<hash[:2]>/<hash>``."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, blob_hash: str) -> Path:
+        if len(blob_hash) != 64 or not all(c in "0123456789abcdef" for c in blob_hash):
+            raise ValueError("Invalid blob hash")
+        return self.root / blob_hash[:2] / blob_hash
+
+    async def put(self, chunks, max_size=None):
+        digest = hashlib.sha256()
+        size = 0
+        temp_path = self.root / f".pending-{uuid.uuid4()}"
+        handle = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise BlobTooLarge()
+                digest.update(chunk)
+                await asyncio.to_thread(handle.write, chunk)
+            await asyncio.to_thread(handle.close)
+
+            blob_hash = digest.hexdigest()
+            await asyncio.to_thread(self._commit, temp_path, self._path(blob_hash))
+        except BaseException:
+            await asyncio.to_thread(self._discard, handle, temp_path)
+            raise
+        return {"hash": blob_hash, "size": size}
+
+    @staticmethod
+    def _commit(temp_path: Path, path: Path):
+        if path.exists():
+            temp_path.unlink()
+        else:
+            path.parent.mkdir(exist_ok=True)
+            os.replace(temp_path, path)
+
+    @staticmethod
+    def _discard(handle, temp_path: Path):
+        handle.close()
+        temp_path.unlink(missing_ok=True)
+
+    async def size(self, blob_hash):
+        try:
+            path = self._path(blob_hash)
+            return (await asyncio.to_thread(path.stat)).st_size
+        except (FileNotFoundError, ValueError):
+            return None
+
+    async def read(self, blob_hash, start=0, end=None):
+        try:
+            handle = await asyncio.to_thread(open, self._path(blob_hash), "rb")
+        except (FileNotFoundError, ValueError):
+            return
+        try:
+            size = (await asyncio.to_thread(os.fstat, handle.fileno())).st_size
+            end = size - 1 if end is None else end
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+
+    async def delete(self, blob_hash):
+        try:
+            path = self._path(blob_hash)
+        except ValueError:
+            return
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+
+
+def make_blob_store(db) -> BlobStore:
+    """Pick the prescription store from PRESCRIPTION_STORE (``gridfs`` or ``local``)."""
+    backend = os.environ.get('PRESCRIPTION_STORE', 'gridfs')
+    if backend == 'local':
+        return LocalBlobStore(os.environ.get('PRESCRIPTION_STORE_PATH', str(Path(__file__).parent / 'prescriptions')))
+    return GridFSBlobStore(db)
+
+
+async def iter_bytes(data: bytes, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset:offset + chunk_size]
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range ``Range: bytes=...`` header into inclusive offsets.
+
+    Returns None when there is no usable header and raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
@@ -0,0 +1,32 @@
+from typing import Dict, List
+
+
+async def fetch_products_by_id(db, product_ids: List[str], session=None) -> Dict[str, dict]:
+    """Load every distinct product in ``product_ids`` with a single ``$in`` query."""
+    unique_ids = list(dict.fromkeys(product_ids))
+    if not unique_ids:
+        return {}
+    products = await db.products.find(
+        {"id": {"$in": unique_ids}}, {"_id": 0, "reserved_by": 0}, session=session
+    ).to_list(len(unique_ids))
+    return {product['id']: product for product in products}
+
+
+async def resolve_cart_items(db, items: List[dict], session=None) -> List[dict]:
+    """Price cart items in cart order, dropping items whose product no longer exists."""
+    products = await fetch_products_by_id(db, [item['product_id'] for item in items], session=session)
+
+    resolved = []
+    for item in items:
+        product = products.get(item['product_id'])
+        if product:
+            resolved.append({
+                "product": product,
+                "quantity": item['quantity'],
+                "subtotal": product['price'] * item['quantity']
+            })
+    return resolved
+
+
+def cart_total(resolved_items: List[dict]) -> float:
+    return sum(item['subtotal'] for item in resolved_items)
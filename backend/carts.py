@@ -0,0 +1,78 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+# How many recent add-to-cart request ids a cart remembers for idempotency
+APPLIED_REQUESTS_KEPT = 50
+
+
+class CartConflictError(Exception):
+    pass
+
+
+async def add_item(db, user_id: str, product_id: str, quantity: int, request_id: Optional[str] = None):
+    """Add ``quantity`` of a product to the user's cart with single-document atomic updates.
+
+    An existing line is incremented in place; otherwise the line is pushed,
+    creating the cart if needed. Repeating a call with the same ``request_id``
+    has no further effect.
+    """
+    updated_at = datetime.now(timezone.utc).isoformat()
+    not_applied = {"applied_requests": {"$ne": request_id}} if request_id else {}
+    mark_applied = (
+        {"applied_requests": {"$each": [request_id], "$slice": -APPLIED_REQUESTS_KEPT}} if request_id else {}
+    )
+
+    # The push can race with another tab adding the same product; retrying
+    # then finds the new line and increments it instead
+    for _ in range(3):
+        update = {"$inc": {"items.$[line].quantity": quantity}, "$set": {"updated_at": updated_at}}
+        if mark_applied:
+            update["$push"] = mark_applied
+        result = await db.carts.update_one(
+            {"user_id": user_id, "items.product_id": product_id, **not_applied},
+            update,
+            array_filters=[{"line.product_id": product_id}]
+        )
+        if result.matched_count:
+            return
+
+        try:
+            await db.carts.update_one(
+                {"user_id": user_id, "items.product_id": {"$ne": product_id}, **not_applied},
+                {
+                    "$push": {"items": {"product_id": product_id, "quantity": quantity}, **mark_applied},
+                    "$set": {"updated_at": updated_at},
+                    "$setOnInsert": {"id": str(uuid.uuid4())}
+                },
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            # The cart exists, so the filter missed because of a race or a replayed request
+            if request_id and await db.carts.count_documents({"user_id": user_id, "applied_requests": request_id}):
+                return
+
+    raise CartConflictError("Cart was modified concurrently, please retry")
+
+
+async def set_item_quantity(db, user_id: str, product_id: str, quantity: int) -> bool:
+    """Set a line's quantity, removing the line when ``quantity`` is zero or less.
+
+    Returns False when the user has no cart.
+    """
+    updated_at = datetime.now(timezone.utc).isoformat()
+    if quantity <= 0:
+        result = await db.carts.update_one(
+            {"user_id": user_id},
+            {"$pull": {"items": {"product_id": product_id}}, "$set": {"updated_at": updated_at}}
+        )
+    else:
+        result = await db.carts.update_one(
+            {"user_id": user_id},
+            {"$set": {"items.$[line].quantity": quantity, "updated_at": updated_at}},
+            array_filters=[{"line.product_id": product_id}]
+        )
+    return result.matched_count > 0
@@ -0,0 +1,406 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from pagination import keyset_filter
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_PROJECTION = {"_id": 0, "reserved_by": 0}
+PRODUCT_SORT = [("name", 1), ("id", 1)]
+# Fields every order changes; a change to only these does not move the listing version
+STOCK_FIELDS = ("stock", "updated_at")
+
+
+class CatalogCache:
+    """In-process cache of the product catalog.
+
+    Products are kept in an LRU keyed by product id with a per-entry TTL. When the
+    whole catalog fits in ``max_size`` it is also kept as a ``(name, id)``-sorted
+    listing with per-category indexes, so product listings and the category list
+    never touch Mongo while the snapshot is fresh. Invalidation comes from a change stream on
+    ``products`` or, on deployments without one, from polling an ``updated_at``
+    watermark. Invalidating named products re-fetches just those into the
+    snapshot on its next use. Concurrent misses for the same product, listing
+    or category list share one query, and a read that an invalidation overtook
+    is returned but not cached.
+
+    Besides the global ``version``, each product has a ``product_version`` and
+    the listings and category list share a ``listing_version`` that a stock
+    change alone does not move, so bodies derived from them outlive checkouts.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300, poll_interval: float = 5, enabled: bool = True,
+                 invalidation: str = "auto"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        # "auto" follows a change stream and falls back to polling; "poll" always polls
+        self.invalidation = invalidation
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._listing: Optional[List[Tuple[str, str]]] = None
+        self._by_category: Dict[Optional[str], List[Tuple[str, str]]] = {}
+        self._categories: Optional[List[str]] = None
+        self._snapshot_expires = 0.0
+        self._snapshot_count: Optional[int] = None
+        self._snapshot_lock = asyncio.Lock()
+        # product id -> the document as indexed, for every product in the snapshot
+        self._snapshot_products: Dict[str, dict] = {}
+        # invalidated products still to be re-fetched into the snapshot
+        self._stale: set = set()
+        self._object_ids = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[Optional[List[str]]], None]] = []
+        self._flights = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # bumped on every invalidation; anything derived from the catalog is valid for one version
+        self.version = 0
+        # the version each product was last invalidated at, and that of the last full invalidation
+        self._invalidated_at: Dict[str, int] = {}
+        self._cleared_at = 0
+        # the version the snapshot last changed at in a way a listing shows, stock aside
+        self._listing_version = 0
+
+    # Lookups
+
+    async def get_product(self, db, product_id: str) -> Optional[dict]:
+        if not self.enabled:
+            return await self._flights.do(
+                ("product", product_id), lambda: db.products.find_one({"id": product_id}, PRODUCT_PROJECTION))
+
+        entry = self._entries.get(product_id)
+        if entry and entry[1] > time.monotonic():
+            self._entries.move_to_end(product_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        return await self._flights.do(("product", product_id), lambda: self._load_product(db, product_id))
+
+    async def _load_product(self, db, product_id: str) -> Optional[dict]:
+        version = self.version
+        product = await db.products.find_one({"id": product_id}, {"reserved_by": 0})
+        if product:
+            if self._changed_since(product_id, version):
+                product.pop("_id", None)
+            else:
+                product = self._store(product)
+        return product
+
+    async def list_products(self, db, category: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                            limit: int = 1000, projection: Optional[dict] = None) -> List[dict]:
+        """Products in ``(name, id)`` order, starting just past the ``after`` key."""
+        if self.enabled and projection is None and await self._ensure_snapshot(db):
+            keys = self._by_category.get(category, [])
+            start = bisect.bisect_right(keys, tuple(after)) if after else 0
+            self.hits += 1
+            return [self._entries[product_id][0] for _, product_id in keys[start:start + limit]]
+
+        if self.enabled:
+            self.misses += 1
+        query = {"category": category} if category else {}
+        if after:
+            query.update(keyset_filter(PRODUCT_SORT, after))
+        projection = projection or PRODUCT_PROJECTION
+        key = ("list", category, tuple(after) if after else None, limit, tuple(sorted(projection.items())))
+        products = await self._flights.do(
+            key, lambda: db.products.find(query, projection).sort(PRODUCT_SORT).limit(limit).to_list(limit))
+        # every caller gets its own list: pages are trimmed in place
+        return list(products)
+
+    async def categories(self, db) -> List[str]:
+        if not self.enabled:
+            return await self._flights.do(("categories",), lambda: db.products.distinct("category"))
+
+        if self._categories is not None and self._snapshot_expires > time.monotonic() and not self._stale:
+            self.hits += 1
+            return self._categories
+
+        self.misses += 1
+        if await self._ensure_snapshot(db):
+            return self._categories
+        return await self._flights.do(("categories",), lambda: self._load_categories(db))
+
+    async def _load_categories(self, db) -> List[str]:
+        version = self.version
+        categories = await db.products.distinct("category")
+        if self.version == version:
+            self._categories = categories
+            self._snapshot_expires = time.monotonic() + self.ttl
+        return categories
+
+    # Cache maintenance
+
+    def _store(self, product: dict, expires: float = None) -> dict:
+        object_id = product.pop("_id", None)
+        if object_id is not None:
+            self._object_ids[object_id] = product["id"]
+        self._entries[product["id"]] = (product, expires or time.monotonic() + self.ttl)
+        self._entries.move_to_end(product["id"])
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            self._drop_snapshot()
+        return product
+
+    def product_version(self, product_id: str) -> int:
+        """A version that changes whenever ``product_id`` is invalidated."""
+        return max(self._cleared_at, self._invalidated_at.get(product_id, 0))
+
+    async def listing_version(self, db) -> int:
+        """A version for listing and category bodies that changes with anything they show but stock.
+
+        Brings the snapshot up to date first; without one it is the global ``version``.
+        """
+        if self.enabled and self._listing is not None and await self._ensure_snapshot(db):
+            return self._listing_version
+        return self.version
+
+    def _changed_since(self, product_id: str, version: int) -> bool:
+        """Whether ``product_id`` was invalidated after the catalog was at ``version``."""
+        return self._cleared_at > version or self._invalidated_at.get(product_id, 0) > version
+
+    def _drop_snapshot(self):
+        self._listing = None
+        self._by_category = {}
+        self._categories = None
+        self._snapshot_count = None
+        self._snapshot_products = {}
+        self._stale = set()
+
+    def _snapshot_fresh(self) -> bool:
+        return self._listing is not None and self._snapshot_expires > time.monotonic() and not self._stale
+
+    async def _ensure_snapshot(self, db) -> bool:
+        if self._snapshot_fresh():
+            return True
+
+        async with self._snapshot_lock:
+            if self._listing is None or self._snapshot_expires <= time.monotonic():
+                if not await self._load_snapshot(db):
+                    return False
+            if self._stale:
+                await self._refresh_snapshot(db)
+            return self._snapshot_fresh()
+
+    async def _load_snapshot(self, db) -> bool:
+        version = self.version
+        products = await db.products.find({}, {"reserved_by": 0}).to_list(self.max_size + 1)
+        if len(products) > self.max_size:
+            # The catalog does not fit; only point lookups are cached
+            self._drop_snapshot()
+            return False
+        if self._cleared_at > version:
+            return False
+
+        expires = time.monotonic() + self.ttl
+        self._entries.clear()
+        self._object_ids.clear()
+        self._snapshot_products = {}
+        # products changed while the query ran are indexed now but re-fetched before use
+        self._stale = set()
+        by_category: Dict[Optional[str], List[Tuple[str, str]]] = {None: []}
+        for product in products:
+            if self._changed_since(product["id"], version):
+                product.pop("_id", None)
+                self._stale.add(product["id"])
+            else:
+                product = self._store(product, expires)
+            key = (product["name"], product["id"])
+            self._snapshot_products[product["id"]] = product
+            by_category[None].append(key)
+            by_category.setdefault(product["category"], []).append(key)
+        for keys in by_category.values():
+            keys.sort()
+
+        self._listing = by_category.pop(None)
+        self._by_category = by_category
+        self._categories = sorted(by_category)
+        self._by_category[None] = self._listing
+        self._snapshot_count = len(products)
+        self._snapshot_expires = expires
+        self._listing_version = version
+        return True
+
+    async def _refresh_snapshot(self, db):
+        """Re-fetch the invalidated products and patch them into the snapshot in place."""
+        version = self.version
+        stale = set(self._stale)
+        products = await db.products.find({"id": {"$in": list(stale)}}, {"reserved_by": 0}).to_list(None)
+        if self._listing is None:
+            return
+        found = {product["id"]: product for product in products}
+        if len(self._snapshot_products.keys() | found.keys()) > self.max_size:
+            self._drop_snapshot()
+            return
+
+        expires = self._snapshot_expires
+        for product_id in stale:
+            if self._changed_since(product_id, version):
+                continue  # invalidated again while the query ran; stays stale
+            previous = self._unindex(product_id)
+            product = found.get(product_id)
+            if _listed(previous) != _listed(product):
+                self._listing_version = version
+            if product is not None:
+                product = self._store(product, expires)
+                if self._listing is None:
+                    return  # the store evicted past max_size and dropped the snapshot
+                self._index(product)
+            self._stale.discard(product_id)
+
+        self._categories = sorted(category for category, keys in self._by_category.items()
+                                  if category is not None and keys)
+        self._snapshot_count = len(self._snapshot_products)
+
+    def _index(self, product: dict):
+        key = (product["name"], product["id"])
+        self._snapshot_products[product["id"]] = product
+        bisect.insort(self._listing, key)
+        bisect.insort(self._by_category.setdefault(product["category"], []), key)
+
+    def _unindex(self, product_id: str) -> Optional[dict]:
+        product = self._snapshot_products.pop(product_id, None)
+        if product is None:
+            return None
+        key, category = (product["name"], product["id"]), product["category"]
+        for keys in (self._listing, self._by_category.get(category)):
+            position = bisect.bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+        if not self._by_category.get(category):
+            self._by_category.pop(category, None)
+        return product
+
+    def invalidate(self, product_ids: Optional[Iterable[str]] = None):
+        """Forget the given products, or the whole catalog when ``product_ids`` is None."""
+        self.invalidations += 1
+        self.version += 1
+        # reads already in flight may predate the change; later callers must not join them
+        self._flights.forget()
+        if product_ids is None:
+            self._entries.clear()
+            self._object_ids.clear()
+            self._invalidated_at.clear()
+            self._cleared_at = self.version
+            self._drop_snapshot()
+        else:
+            product_ids = list(product_ids)
+            for product_id in product_ids:
+                self._entries.pop(product_id, None)
+                self._invalidated_at[product_id] = self.version
+            if self._listing is not None:
+                self._stale.update(product_ids)
+            else:
+                self._categories = None
+        for listener in self._listeners:
+            listener(product_ids)
+
+    def add_listener(self, listener: Callable[[Optional[List[str]]], None]):
+        """Call ``listener(product_ids)`` on every invalidation (``None`` means everything)."""
+        self._listeners.append(listener)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "version": self.version,
+            "listing_version": self._listing_version,
+            "snapshot": self._listing is not None,
+            **{f"flights_{name}": value for name, value in self._flights.stats().items()},
+        }
+
+    # Invalidation feed
+
+    def start(self, db):
+        if self.enabled and self._watcher is None:
+            feed = self._poll(db) if self.invalidation == "poll" else self._watch(db)
+            self._watcher = asyncio.create_task(feed)
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    def _apply_change(self, change: dict):
+        document = change.get("fullDocument") or {}
+        product_id = document.get("id") or self._object_ids.get(change.get("documentKey", {}).get("_id"))
+        if change.get("operationType") in ("insert", "update", "replace", "delete") and product_id:
+            self.invalidate([product_id])
+        else:
+            self.invalidate()
+
+    async def _watch(self, db):
+        while True:
+            try:
+                async with db.products.watch(full_document="updateLookup") as stream:
+                    logger.info("Catalog cache invalidation: change stream")
+                    async for change in stream:
+                        self._apply_change(change)
+            except OperationFailure as e:
+                logger.info("Change streams unavailable (%s); polling products.updated_at", e)
+                await self._poll(db)
+                return
+            except PyMongoError as e:
+                logger.warning("Catalog change stream interrupted: %s", e)
+                self.invalidate()
+                await asyncio.sleep(self.poll_interval)
+
+    async def catch_up(self, db, since: str) -> str:
+        """Invalidate products written after the ``since`` watermark and return the new watermark.
+
+        A worker forked from a preloaded catalog calls this once its feed is
+        running, to drop whatever changed between the preload and the fork.
+        """
+        changed = await db.products.find(
+            {"updated_at": {"$gt": since}}, {"_id": 0, "id": 1, "updated_at": 1}
+        ).to_list(None)
+        if changed:
+            since = max(product["updated_at"] for product in changed)
+            self.invalidate(product["id"] for product in changed)
+
+        # Deletes leave no watermark behind, so compare the catalog size too
+        if self._snapshot_count is not None:
+            if await db.products.estimated_document_count() != self._snapshot_count:
+                self.invalidate()
+        return since
+
+    async def _poll(self, db):
+        watermark = datetime.now(timezone.utc).isoformat()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                watermark = await self.catch_up(db, watermark)
+            except PyMongoError as e:
+                logger.warning("Catalog cache poll failed: %s", e)
+
+
+def _listed(product: Optional[dict]) -> Optional[dict]:
+    """What a listing shows of ``product``, stock aside."""
+    if product is None:
+        return None
+    return {field: value for field, value in product.items() if field not in STOCK_FIELDS and field != "_id"}
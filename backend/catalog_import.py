@@ -0,0 +1,251 @@
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator, List, Optional, Type, TextIO
+
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
+
+from indexes import create_indexes
+
+logger = logging.getLogger(__name__)
+
+# Product ids are derived from the SKU so a SKU keeps its id across reloads, even
+# when the catalog is rebuilt from scratch in a staging collection
+SKU_NAMESPACE = uuid.UUID("6f1c3c1e-5a47-4b8e-9d0e-2f4a8f3b7c21")
+
+BATCH_SIZE = 1000
+CONCURRENCY = 4
+MAX_REPORTED_ERRORS = 20
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+class RowError:
+    """A feed line that could not even be parsed, kept in the row stream so it is counted."""
+
+    def __init__(self, line: int, message: str):
+        self.line = line
+        self.message = message
+
+
+def product_id_for(sku: str) -> str:
+    """``str(uuid.uuid5(SKU_NAMESPACE, sku))``, without building UUID objects."""
+    digest = bytearray(hashlib.sha1(SKU_NAMESPACE.bytes + sku.encode("utf-8")).digest()[:16])
+    digest[6] = (digest[6] & 0x0F) | 0x50
+    digest[8] = (digest[8] & 0x3F) | 0x80
+    h = digest.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[dict]:
+    """Stream rows from a CSV (with a header line) or JSON Lines feed."""
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            # empty cells mean "not given" so model defaults apply
+            yield {key: value for key, value in row.items() if key and value not in ("", None)}
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield RowError(line_number, f"invalid JSON: {e}")
+                continue
+            yield row if isinstance(row, dict) else RowError(line_number, "not a JSON object")
+    else:
+        raise CatalogImportError(f"Unknown feed format: {fmt}")
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.batches = 0
+        self.errors: List[str] = []
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in
+                ("read", "invalid", "duplicates", "inserted", "updated", "unchanged", "removed", "batches")}
+
+    def __str__(self):
+        return ("read={read} inserted={inserted} updated={updated} unchanged={unchanged} "
+                "removed={removed} invalid={invalid} duplicates={duplicates}").format(**self.as_dict())
+
+
+class CatalogImport:
+    """Stream a product feed into ``products`` in bounded batches.
+
+    Rows are validated against ``model`` and keyed by a stable SKU. Each batch is
+    diffed against the live catalog with one ``$in`` lookup, then written with an
+    unordered bulk write while the next batch is parsed; at most ``concurrency``
+    batches are in flight, so memory stays bounded whatever the feed size.
+
+    ``mode="upsert"`` writes only new and changed products into the live
+    collection (and with ``prune`` deletes SKUs missing from the feed).
+    ``mode="swap"`` builds a complete copy in a staging collection and renames it
+    over ``products`` at the end, so the storefront switches catalogs atomically
+    and never sees a half-loaded one.
+    """
+
+    def __init__(self, db, model: Type[BaseModel], mode: str = "upsert", batch_size: int = BATCH_SIZE,
+                 concurrency: int = CONCURRENCY, sku_field: str = "sku", prune: bool = False,
+                 on_batch: Optional[Callable[[ImportStats], None]] = None):
+        if mode not in ("upsert", "swap"):
+            raise CatalogImportError(f"Unknown import mode: {mode}")
+        self.db = db
+        self.model = model
+        self.mode = mode
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.sku_field = sku_field
+        self.prune = prune
+        self.on_batch = on_batch
+        self.stats = ImportStats()
+        self._seen = set()
+        self._fields = [name for name in model.model_fields if name != "id"]
+        self._validate_python = model.__pydantic_validator__.validate_python
+
+    async def run(self, rows: Iterable) -> ImportStats:
+        live = self.db.products
+        if self.mode == "swap":
+            target = self.db[f"products_import_{uuid.uuid4().hex[:12]}"]
+        else:
+            target = live
+        await create_indexes(target, "products")
+
+        pending: List[asyncio.Task] = []
+        try:
+            batch = []
+            for row in rows:
+                document = self._validate(row)
+                if document is not None:
+                    batch.append(document)
+                if len(batch) >= self.batch_size:
+                    pending.append(asyncio.create_task(self._write(batch, target)))
+                    batch = []
+                    if len(pending) >= self.concurrency:
+                        await pending.pop(0)
+                    else:
+                        await asyncio.sleep(0)
+            if batch:
+                pending.append(asyncio.create_task(self._write(batch, target)))
+            await asyncio.gather(*pending)
+
+            if self.mode == "swap":
+                live_count = await live.count_documents({})
+                self.stats.removed = live_count - self.stats.updated - self.stats.unchanged
+                await target.rename("products", dropTarget=True)
+            elif self.prune:
+                await self._prune(live)
+        except BaseException:
+            # batches still being written would recreate a dropped staging collection
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if self.mode == "swap":
+                await target.drop()
+            raise
+        return self.stats
+
+    def _validate(self, row) -> Optional[dict]:
+        stats = self.stats
+        stats.read += 1
+        if isinstance(row, RowError):
+            return self._reject(f"line {row.line}: {row.message}")
+        sku = row.get(self.sku_field)
+        if sku in (None, ""):
+            return self._reject(f"row {stats.read}: missing {self.sku_field}")
+        sku = str(sku)
+        try:
+            # a placeholder id skips the model's uuid4 default; the real id comes from the SKU
+            product = self._validate_python({**row, "id": ""})
+        except ValidationError as e:
+            return self._reject(f"sku {sku}: {e.errors()[0]['loc'][0]}: {e.errors()[0]['msg']}")
+        if sku in self._seen:
+            stats.duplicates += 1
+            return None
+        self._seen.add(sku)
+        values = product.__dict__
+        document = {field: values[field] for field in self._fields}
+        document["sku"] = sku
+        return document
+
+    def _reject(self, message: str) -> None:
+        self.stats.invalid += 1
+        if len(self.stats.errors) < MAX_REPORTED_ERRORS:
+            self.stats.errors.append(message)
+
+    async def _write(self, batch: List[dict], target):
+        skus = [document["sku"] for document in batch]
+        existing = {
+            product["sku"]: product
+            async for product in self.db.products.find({"sku": {"$in": skus}}, {"_id": 0})
+        }
+        now = datetime.now(timezone.utc).isoformat()
+        inserted = updated = unchanged = 0
+        operations = []
+        for document in batch:
+            old = existing.get(document["sku"])
+            if old is None:
+                inserted += 1
+                changed = True
+            else:
+                changed = any(old.get(field) != document[field] for field in self._fields)
+                if changed:
+                    updated += 1
+                else:
+                    unchanged += 1
+
+            if self.mode == "upsert":
+                if old is None:
+                    operations.append(UpdateOne(
+                        {"sku": document["sku"]},
+                        {"$set": {**document, "updated_at": now},
+                         "$setOnInsert": {"id": product_id_for(document["sku"])}},
+                        upsert=True,
+                    ))
+                elif changed:
+                    operations.append(UpdateOne({"sku": document["sku"]}, {"$set": {**document, "updated_at": now}}))
+            else:
+                document["id"] = old["id"] if old else product_id_for(document["sku"])
+                document["updated_at"] = now if changed else old.get("updated_at", now)
+                if old and old.get("reserved_by"):
+                    document["reserved_by"] = old["reserved_by"]
+                operations.append(document)
+
+        if operations:
+            if self.mode == "upsert":
+                await target.bulk_write(operations, ordered=False)
+            else:
+                await target.insert_many(operations, ordered=False)
+
+        stats = self.stats
+        stats.inserted += inserted
+        stats.updated += updated
+        stats.unchanged += unchanged
+        stats.batches += 1
+        if self.on_batch:
+            self.on_batch(stats)
+
+    async def _prune(self, live):
+        stale = []
+        async for product in live.find({"sku": {"$type": "string"}}, {"_id": 0, "sku": 1}):
+            if product["sku"] not in self._seen:
+                stale.append(product["sku"])
+        for start in range(0, len(stale), self.batch_size):
+            result = await live.delete_many({"sku": {"$in": stale[start:start + self.batch_size]}})
+            self.stats.removed += result.deleted_count
@@ -0,0 +1,16 @@
+import uuid
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class Product(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str
+    price: float
+    image_url: str
+    category: str
+    stock: int
+    requires_prescription: bool = False
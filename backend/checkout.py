@@ -0,0 +1,151 @@
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from pymongo import UpdateOne
+
+from cart_pricing import resolve_cart_items
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, product_ids: List[str]):
+        super().__init__(f"Insufficient stock for products: {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+
+_transactions_supported = None
+
+
+async def supports_transactions(client) -> bool:
+    """Multi-document transactions need a replica set or a sharded cluster."""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await client.admin.command("hello")
+        _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+
+def _stock_lines(resolved_items: List[dict]) -> Dict[str, int]:
+    lines = {}
+    for item in resolved_items:
+        product_id = item['product']['id']
+        lines[product_id] = lines.get(product_id, 0) + item['quantity']
+    return lines
+
+
+async def _find_short_products(db, lines: Dict[str, int]) -> List[str]:
+    """Products whose committed stock is below their line's quantity."""
+    products = await db.products.find(
+        {"id": {"$in": list(lines)}}, {"_id": 0, "id": 1, "stock": 1}
+    ).to_list(len(lines))
+    stock = {product['id']: product.get('stock', 0) for product in products}
+    return [product_id for product_id, qty in lines.items() if stock.get(product_id, 0) < qty]
+
+
+async def _reserve_stock(db, lines: Dict[str, int], reservation: str = None, session=None) -> bool:
+    """Decrement stock for every line with one conditional bulk write.
+
+    Returns False when any line could not be reserved. Outside a transaction each
+    reserved product is tagged with ``reservation`` so it can be released precisely.
+    """
+    ops = []
+    updated_at = datetime.now(timezone.utc).isoformat()
+    for product_id, qty in lines.items():
+        update = {"$inc": {"stock": -qty}, "$set": {"updated_at": updated_at}}
+        if reservation:
+            update["$addToSet"] = {"reserved_by": reservation}
+        ops.append(UpdateOne({"id": product_id, "stock": {"$gte": qty}}, update))
+
+    result = await db.products.bulk_write(ops, ordered=False, session=session)
+    return result.modified_count == len(ops)
+
+
+async def _release_stock(db, lines: Dict[str, int], reservation: str):
+    updated_at = datetime.now(timezone.utc).isoformat()
+    ops = [
+        UpdateOne(
+            {"id": product_id, "reserved_by": reservation},
+            {"$inc": {"stock": qty}, "$pull": {"reserved_by": reservation}, "$set": {"updated_at": updated_at}}
+        )
+        for product_id, qty in lines.items()
+    ]
+    await db.products.bulk_write(ops, ordered=False)
+
+
+async def _place_order_in_transaction(client, db, user_id: str, make_order: Callable[[List[dict]], dict]) -> dict:
+    async def run(session):
+        cart = await db.carts.find_one({"user_id": user_id}, session=session)
+        if not cart or not cart['items']:
+            raise EmptyCartError()
+
+        resolved = await resolve_cart_items(db, cart['items'], session=session)
+        if not resolved:
+            raise EmptyCartError()
+
+        lines = _stock_lines(resolved)
+        if not await _reserve_stock(db, lines, session=session):
+            # outside the session, which sees the decrements of the lines that did reserve
+            raise InsufficientStockError(await _find_short_products(db, lines))
+
+        order = make_order(resolved)
+        await db.orders.insert_one(order, session=session)
+        await db.carts.delete_one({"_id": cart['_id']}, session=session)
+        return order
+
+    async with await client.start_session() as session:
+        return await session.with_transaction(run)
+
+
+async def _place_order_with_compensation(db, user_id: str, make_order: Callable[[List[dict]], dict]) -> dict:
+    # Claiming the cart first makes a double-submitted checkout fail fast
+    cart = await db.carts.find_one_and_delete({"user_id": user_id})
+    if not cart or not cart['items']:
+        raise EmptyCartError()
+
+    reserved = None
+    try:
+        resolved = await resolve_cart_items(db, cart['items'])
+        if not resolved:
+            raise EmptyCartError()
+
+        order = make_order(resolved)
+        lines = _stock_lines(resolved)
+        reserved = order['id']
+        if not await _reserve_stock(db, lines, reservation=reserved):
+            await _release_stock(db, lines, reserved)
+            reserved = None
+            raise InsufficientStockError(await _find_short_products(db, lines))
+
+        await db.orders.insert_one(order)
+    except BaseException:
+        if reserved:
+            await _release_stock(db, lines, reserved)
+        # Put the cart back unless the user has already started a new one
+        cart.pop('_id', None)
+        await db.carts.update_one({"user_id": user_id}, {"$setOnInsert": cart}, upsert=True)
+        raise
+
+    # filtering on the ids keeps this on the products' id index
+    await db.products.update_many(
+        {"id": {"$in": list(lines)}, "reserved_by": order['id']}, {"$pull": {"reserved_by": order['id']}}
+    )
+    return order
+
+
+async def place_order(client, db, user_id: str, make_order: Callable[[List[dict]], dict]) -> dict:
+    """Price the cart, reserve stock, insert the order and clear the cart as one unit.
+
+    ``make_order`` receives the resolved cart items and returns the order document
+    to insert. Uses a session transaction when the deployment supports one and a
+    compensating rollback otherwise.
+    """
+    if await supports_transactions(client):
+        return await _place_order_in_transaction(client, db, user_id, make_order)
+    return await _place_order_with_compensation(db, user_id, make_order)
@@ -0,0 +1,170 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "text/")
+# Never re-encode these: already encoded, partial content, or no body
+PASSTHROUGH_STATUSES = (204, 206, 304)
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        # sync-flush so streamed responses reach the client chunk by chunk
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class Compressor:
+    """Content-encoding negotiation and gzip/brotli encoders with tunable levels.
+
+    Brotli is used only when the ``brotli`` package is installed. Bodies smaller
+    than ``min_size`` are sent as they are.
+    """
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4, enabled: bool = True):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.enabled = enabled
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def choose(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """Pick the best supported encoding allowed by an Accept-Encoding header."""
+        if not self.enabled or not accept_encoding:
+            return None
+        weights = {}
+        for part in accept_encoding.lower().split(","):
+            name, _, params = part.strip().partition(";")
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            weights[name.strip()] = q
+        best = None
+        for encoding in self.encodings:
+            q = weights.get(encoding, weights.get("*", 0.0))
+            if q > 0 and (best is None or q > best[1]):
+                best = (encoding, q)
+        return best[0] if best else None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return _gzip(body, self.gzip_level)
+
+    def stream(self, encoding: str):
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses with the negotiated encoding.
+
+    Responses that already carry a Content-Encoding (such as precompressed
+    catalog bodies) pass through untouched; streamed responses are compressed
+    chunk by chunk.
+    """
+
+    def __init__(self, app, compressor: Compressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.compressor.choose(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.compressor))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding: str, compressor: Compressor):
+        self.send = send
+        self.encoding = encoding
+        self.compressor = compressor
+        self.start = None
+        self.stream = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is not None:
+            chunk = self.stream.compress(body) if more_body else self.stream.compress(body) + self.stream.finish()
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        if (self.start["status"] in PASSTHROUGH_STATUSES or "content-encoding" in headers
+                or not is_compressible(headers.get("content-type"))):
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        if "accept-encoding" not in headers.get("vary", "").lower():
+            headers.add_vary_header("Accept-Encoding")
+        if not more_body and len(body) < self.compressor.min_size:
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+        if more_body:
+            del headers["Content-Length"]
+            self.stream = self.compressor.stream(self.encoding)
+            body = self.stream.compress(body)
+        else:
+            body = self.compressor.compress(body, self.encoding)
+            headers["Content-Length"] = str(len(body))
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,77 @@
+import os
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import read_preferences
+
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+# The smallest staleness bound MongoDB accepts
+MIN_MAX_STALENESS_SECONDS = 90
+
+
+def read_preference(mode: str, max_staleness: int = -1):
+    """Build a read preference from its name, with an optional staleness bound in seconds."""
+    try:
+        preference = READ_PREFERENCES[mode]
+    except KeyError:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return preference()
+    if max_staleness != -1:
+        max_staleness = max(max_staleness, MIN_MAX_STALENESS_SECONDS)
+    return preference(max_staleness=max_staleness)
+
+
+class Database:
+    """The Motor client and the database handles routes read and write through.
+
+    ``db`` always targets the primary and is used for carts, checkout, auth and
+    every write. ``reads`` is the same database with a relaxed read preference
+    for uncached reads that tolerate bounded staleness: order history, reports
+    and exports. The catalog cache fills from ``db``, because what it caches is
+    served until the next invalidation.
+    """
+
+    def __init__(self, url: str, name: str, max_pool_size: int = 100, min_pool_size: int = 0,
+                 wait_queue_timeout_ms: Optional[int] = None, max_idle_time_ms: Optional[int] = None,
+                 read_preference_mode: str = "secondaryPreferred", max_staleness_seconds: int = -1,
+                 event_listeners: Optional[List] = None):
+        self.max_pool_size = max_pool_size
+        options = {"maxPoolSize": max_pool_size, "minPoolSize": min_pool_size}
+        if wait_queue_timeout_ms is not None:
+            options["waitQueueTimeoutMS"] = wait_queue_timeout_ms
+        if max_idle_time_ms is not None:
+            options["maxIdleTimeMS"] = max_idle_time_ms
+        self.client = AsyncIOMotorClient(url, event_listeners=event_listeners or [], **options)
+        self.db = self.client[name]
+        self.reads = self.client.get_database(
+            name, read_preference=read_preference(read_preference_mode, max_staleness_seconds)
+        )
+
+    @classmethod
+    def from_env(cls, event_listeners: Optional[List] = None) -> "Database":
+        def optional_int(name):
+            value = os.environ.get(name)
+            return int(value) if value else None
+
+        return cls(
+            os.environ['MONGO_URL'],
+            os.environ['DB_NAME'],
+            max_pool_size=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+            min_pool_size=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+            wait_queue_timeout_ms=optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+            max_idle_time_ms=optional_int('MONGO_MAX_IDLE_TIME_MS'),
+            read_preference_mode=os.environ.get('MONGO_READ_PREFERENCE', 'secondaryPreferred'),
+            max_staleness_seconds=int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '90')),
+            event_listeners=event_listeners,
+        )
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+from contextlib import aclosing
+from datetime import date, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List, Optional
+
+from responses import dumps
+
+BATCH_SIZE = 1000
+
+# Columns exported by default, in order, and the heavy ones that must be asked for
+EXPORTS = {
+    "orders": {
+        "fields": ["id", "user_id", "status", "payment_method", "upi_id", "total_amount", "products",
+                   "delivery_address", "phone", "prescription_id", "created_at"],
+        "optional": ["prescription_data"],
+    },
+    "contacts": {
+        "fields": ["id", "name", "email", "phone", "message", "created_at"],
+        "optional": [],
+    },
+}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def export_fields(collection: str, include: Optional[str] = None) -> List[str]:
+    """The default columns of ``collection`` plus the optional ones named in ``include`` (comma-separated)."""
+    spec = EXPORTS[collection]
+    fields = list(spec["fields"])
+    for name in filter(None, (part.strip() for part in (include or "").split(","))):
+        if name not in spec["optional"]:
+            raise ValueError(f"Unknown optional field for {collection}: {name}")
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def export_query(start: Optional[date] = None, end: Optional[date] = None) -> dict:
+    """Filter on the UTC day of ``created_at``, both ends inclusive."""
+    if start and end and start > end:
+        raise ValueError("start must not be after end")
+    created_at = {}
+    if start:
+        created_at["$gte"] = start.isoformat()
+    if end:
+        # created_at is an isoformat string, so everything on ``end`` sorts before the next day
+        created_at["$lt"] = (end + timedelta(days=1)).isoformat()
+    return {"created_at": created_at} if created_at else {}
+
+
+async def export_documents(db, collection: str, query: dict, fields: List[str],
+                           batch_size: int = BATCH_SIZE) -> AsyncIterator[dict]:
+    """Every matching document, fetched ``batch_size`` at a time through one server-side cursor."""
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    cursor = db[collection].find(query, projection, batch_size=batch_size)
+    try:
+        async for document in cursor:
+            yield document
+    finally:
+        # an abandoned download must not leave the cursor open on the server
+        await cursor.close()
+
+
+def _ndjson(documents: Iterable[dict], fields: List[str]) -> bytes:
+    return b"".join(dumps({field: document[field] for field in fields if field in document}) + b"\n"
+                    for document in documents)
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return str(value)
+
+
+def _csv(rows: Iterable[Iterable[str]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _encode(batch: List[dict], fields: List[str], fmt: str) -> bytes:
+    if fmt == "csv":
+        return _csv([_cell(document.get(field)) for field in fields] for document in batch)
+    return _ndjson(batch, fields)
+
+
+async def export_stream(db, collection: str, fields: List[str], query: dict, fmt: str = "ndjson",
+                        batch_size: int = BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encode the export one batch at a time, so memory does not grow with the number of documents.
+
+    CSV cells holding lists or objects (order lines) are JSON-encoded.
+    """
+    if fmt == "csv":
+        yield _csv([fields])
+    batch = []
+    async with aclosing(export_documents(db, collection, query, fields, batch_size)) as documents:
+        async for document in documents:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield _encode(batch, fields, fmt)
+                batch = []
+    if batch:
+        yield _encode(batch, fields, fmt)
+
+
+async def _main(collection: str, fmt: str, start: Optional[date], end: Optional[date], include: Optional[str],
+                output: Optional[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    try:
+        fields = export_fields(collection, include)
+        query = export_query(start, end)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    out = open(output, "wb") if output else sys.stdout.buffer
+    try:
+        async for chunk in export_stream(db, collection, fields, query, fmt):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+        client.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export orders or contact messages as NDJSON or CSV")
+    parser.add_argument("collection", choices=sorted(EXPORTS))
+    parser.add_argument("--format", dest="fmt", choices=sorted(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day to export, YYYY-MM-DD (UTC)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day to export, YYYY-MM-DD (UTC)")
+    parser.add_argument("--include", help="optional heavy fields to add, comma-separated (orders: prescription_data)")
+    parser.add_argument("--output", "-o", help="file to write (default: stdout)")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.collection, args.fmt, args.start, args.end, args.include, args.output)))
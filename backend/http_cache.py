@@ -0,0 +1,192 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlencode
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from compression import Compressor
+from single_flight import SingleFlight
+
+# Cache-Control per catalog route. Stock changes with every order, so listings and
+# product pages are only fresh briefly but may be served stale while the browser
+# revalidates; categories change rarely.
+CACHE_POLICIES = {
+    "products": "public, max-age=30, stale-while-revalidate=120",
+    "product": "public, max-age=30, stale-while-revalidate=120",
+    "categories": "public, max-age=300, stale-while-revalidate=3600",
+}
+
+# Headers of the original response that are kept with the cached body
+CACHED_HEADERS = ("x-next-cursor",)
+
+
+def cache_key(route: str, params: Dict[str, object]) -> str:
+    """Normalize query parameters (defaults dropped, sorted) into a cache key."""
+    query = urlencode(sorted((name, value) for name, value in params.items() if value is not None))
+    return f"{route}?{query}"
+
+
+def make_etag(body: bytes) -> str:
+    # weak, so the gzip and brotli variants of a body share it
+    return 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of ``etag`` against an If-None-Match header value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "media_type", "headers", "version", "expires", "encoded")
+
+    def __init__(self, body: bytes, media_type: str, headers: Dict[str, str], version: int, expires: float):
+        self.body = body
+        self.etag = make_etag(body)
+        self.media_type = media_type
+        self.headers = headers
+        self.version = version
+        self.expires = expires
+        self.encoded: Dict[str, bytes] = {}
+
+    def variant(self, encoding: str, compressor: Compressor) -> bytes:
+        """The body in ``encoding``, compressed on first use and kept with the entry."""
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = compressor.compress(self.body, encoding)
+        return body
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+
+class ResponseCache:
+    """Shared cache of rendered catalog responses with ETag validation.
+
+    Bodies are keyed by route and normalized query and tagged with the version
+    of the catalog data they were rendered from (a product's own version for
+    product pages, the listing version for listings), so a change to that data
+    retires them. A request whose ``If-None-Match`` matches a cached entry gets
+    a 304 without the handler (or Mongo) running. With a ``compressor``, each
+    entry also keeps its gzip/brotli encodings so a body is compressed once per
+    version rather than on every request. An entry lives for ``ttl``, or for the
+    ``ttl`` passed to ``respond`` when its version ignores some changes (stock
+    in listings). Concurrent misses for one key and version render it once.
+    When disabled, responses are still rendered and tagged with a content
+    hash, which saves bandwidth but not the lookup.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300, enabled: bool = True,
+                 compressor: Optional[Compressor] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.compressor = compressor
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._flights = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    async def respond(self, request: Request, key: str, policy: str, version: int,
+                      build: Callable[[], Awaitable[Response]], ttl: Optional[float] = None) -> Response:
+        """Serve ``key`` from the cache, rendering it with ``build()`` on a miss."""
+        entry = self._get(key, version)
+        if entry is None:
+            self.misses += 1
+            entry = await self._flights.do((key, version), lambda: self._render(key, version, build, ttl))
+            if not isinstance(entry, CachedResponse):
+                return entry
+        else:
+            self.hits += 1
+
+        headers = {"ETag": entry.etag, "Cache-Control": policy}
+        if self.compressor is not None:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        headers.update(entry.headers)
+
+        body = entry.body
+        if self.compressor is not None and len(body) >= self.compressor.min_size:
+            encoding = self.compressor.choose(request.headers.get("accept-encoding"))
+            if encoding is not None:
+                fresh = encoding not in entry.encoded
+                body = entry.variant(encoding, self.compressor)
+                headers["Content-Encoding"] = encoding
+                if fresh and self._entries.get(key) is entry:
+                    self._bytes += len(body)
+                    self._evict()
+        return Response(body, media_type=entry.media_type, headers=headers)
+
+    async def _render(self, key: str, version: int, build: Callable[[], Awaitable[Response]],
+                      ttl: Optional[float] = None):
+        response = await build()
+        if response.status_code != 200:
+            return response
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        entry = CachedResponse(response.body, response.media_type, headers, version, expires)
+        if self.enabled:
+            self._put(key, entry)
+        return entry
+
+    def _get(self, key: str, version: int) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.version != version or entry.expires <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            **{f"flights_{name}": value for name, value in self._flights.stats().items()},
+        }
@@ -0,0 +1,311 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+
+from single_flight import SingleFlight
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+MAX_DIMENSION = 2048
+THUMBNAIL_SIZE = (320, 320)
+QUALITY = 80
+THUMBNAIL_QUALITY = 70
+# Larger images are refused rather than decoded (a 5MB upload can unpack to gigabytes)
+MAX_PIXELS = 50_000_000
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+WORKERS = 2
+PROCESSABLE_TYPES = {"image/jpeg", "image/png", "image/webp"}
+VARIANTS = ("display", "thumbnail")
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def output_format(preferred: str = "WEBP") -> str:
+    """``preferred`` if this Pillow build can write it, else JPEG."""
+    if preferred == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return preferred
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    output = io.BytesIO()
+    # nothing from the original's metadata is passed on, so EXIF (GPS, device) is dropped
+    image.save(output, fmt, quality=quality, **({"method": 4} if fmt == "WEBP" else {"optimize": True}))
+    return output.getvalue()
+
+
+def normalize(data: bytes, max_dimension: int = MAX_DIMENSION, thumbnail_size: Tuple[int, int] = THUMBNAIL_SIZE,
+              fmt: str = "WEBP", quality: int = QUALITY, thumbnail_quality: int = THUMBNAIL_QUALITY) -> dict:
+    """Decode an uploaded photo, orient it upright, cap its size and re-encode it plus a thumbnail.
+
+    CPU-bound: runs in the pipeline's worker processes, never on the event loop.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in ("JPEG", "PNG", "WEBP"):
+                raise InvalidImage(f"Unsupported image format: {image.format}")
+            # lets the JPEG decoder scale down while decoding
+            image.draft("RGB", (max_dimension, max_dimension))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, "white")
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                image = image.convert("RGB")
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            display = _encode(image, fmt, quality)
+            image.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+            thumbnail = _encode(image, fmt, thumbnail_quality)
+    except InvalidImage:
+        raise
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise InvalidImage("Image is too large to process")
+    except (OSError, ValueError, SyntaxError) as e:
+        raise InvalidImage("Image could not be decoded") from e
+    return {"display": display, "thumbnail": thumbnail}
+
+
+def _worker_init():
+    import warnings
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    # past MAX_PIXELS Pillow only warns; past twice that it raises
+    warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+
+class ImageCache:
+    """Processed images on disk under ``root/<hash[:2]>/<hash>.<variant>.<ext>``, at most ``max_bytes`` in total.
+
+    Entries are keyed by the SHA-256 of the original upload (plus the pipeline
+    settings), so the same photo is processed once however many orders use it.
+    The least recently used files are deleted once the cache is over its size;
+    a use touches the file, so the order survives restarts. Each process
+    enforces the limit on the files it knows of.
+    """
+
+    def __init__(self, root: str, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        # get/put run on worker threads
+        self._lock = threading.Lock()
+        self.size = 0
+        self.evictions = 0
+
+    def load(self):
+        """Index the files already in the cache, oldest use first; blocking."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.root.glob("*/*"):
+            if path.name.startswith("."):
+                path.unlink(missing_ok=True)  # a write cut short
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, path, stat.st_size))
+        with self._lock:
+            for _, path, size in sorted(files):
+                self._entries[path] = size
+                self.size += size
+            self._evict()
+
+    def path(self, key: str, variant: str, ext: str) -> Path:
+        return self.root / key[:2] / f"{key}.{variant}.{ext}"
+
+    def get(self, path: Path) -> Optional[bytes]:
+        """Blocking; run in a thread."""
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted, possibly by another worker process sharing the directory
+            with self._lock:
+                self._forget(path)
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                self._entries[path] = len(data)
+                self.size += len(data)
+        return data
+
+    def put(self, path: Path, data: bytes):
+        """Blocking; run in a thread."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.parent / f".{uuid.uuid4().hex}"
+        temp.write_bytes(data)
+        os.replace(temp, path)
+        with self._lock:
+            self._forget(path)
+            self._entries[path] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def _forget(self, path: Path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self.size -= size
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            path.unlink(missing_ok=True)
+
+
+class ImagePipeline:
+    """Normalizes uploaded prescription photos in a pool of worker processes.
+
+    ``process`` returns the downscaled, re-encoded image and its thumbnail for
+    a JPEG, PNG or WebP upload, from the disk cache when it was processed
+    before. Decoding and encoding happen only in the worker processes, and
+    hashing and file I/O on threads, so the event loop never waits on them. Concurrent requests for the same
+    upload share one run. Without Pillow the pipeline is disabled and
+    ``process`` returns None.
+    """
+
+    def __init__(self, cache_dir: str, cache_max_bytes: int = CACHE_MAX_BYTES, workers: int = WORKERS,
+                 max_dimension: int = MAX_DIMENSION, thumbnail_size: Tuple[int, int] = THUMBNAIL_SIZE,
+                 fmt: str = "WEBP", quality: int = QUALITY, enabled: bool = True):
+        self.enabled = enabled and Image is not None
+        self.cache = ImageCache(cache_dir, cache_max_bytes)
+        self.workers = workers
+        self.options = {"max_dimension": max_dimension, "thumbnail_size": tuple(thumbnail_size), "quality": quality,
+                        "fmt": output_format(fmt) if self.enabled else fmt}
+        self.ext = EXTENSIONS[self.options["fmt"]]
+        self.content_type = CONTENT_TYPES[self.ext]
+        # changing a setting changes every key, so stale outputs are never served
+        self._settings = hashlib.sha256(repr(sorted(self.options.items())).encode()).hexdigest()[:8]
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._flights = SingleFlight()
+        # uploads waiting for a worker, bounded so a burst cannot pile up unbounded image bytes
+        self._slots = asyncio.Semaphore(workers * 2)
+
+        self.processed = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def start(self):
+        if not self.enabled or self._pool is not None:
+            return
+        await asyncio.to_thread(self.cache.load)
+        self._pool = self._new_pool()
+
+    async def stop(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            # waits for the images being processed, so not on the event loop
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the server process has Motor's threads and an event loop that must not be copied
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_worker_init)
+
+    def key(self, digest: str) -> str:
+        return f"{digest}-{self._settings}"
+
+    async def process(self, data: bytes, content_type: str, digest: Optional[str] = None) -> Optional[dict]:
+        """``{"key", "content_type", "display", "thumbnail"}`` for an image upload, or None when the
+        pipeline is off or the upload is not an image it handles. Raises InvalidImage for corrupt images."""
+        if not self.enabled or content_type not in PROCESSABLE_TYPES:
+            return None
+        if digest is None:
+            digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+
+        async def load():
+            return data
+        return await self.process_stored(digest, content_type, load)
+
+    async def process_stored(self, digest: str, content_type: str,
+                             load: Callable[[], Awaitable[bytes]]) -> Optional[dict]:
+        """Like ``process`` for an upload known by its SHA-256, loaded with ``load()`` only on a cache miss."""
+        if not self.enabled or content_type not in PROCESSABLE_TYPES:
+            return None
+        key = self.key(digest)
+        variants = await self._flights.do(key, lambda: self._process(key, load))
+        return {"key": key, "content_type": self.content_type, **variants}
+
+    async def _process(self, key: str, load: Callable[[], Awaitable[bytes]]) -> dict:
+        cached = await self.read(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        data = await load()
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            pool = self._pool
+            try:
+                variants = await loop.run_in_executor(pool, _normalize_with, data, self.options)
+            except InvalidImage:
+                self.failures += 1
+                raise
+            except BrokenProcessPool:
+                # a worker died (killed, out of memory) and took the pool with it; the
+                # caller may retry, and later uploads get a new pool
+                self.failures += 1
+                if self._pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._new_pool()
+                raise
+        await asyncio.to_thread(self._store, key, variants)
+        self.processed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += sum(len(variants[variant]) for variant in VARIANTS)
+        return variants
+
+    def _store(self, key: str, variants: dict):
+        for variant in VARIANTS:
+            self.cache.put(self.cache.path(key, variant, self.ext), variants[variant])
+
+    async def read(self, key: str) -> Optional[dict]:
+        """Both variants of an earlier ``process`` result, if they are still cached."""
+        def read_all():
+            variants = {}
+            for variant in VARIANTS:
+                data = self.cache.get(self.cache.path(key, variant, self.ext))
+                if data is None:
+                    return None
+                variants[variant] = data
+            return variants
+        return await asyncio.to_thread(read_all)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "processed": self.processed,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "cache_bytes": self.cache.size,
+            "cache_evictions": self.cache.evictions,
+            **{f"flights_{name}": value for name, value in self._flights.stats().items()},
+        }
+
+
+def _normalize_with(data: bytes, options: dict) -> dict:
+    return normalize(data, **options)
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+# Every index the API's hot query paths rely on, keyed by collection
+INDEXES = {
+    "users": [
+        {"name": "email_unique", "keys": [("email", ASCENDING)], "unique": True},
+        {"name": "id_unique", "keys": [("id", ASCENDING)], "unique": True},
+    ],
+    "products": [
+        {"name": "id_unique", "keys": [("id", ASCENDING)], "unique": True},
+        {"name": "name_id", "keys": [("name", ASCENDING), ("id", ASCENDING)], "unique": False},
+        {"name": "category_name_id", "keys": [("category", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)], "unique": False},
+        # Distributor SKU, the upsert key for catalog imports; hand-added products have none
+        {"name": "sku_unique", "keys": [("sku", ASCENDING)], "unique": True,
+         "partial_filter": {"sku": {"$type": "string"}}},
+    ],
+    "carts": [
+        {"name": "user_id_unique", "keys": [("user_id", ASCENDING)], "unique": True},
+    ],
+    "prescriptions": [
+        {"name": "id_user_id_unique", "keys": [("id", ASCENDING), ("user_id", ASCENDING)], "unique": True},
+    ],
+    "revoked_tokens": [
+        {"name": "expires_at_ttl", "keys": [("expires_at", ASCENDING)], "unique": False, "expire_after_seconds": 0},
+    ],
+    "rate_limits": [
+        {"name": "expires_at_ttl", "keys": [("expires_at", ASCENDING)], "unique": False, "expire_after_seconds": 0},
+    ],
+    "orders": [
+        {"name": "id_unique", "keys": [("id", ASCENDING)], "unique": True},
+        {"name": "user_id_created_at_id", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], "unique": False},
+        # Only orders still waiting for the sales rollup sweep
+        {"name": "rolled_up_pending", "keys": [("created_at", ASCENDING)], "unique": False,
+         "partial_filter": {"rolled_up": False}},
+        # Orders claimed for the rollups without a transaction and not finished yet
+        {"name": "rolled_up_rolling", "keys": [("rollup_claimed_at", ASCENDING)], "unique": False,
+         "partial_filter": {"rolled_up": "rolling"}},
+        # Prescription orders by review status, for the review sweep and the pharmacist's list
+        {"name": "prescription_status_created_at", "keys": [("status", ASCENDING), ("created_at", ASCENDING)], "unique": False,
+         "partial_filter": {"requires_prescription": True}},
+    ],
+    "jobs": [
+        {"name": "queue_state_priority_available_at", "keys": [("queue", ASCENDING), ("state", ASCENDING), ("priority", DESCENDING), ("available_at", ASCENDING)], "unique": False},
+        {"name": "queue_key_unique", "keys": [("queue", ASCENDING), ("key", ASCENDING)], "unique": True,
+         "partial_filter": {"key": {"$type": "string"}}},
+        # Finished jobs are kept a week; dead-lettered ones until someone deals with them
+        {"name": "done_expiry", "keys": [("finished_at", ASCENDING)], "unique": False, "expire_after_seconds": 7 * 86400,
+         "partial_filter": {"state": "done"}},
+    ],
+    "sales_by_product": [
+        {"name": "day_category_product_unique", "keys": [("day", ASCENDING), ("category", ASCENDING), ("product_id", ASCENDING)], "unique": True},
+    ],
+    "sales_by_day": [
+        {"name": "day_unique", "keys": [("day", ASCENDING)], "unique": True},
+    ],
+}
+
+# The queries each route issues, used by --check to explain their plans
+ROUTE_QUERIES = [
+    {"route": "POST /api/auth/register, POST /api/auth/login", "collection": "users", "filter": {"email": ""}},
+    {"route": "get_current_user", "collection": "users", "filter": {"id": ""}},
+    {"route": "GET /api/products/{product_id}, cart pricing", "collection": "products", "filter": {"id": ""}},
+    {"route": "GET /api/products", "collection": "products", "filter": {}, "sort": {"name": 1, "id": 1}},
+    {"route": "GET /api/products?category=", "collection": "products", "filter": {"category": ""}, "sort": {"name": 1, "id": 1}},
+    {"route": "GET /api/cart, cart mutations, checkout", "collection": "carts", "filter": {"user_id": ""}},
+    {"route": "GET /api/orders", "collection": "orders", "filter": {"user_id": ""}, "sort": {"created_at": -1, "id": -1}},
+    {"route": "GET /api/orders/{order_id}", "collection": "orders", "filter": {"id": "", "user_id": ""}},
+    {"route": "prescription review job, GET /api/admin/prescription-reviews/{order_id}/{variant}",
+     "collection": "orders", "filter": {"id": ""}},
+    {"route": "prescription review job, POST /api/admin/prescription-reviews/{order_id}",
+     "collection": "orders", "filter": {"id": "", "status": ""}},
+    {"route": "POST /api/orders (sales rollups), rollup sweep", "collection": "orders", "filter": {"id": "", "rolled_up": False}},
+    {"route": "GET /api/prescriptions/{prescription_id}", "collection": "prescriptions", "filter": {"id": "", "user_id": ""}},
+]
+
+
+async def check_indexes(db) -> Dict[str, List[str]]:
+    """Compare the declared indexes with the ones that exist.
+
+    Returns ``{"missing": [...], "drifted": [...]}`` with ``collection.index_name`` entries.
+    An index is drifted when it exists under the declared name with different keys or options.
+    """
+    report = {"missing": [], "drifted": []}
+    for collection, specs in INDEXES.items():
+        existing = await db[collection].index_information()
+        for spec in specs:
+            label = f"{collection}.{spec['name']}"
+            current = existing.get(spec["name"])
+            if current is None:
+                report["missing"].append(label)
+            elif ([tuple(k) for k in current["key"]] != list(spec["keys"])
+                  or current.get("unique", False) != spec["unique"]
+                  or current.get("expireAfterSeconds") != spec.get("expire_after_seconds")
+                  or current.get("partialFilterExpression") != spec.get("partial_filter")):
+                report["drifted"].append(label)
+    return report
+
+
+def _index_options(spec: dict) -> dict:
+    options = {"name": spec["name"], "unique": spec["unique"]}
+    if "expire_after_seconds" in spec:
+        options["expireAfterSeconds"] = spec["expire_after_seconds"]
+    if "partial_filter" in spec:
+        options["partialFilterExpression"] = spec["partial_filter"]
+    return options
+
+
+async def create_indexes(collection, name: str):
+    """Build the indexes declared for ``name`` on ``collection``, e.g. a staging copy about to replace it."""
+    for spec in INDEXES[name]:
+        await collection.create_index(spec["keys"], **_index_options(spec))
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create any missing declared index. Safe to run on every startup.
+
+    Indexes that cannot be built (drifted definitions, duplicate keys in existing
+    data) are logged and reported rather than failing startup.
+    """
+    report = await check_indexes(db)
+    failed = []
+    for collection, specs in INDEXES.items():
+        for spec in specs:
+            label = f"{collection}.{spec['name']}"
+            if label not in report["missing"]:
+                continue
+            try:
+                await db[collection].create_index(spec["keys"], **_index_options(spec))
+            except OperationFailure as e:
+                failed.append(label)
+                logger.warning("Could not build index %s: %s", label, e)
+
+    for label in report["drifted"]:
+        logger.warning("Index %s differs from its declaration; drop it to let startup rebuild it", label)
+    if report["missing"]:
+        logger.info("Built indexes: %s", ", ".join(l for l in report["missing"] if l not in failed) or "none")
+    return {"built": [l for l in report["missing"] if l not in failed], "failed": failed, "drifted": report["drifted"]}
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = []
+    while plan:
+        if "queryPlan" in plan:
+            plan = plan["queryPlan"]
+        stage = plan.get("stage")
+        if stage:
+            label = stage
+            if plan.get("indexName"):
+                label += f"({plan['indexName']})"
+            stages.append(label)
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            plan = plan["inputStages"][0]
+        else:
+            break
+    return stages
+
+
+async def explain_route_queries(db) -> List[dict]:
+    results = []
+    for query in ROUTE_QUERIES:
+        command = {"find": query["collection"], "filter": query["filter"]}
+        if "sort" in query:
+            command["sort"] = query["sort"]
+        explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        stages = _plan_stages(explained["queryPlanner"]["winningPlan"])
+        results.append({**query, "stages": stages, "collection_scan": "COLLSCAN" in stages})
+    return results
+
+
+async def _main(check_only: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if check_only:
+        report = await check_indexes(db)
+    else:
+        result = await ensure_indexes(db)
+        print(f"Built: {', '.join(result['built']) or 'none'}")
+        report = {"missing": result["failed"], "drifted": result["drifted"]}
+
+    print(f"Missing: {', '.join(report['missing']) or 'none'}")
+    print(f"Drifted: {', '.join(report['drifted']) or 'none'}")
+
+    scans = 0
+    for result in await explain_route_queries(db):
+        scans += result["collection_scan"]
+        marker = "COLLSCAN" if result["collection_scan"] else "ok"
+        print(f"[{marker:>8}] {result['route']}: {result['collection']} -> {' <- '.join(result['stages'])}")
+
+    client.close()
+    return 1 if report["missing"] or report["drifted"] or scans else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the API's MongoDB indexes and explain route query plans")
+    parser.add_argument("--check", action="store_true", help="only report missing/drifted indexes and query plans")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.check)))
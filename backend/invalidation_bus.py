@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Datagrams stay well below the default Unix socket buffer; bigger payloads are
+# replaced by None, which subscribers treat as "everything changed"
+MAX_MESSAGE_BYTES = 32 * 1024
+SOCKET_SUFFIX = ".sock"
+
+
+class InvalidationBus:
+    """Broadcast cache invalidations between the worker processes on one host.
+
+    Every worker binds a Unix datagram socket in a shared ``directory``;
+    publishing sends the message to every other socket found there, so there is
+    no broker process to keep alive and a restarted worker rejoins by binding a
+    new socket. Delivery is best effort: a message to a worker whose receive
+    buffer is full is dropped and counted, and the worker's own invalidation
+    feed and TTLs bound how long it can stay stale.
+
+    Without a directory (single-process serving) the bus does nothing.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+        self._handlers: Dict[str, List[Callable[[Any], None]]] = {}
+
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls) -> "InvalidationBus":
+        return cls(os.environ.get('INVALIDATION_BUS_DIR') or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def subscribe(self, topic: str, handler: Callable[[Any], None]):
+        """Call ``handler(data)`` for every message other workers publish on ``topic``."""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    async def start(self):
+        if not self.enabled or self._sock is not None:
+            return
+        self.path = os.path.join(self.directory, f"worker-{os.getpid()}{SOCKET_SUFFIX}")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.bind(self.path)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._drain)
+        logger.info("Invalidation bus listening on %s", self.path)
+
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        except RuntimeError:
+            pass
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, topic: str, data: Any = None):
+        """Send ``data`` to the ``topic`` subscribers of every other worker."""
+        if self._sock is None:
+            return
+        message = json.dumps({"topic": topic, "data": data}).encode()
+        if len(message) > MAX_MESSAGE_BYTES:
+            message = json.dumps({"topic": topic, "data": None}).encode()
+
+        self.published += 1
+        for peer in self._peers():
+            try:
+                self._sock.sendto(message, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # the worker behind this socket is gone
+                try:
+                    os.unlink(peer)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                self.dropped += 1
+                logger.warning("Invalidation bus: %s is not keeping up, dropped a %s message", peer, topic)
+
+    def _peers(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names
+                if name.endswith(SOCKET_SUFFIX) and os.path.join(self.directory, name) != self.path]
+
+    def _drain(self):
+        while True:
+            try:
+                message = self._sock.recv(MAX_MESSAGE_BYTES)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.received += 1
+            try:
+                message = json.loads(message)
+                handlers = self._handlers.get(message["topic"], [])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Invalidation bus: ignoring a malformed message")
+                continue
+            for handler in handlers:
+                try:
+                    handler(message["data"])
+                except Exception:
+                    logger.exception("Invalidation bus handler for %s failed", message["topic"])
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "peers": len(self._peers()) if self._sock is not None else 0,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,370 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import random
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+VISIBILITY_TIMEOUT = 60.0
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 600.0
+POLL_INTERVAL = 1.0
+DEPTH_INTERVAL = 15.0
+
+# Job states. A leased job stays PENDING; its available_at is the end of its lease.
+PENDING = "pending"
+DONE = "done"
+DEAD = "dead"
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for a job that will never succeed; it is dead-lettered without retries."""
+
+
+def backoff(attempts: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """Exponential delay before retry number ``attempts``, with jitter so failed jobs do not retry in step."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobStore(ABC):
+    """Durable job queue.
+
+    Jobs are leased one at a time: a lease hides the job for ``visibility_timeout``
+    seconds and counts an attempt. A worker that finishes in time completes or
+    fails the job under its lease; if it dies instead, the lease runs out and the
+    job is handed to another worker. A job whose attempts are used up is
+    dead-lettered: kept with state ``dead`` and its last error, and never leased again.
+    Among available jobs the highest priority goes first, then the longest waiting.
+    """
+
+    @abstractmethod
+    async def enqueue(self, queue: str, payload: dict, priority: int = 0, key: Optional[str] = None,
+                      max_attempts: int = MAX_ATTEMPTS, delay: float = 0.0) -> dict:
+        """Add a job; with ``key``, a second job with the same key in ``queue`` is not added."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def lease(self, queue: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(self, job: dict) -> bool:
+        """Mark a leased job done; False if its lease ran out and it went to another worker."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fail(self, job: dict, error: str, retry_delay: Optional[float] = None) -> Optional[str]:
+        """Retry a leased job after ``retry_delay`` seconds, or dead-letter it when it is out of
+        attempts or ``retry_delay`` is None. Returns the new state, or None if the lease was lost."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def depth(self, queue: str) -> Dict[str, int]:
+        """Jobs ``ready`` to lease, ``leased``, ``delayed`` for a retry, and ``dead``."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _new_job(queue, payload, priority, key, max_attempts, delay) -> dict:
+        now = _now()
+        job = {
+            "_id": ObjectId(), "queue": queue, "payload": payload, "priority": priority,
+            "state": PENDING, "attempts": 0, "max_attempts": max_attempts,
+            "available_at": now + timedelta(seconds=delay), "lease": None,
+            "enqueued_at": now, "finished_at": None, "last_error": None,
+        }
+        if key is not None:
+            job["key"] = key
+        return job
+
+    @staticmethod
+    def _failure(job: dict, error: str, retry_delay: Optional[float]) -> dict:
+        now = _now()
+        if retry_delay is None or job["attempts"] >= job["max_attempts"]:
+            return {"state": DEAD, "lease": None, "finished_at": now, "last_error": error}
+        return {"lease": None, "available_at": now + timedelta(seconds=retry_delay), "last_error": error}
+
+
+class MongoJobStore(JobStore):
+    """Jobs in one collection, leased with an atomic ``find_one_and_update``."""
+
+    def __init__(self, db, collection: str = "jobs"):
+        self.jobs = db[collection]
+
+    async def enqueue(self, queue, payload, priority=0, key=None, max_attempts=MAX_ATTEMPTS, delay=0.0):
+        job = self._new_job(queue, payload, priority, key, max_attempts, delay)
+        if key is None:
+            await self.jobs.insert_one(job)
+            return job
+        return await self.jobs.find_one_and_update(
+            {"queue": queue, "key": key}, {"$setOnInsert": job}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+    async def lease(self, queue, visibility_timeout=VISIBILITY_TIMEOUT):
+        while True:
+            now = _now()
+            job = await self.jobs.find_one_and_update(
+                {"queue": queue, "state": PENDING, "available_at": {"$lte": now}},
+                {"$set": {"lease": secrets.token_hex(8), "available_at": now + timedelta(seconds=visibility_timeout)},
+                 "$inc": {"attempts": 1}},
+                sort=[("priority", -1), ("available_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None or job["attempts"] <= job["max_attempts"]:
+                return job
+            # every lease so far ran out: the job keeps killing or stalling its workers
+            await self.jobs.update_one({"_id": job["_id"], "lease": job["lease"]}, {"$set": self._failure(
+                job, job["last_error"] or "Lease expired on every attempt", None)})
+
+    async def complete(self, job):
+        result = await self.jobs.update_one(
+            {"_id": job["_id"], "lease": job["lease"]},
+            {"$set": {"state": DONE, "lease": None, "finished_at": _now()}},
+        )
+        return result.modified_count == 1
+
+    async def fail(self, job, error, retry_delay=None):
+        update = self._failure(job, error, retry_delay)
+        result = await self.jobs.update_one({"_id": job["_id"], "lease": job["lease"]}, {"$set": update})
+        if not result.modified_count:
+            return None
+        return update.get("state", PENDING)
+
+    async def depth(self, queue):
+        now = _now()
+        pending = {"queue": queue, "state": PENDING}
+        return {
+            "ready": await self.jobs.count_documents({**pending, "available_at": {"$lte": now}}),
+            "leased": await self.jobs.count_documents({**pending, "lease": {"$ne": None}, "available_at": {"$gt": now}}),
+            "delayed": await self.jobs.count_documents({**pending, "lease": None, "available_at": {"$gt": now}}),
+            "dead": await self.jobs.count_documents({"queue": queue, "state": DEAD}),
+        }
+
+
+class MemoryJobStore(JobStore):
+    """The same queue held in this process, for tests and single-process development."""
+
+    def __init__(self):
+        self._jobs: List[dict] = []
+
+    async def enqueue(self, queue, payload, priority=0, key=None, max_attempts=MAX_ATTEMPTS, delay=0.0):
+        if key is not None:
+            for job in self._jobs:
+                if job["queue"] == queue and job.get("key") == key:
+                    return dict(job)
+        job = self._new_job(queue, payload, priority, key, max_attempts, delay)
+        self._jobs.append(job)
+        return dict(job)
+
+    async def lease(self, queue, visibility_timeout=VISIBILITY_TIMEOUT):
+        while True:
+            now = _now()
+            available = [job for job in self._jobs
+                         if job["queue"] == queue and job["state"] == PENDING and job["available_at"] <= now]
+            if not available:
+                return None
+            job = min(available, key=lambda job: (-job["priority"], job["available_at"]))
+            job.update(lease=secrets.token_hex(8), available_at=now + timedelta(seconds=visibility_timeout),
+                       attempts=job["attempts"] + 1)
+            if job["attempts"] <= job["max_attempts"]:
+                return dict(job)
+            job.update(self._failure(job, job["last_error"] or "Lease expired on every attempt", None))
+
+    def _leased(self, job: dict) -> Optional[dict]:
+        for stored in self._jobs:
+            if stored["_id"] == job["_id"]:
+                return stored if stored["lease"] == job["lease"] else None
+        return None
+
+    async def complete(self, job):
+        stored = self._leased(job)
+        if stored is None:
+            return False
+        stored.update(state=DONE, lease=None, finished_at=_now())
+        return True
+
+    async def fail(self, job, error, retry_delay=None):
+        stored = self._leased(job)
+        if stored is None:
+            return None
+        update = self._failure(stored, error, retry_delay)
+        stored.update(update)
+        return update.get("state", PENDING)
+
+    async def depth(self, queue):
+        now = _now()
+        depth = {"ready": 0, "leased": 0, "delayed": 0, "dead": 0}
+        for job in self._jobs:
+            if job["queue"] != queue:
+                continue
+            if job["state"] == DEAD:
+                depth["dead"] += 1
+            elif job["state"] == PENDING:
+                if job["available_at"] <= now:
+                    depth["ready"] += 1
+                else:
+                    depth["leased" if job["lease"] else "delayed"] += 1
+        return depth
+
+
+class JobWorkers:
+    """``concurrency`` asyncio tasks leasing jobs from one queue and running ``handler`` on each payload.
+
+    A handler gets ``visibility_timeout`` seconds, the length of its lease. When
+    it raises, the job is retried with exponential backoff (PermanentJobError
+    dead-letters it at once). Delivery is at least once, so handlers must be
+    safe to run again for the same job. ``sweep``, when given, runs every
+    ``sweep_interval`` seconds to enqueue work whose enqueue was lost.
+    """
+
+    def __init__(self, store: JobStore, queue: str, handler: Callable[[dict], Awaitable[None]], concurrency: int = 2,
+                 visibility_timeout: float = VISIBILITY_TIMEOUT, poll_interval: float = POLL_INTERVAL,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX, metrics=None,
+                 sweep: Optional[Callable[[], Awaitable[int]]] = None, sweep_interval: float = 60.0):
+        self.store = store
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = metrics
+        self.sweep = sweep
+        self.sweep_interval = sweep_interval
+
+        self._tasks: List[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._stopped = asyncio.Event()
+
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        self.lost = 0
+        self.latency_total = 0.0
+
+    async def enqueue(self, payload: dict, **options) -> dict:
+        """Add a job and wake an idle worker of this process to run it."""
+        job = await self.store.enqueue(self.queue, payload, **options)
+        self._wake.set()
+        return job
+
+    def start(self):
+        if self._tasks:
+            return
+        self._stopping = False
+        self._stopped.clear()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+
+    async def stop(self, grace: float = 10.0):
+        """Let running jobs finish for up to ``grace`` seconds; jobs cut off are retried when their lease runs out."""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._stopped.set()
+        self._wake.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=grace)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while not self._stopping:
+            try:
+                job = await self.store.lease(self.queue, self.visibility_timeout)
+            except PyMongoError as e:
+                logger.warning("Could not lease a %s job: %s", self.queue, e)
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.handler(job["payload"]), self.visibility_timeout)
+        except PermanentJobError as e:
+            outcome = await self._fail(job, str(e) or type(e).__name__, None)
+        except Exception as e:
+            logger.warning("%s job %s failed on attempt %d: %s", self.queue, job["_id"], job["attempts"], e)
+            delay = backoff(job["attempts"], self.backoff_base, self.backoff_max)
+            outcome = await self._fail(job, f"{type(e).__name__}: {e}", delay)
+        else:
+            try:
+                outcome = "completed" if await self.store.complete(job) else "lost"
+            except PyMongoError as e:
+                logger.warning("Could not complete %s job %s, it will run again: %s", self.queue, job["_id"], e)
+                outcome = "lost"
+        run_time = time.perf_counter() - started
+
+        latency = (_now() - job["enqueued_at"].replace(tzinfo=timezone.utc)).total_seconds()
+        if outcome == "completed":
+            self.completed += 1
+            self.latency_total += latency
+        elif outcome == "retried":
+            self.retried += 1
+        elif outcome == "dead":
+            self.dead += 1
+            logger.error("%s job %s dead-lettered: %s", self.queue, job["_id"], job.get("last_error"))
+        else:
+            self.lost += 1
+        if self.metrics is not None:
+            self.metrics.observe_job(self.queue, outcome, run_time, latency if outcome == "completed" else None)
+
+    async def _fail(self, job: dict, error: str, retry_delay: Optional[float]) -> str:
+        job["last_error"] = error
+        try:
+            state = await self.store.fail(job, error, retry_delay)
+        except PyMongoError as e:
+            logger.warning("Could not record failure of %s job %s: %s", self.queue, job["_id"], e)
+            return "lost"
+        return {PENDING: "retried", DEAD: "dead", None: "lost"}[state]
+
+    async def _monitor(self):
+        """Publish the queue depth, and run the sweep, until stopped."""
+        last_sweep = 0.0
+        while not self._stopping:
+            try:
+                if self.metrics is not None:
+                    self.metrics.observe_job_queue(self.queue, await self.store.depth(self.queue))
+                if self.sweep is not None and time.monotonic() - last_sweep >= self.sweep_interval:
+                    last_sweep = time.monotonic()
+                    if await self.sweep():
+                        self._wake.set()
+            except PyMongoError as e:
+                logger.warning("Could not check the %s queue: %s", self.queue, e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), DEPTH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "queue": self.queue,
+            "workers": self.concurrency,
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead": self.dead,
+            "lost": self.lost,
+            "mean_latency_seconds": self.latency_total / self.completed if self.completed else 0.0,
+        }
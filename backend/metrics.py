@@ -0,0 +1,405 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# enqueue to completion, which includes time spent waiting in the queue and in retries
+JOB_LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 3600)
+
+# Commands issued outside any request, e.g. the catalog poller
+BACKGROUND = "(background)"
+UNMATCHED = "(unmatched)"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout, one series per label tuple."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            # per-bucket counts, then sum, then count
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, name: str, help_text: str, label_names: Tuple[str, ...]) -> List[str]:
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {series[-1]}')
+            lines.append(f"{name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _counter(name: str, help_text: str, label_names, series: dict) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    lines.extend(f"{name}{{{_labels(label_names, labels)}}} {value}" for labels, value in sorted(series.items()))
+    return lines
+
+
+class RequestTrace:
+    """Mongo commands issued while serving one request."""
+
+    __slots__ = ("route", "calls")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.calls: List[tuple] = []  # (command, collection, duration seconds, ok)
+
+
+# Set by the middleware for the lifetime of a request. Motor runs commands on its
+# executor under a copy of the caller's context, so the listener sees the same trace.
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """pymongo command listener that feeds :class:`Metrics` and the current request trace."""
+
+    def __init__(self, metrics: "Metrics"):
+        self.metrics = metrics
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._pending[(event.connection_id, event.request_id)] = (collection, current_trace.get())
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok: bool):
+        collection, trace = self._pending.pop((event.connection_id, event.request_id), ("", None))
+        duration = event.duration_micros / 1_000_000
+        if trace is not None:
+            # counted against the route once the request has been routed and finished
+            trace.calls.append((event.command_name, collection, duration, ok))
+        self.metrics.observe_command(event.command_name, collection, duration, ok, None if trace else BACKGROUND)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool gauges and checkout wait times for :class:`Metrics`.
+
+    A checkout starts and completes on the same thread, so the start time is kept
+    in a thread-local.
+    """
+
+    def __init__(self, metrics: "Metrics"):
+        self.metrics = metrics
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        self.metrics.observe_pool(event.address, waiting=1)
+
+    def connection_checked_out(self, event):
+        wait = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        self.metrics.observe_pool(event.address, waiting=-1, in_use=1, wait=wait)
+
+    def connection_check_out_failed(self, event):
+        wait = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        self.metrics.observe_pool(event.address, waiting=-1, wait=wait, failure=str(event.reason))
+
+    def connection_checked_in(self, event):
+        self.metrics.observe_pool(event.address, in_use=-1)
+
+    def connection_created(self, event):
+        self.metrics.observe_pool(event.address, connections=1)
+
+    def connection_closed(self, event):
+        self.metrics.observe_pool(event.address, connections=-1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+class Metrics:
+    """In-process request and Mongo command metrics rendered in Prometheus text format."""
+
+    def __init__(self, slow_request_ms: float = 500):
+        self.slow_request_ms = slow_request_ms
+        self.command_listener = CommandTimer(self)
+        self.pool_listener = PoolMonitor(self)
+        self.pool_max_size: Optional[int] = None
+        # listener callbacks arrive on Motor's executor threads
+        self._lock = threading.Lock()
+
+        self.requests = defaultdict(int)
+        self.request_latency = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.commands_per_request = Histogram(COUNT_BUCKETS)
+        self.in_flight = 0
+        self.slow_requests = 0
+        self.shed = defaultdict(int)
+
+        self.jobs = defaultdict(int)
+        self.job_run_time = Histogram(LATENCY_BUCKETS)
+        self.job_latency = Histogram(JOB_LATENCY_BUCKETS)
+        self.job_queue_depth: Dict[Tuple[str, str], int] = {}
+
+        self.commands = defaultdict(int)
+        self.command_errors = defaultdict(int)
+        self.command_latency = Histogram(LATENCY_BUCKETS)
+
+        # per server address: [connections, in use, waiting, peak in use]
+        self.pools: Dict[str, list] = {}
+        self.pool_wait = Histogram(LATENCY_BUCKETS)
+        self.pool_failures = defaultdict(int)
+
+        # (prefix, stats callable, counter keys) of in-process caches and queues
+        self._stats_sources: List[Tuple[str, Callable[[], dict], frozenset]] = []
+
+    def add_stats(self, prefix: str, stats: Callable[[], dict], counters: Iterable[str] = ()):
+        """Publish the numeric values of ``stats()`` as ``<prefix>_<key>`` on every scrape.
+
+        Keys in ``counters`` are cumulative and rendered as ``<prefix>_<key>_total``
+        counters; the rest are gauges.
+        """
+        self._stats_sources.append((prefix, stats, frozenset(counters)))
+
+    def observe_command(self, command: str, collection: str, duration: float, ok: bool, route: Optional[str] = None):
+        with self._lock:
+            self.command_latency.observe((command, collection), duration)
+            if route is not None:
+                self._count_command(route, command, collection, ok)
+
+    def _count_command(self, route: str, command: str, collection: str, ok: bool):
+        self.commands[(route, command, collection)] += 1
+        if not ok:
+            self.command_errors[(route, command, collection)] += 1
+
+    def observe_shed(self, route_class: str, reason: str):
+        with self._lock:
+            self.shed[(route_class, reason)] += 1
+
+    def observe_job(self, queue: str, outcome: str, run_time: float, latency: Optional[float] = None):
+        with self._lock:
+            self.jobs[(queue, outcome)] += 1
+            self.job_run_time.observe((queue,), run_time)
+            if latency is not None:
+                self.job_latency.observe((queue,), latency)
+
+    def observe_job_queue(self, queue: str, depth: Dict[str, int]):
+        with self._lock:
+            for state, count in depth.items():
+                self.job_queue_depth[(queue, state)] = count
+
+    def observe_pool(self, address, connections: int = 0, in_use: int = 0, waiting: int = 0,
+                     wait: Optional[float] = None, failure: Optional[str] = None):
+        server = "%s:%s" % address
+        with self._lock:
+            pool = self.pools.setdefault(server, [0, 0, 0, 0])
+            pool[0] += connections
+            pool[1] += in_use
+            pool[2] += waiting
+            pool[3] = max(pool[3], pool[1])
+            if wait is not None:
+                self.pool_wait.observe((server,), wait)
+            if failure is not None:
+                self.pool_failures[(server, failure)] += 1
+
+    def pool_stats(self) -> dict:
+        """Pool state per server, for benchmarks and debugging."""
+        with self._lock:
+            stats = {}
+            for server, (connections, in_use, waiting, peak) in self.pools.items():
+                series = self.pool_wait._series.get((server,))
+                checkouts = series[-1] if series else 0
+                stats[server] = {
+                    "max_size": self.pool_max_size,
+                    "connections": connections,
+                    "in_use": in_use,
+                    "waiting": waiting,
+                    "peak_in_use": peak,
+                    "checkouts": checkouts,
+                    "mean_wait_ms": series[-2] / checkouts * 1000 if checkouts else 0.0,
+                    "failures": sum(count for (address, _), count in self.pool_failures.items() if address == server),
+                }
+            return stats
+
+    def observe_request(self, method: str, route: str, status: int, duration: float,
+                        request_bytes: int, response_bytes: int, trace: RequestTrace):
+        with self._lock:
+            self.requests[(method, route, str(status))] += 1
+            self.request_latency.observe((method, route), duration)
+            self.request_size.observe((method, route), request_bytes)
+            self.response_size.observe((method, route), response_bytes)
+            self.commands_per_request.observe((method, route), len(trace.calls))
+            for command, collection, _, ok in trace.calls:
+                self._count_command(route, command, collection, ok)
+
+        if duration * 1000 >= self.slow_request_ms:
+            self.slow_requests += 1
+            logger.warning("Slow request %s", json.dumps({
+                "method": method,
+                "route": route,
+                "status": status,
+                "duration_ms": round(duration * 1000, 2),
+                "db_calls": len(trace.calls),
+                "db_ms": round(sum(call[2] for call in trace.calls) * 1000, 2),
+                "calls": [
+                    {"command": command, "collection": collection, "ms": round(elapsed * 1000, 2), "ok": ok}
+                    for command, collection, elapsed, ok in trace.calls
+                ],
+            }))
+
+    def _render_stats(self) -> List[str]:
+        lines = []
+        for prefix, stats, counters in self._stats_sources:
+            for key, value in stats().items():
+                if not isinstance(value, (int, float)):
+                    continue
+                kind = "counter" if key in counters else "gauge"
+                name = f"{prefix}_{key}_total" if kind == "counter" else f"{prefix}_{key}"
+                lines += [f"# TYPE {name} {kind}", f"{name} {int(value) if isinstance(value, bool) else value}"]
+        return lines
+
+    def render(self) -> str:
+        # stats() of the registered sources take their own locks
+        stats_lines = self._render_stats()
+        with self._lock:
+            lines = _counter("http_requests_total", "Requests served.", ("method", "route", "status"), self.requests)
+            lines += self.request_latency.render(
+                "http_request_duration_seconds", "Request latency.", ("method", "route"))
+            lines += self.request_size.render(
+                "http_request_size_bytes", "Request body size.", ("method", "route"))
+            lines += self.response_size.render(
+                "http_response_size_bytes", "Response body size.", ("method", "route"))
+            lines += self.commands_per_request.render(
+                "http_request_mongo_commands", "Mongo commands issued per request.", ("method", "route"))
+            lines += ["# HELP http_requests_in_flight Requests being served.",
+                      "# TYPE http_requests_in_flight gauge",
+                      f"http_requests_in_flight {self.in_flight}",
+                      "# HELP http_slow_requests_total Requests slower than the slow-request threshold.",
+                      "# TYPE http_slow_requests_total counter",
+                      f"http_slow_requests_total {self.slow_requests}"]
+            lines += _counter("http_requests_shed_total", "Requests rejected by admission control.",
+                              ("route_class", "reason"), self.shed)
+            lines += _counter("jobs_total", "Background jobs run, by outcome.", ("queue", "outcome"), self.jobs)
+            lines += self.job_run_time.render(
+                "job_run_duration_seconds", "Time spent running one attempt of a job.", ("queue",))
+            lines += self.job_latency.render(
+                "job_latency_seconds", "Time from enqueue to completion of a job.", ("queue",))
+            lines += ["# HELP job_queue_depth Jobs in the queue by state.", "# TYPE job_queue_depth gauge"]
+            lines += [f"job_queue_depth{{{_labels(('queue', 'state'), labels)}}} {count}"
+                      for labels, count in sorted(self.job_queue_depth.items())]
+            lines += _counter("mongo_commands_total", "Mongo commands by issuing route.",
+                              ("route", "command", "collection"), self.commands)
+            lines += _counter("mongo_command_errors_total", "Failed Mongo commands by issuing route.",
+                              ("route", "command", "collection"), self.command_errors)
+            lines += self.command_latency.render(
+                "mongo_command_duration_seconds", "Mongo command latency.", ("command", "collection"))
+            if self.pool_max_size is not None:
+                lines += ["# HELP mongo_pool_max_size Configured connections per server.",
+                          "# TYPE mongo_pool_max_size gauge",
+                          f"mongo_pool_max_size {self.pool_max_size}"]
+            for name, index, help_text in (("mongo_pool_connections", 0, "Open pooled connections."),
+                                           ("mongo_pool_in_use", 1, "Connections checked out."),
+                                           ("mongo_pool_waiting", 2, "Operations waiting for a connection.")):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+                lines += [f'{name}{{server="{_escape(server)}"}} {pool[index]}' for server, pool in sorted(self.pools.items())]
+            lines += self.pool_wait.render(
+                "mongo_pool_checkout_wait_seconds", "Time spent waiting to check out a connection.", ("server",))
+            lines += _counter("mongo_pool_checkout_failures_total", "Failed connection checkouts.",
+                              ("server", "reason"), self.pool_failures)
+            lines += stats_lines
+            # each serve.py worker keeps its own metrics; the pid tells the scrapes apart
+            lines += ["# HELP server_process_info The process that served this scrape.",
+                      "# TYPE server_process_info gauge",
+                      f'server_process_info{{pid="{os.getpid()}"}} 1']
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and collecting its Mongo commands.
+
+    Requests are labelled with the matched route template (``/api/products/{product_id}``)
+    so path parameters do not blow up series cardinality.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(UNMATCHED)
+        token = current_trace.set(trace)
+        sizes = [0, 0]
+        status = [500]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes[0] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes[1] += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            duration = time.perf_counter() - start
+            self.metrics.in_flight -= 1
+            current_trace.reset(token)
+            route = scope.get("route")
+            trace.route = getattr(route, "path_format", None) or getattr(route, "path", None) or UNMATCHED
+            self.metrics.observe_request(scope["method"], trace.route, status[0], duration, sizes[0], sizes[1], trace)
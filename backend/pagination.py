@@ -0,0 +1,69 @@
+import base64
+import json
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def encode_cursor(kind: str, values: Sequence) -> str:
+    """Opaque cursor pointing just past the row whose sort key is ``values``."""
+    raw = json.dumps({"k": kind, "v": list(values)}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(kind: str, cursor: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values = data["v"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor")
+    if data.get("k") != kind or not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Cursor does not belong to this listing")
+    return values
+
+
+def keyset_filter(sort: List[Tuple[str, int]], after: Sequence) -> dict:
+    """Mongo filter matching rows strictly after ``after`` in ``sort`` order.
+
+    For ``[("name", 1), ("id", 1)]`` and ``("Aspirin", "x")`` this is
+    ``{"$or": [{"name": {"$gt": "Aspirin"}}, {"name": "Aspirin", "id": {"$gt": "x"}}]}``.
+    """
+    clauses = []
+    for position, (field, direction) in enumerate(sort):
+        clause = {prior: after[i] for i, (prior, _) in enumerate(sort[:position])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": after[position]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def page_cursor(kind: str, page: list, limit: int, sort: List[Tuple[str, int]]) -> Optional[str]:
+    """Cursor for the next page, given a page fetched with ``limit + 1`` rows.
+
+    Trims the extra look-ahead row from ``page`` in place.
+    """
+    if len(page) <= limit:
+        return None
+    del page[limit:]
+    last = page[-1]
+    return encode_cursor(kind, [last[field] for field, _ in sort])
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str], required: Iterable[str] = ("id",)) -> Optional[dict]:
+    """Turn a ``fields=a,b`` query parameter into a Mongo projection."""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}")
+    projection = {"_id": 0}
+    for field in [*required, *requested]:
+        projection[field] = 1
+    return projection
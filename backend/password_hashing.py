@@ -0,0 +1,93 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+
+class HasherSaturated(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost factor of a ``$2b$12$...`` bcrypt hash."""
+    parts = hashed_password.split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop in a bounded worker pool.
+
+    At most ``max_pending`` hash/verify calls may be queued or running; callers
+    beyond that get HasherSaturated right away instead of piling up behind a
+    login storm.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: Optional[int] = None, max_pending: int = 64,
+                 use_processes: bool = False):
+        self.rounds = rounds
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.max_workers)
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            # Roughly how long the queue ahead needs to drain
+            raise HasherSaturated(retry_after=max(1, self._pending // (self.max_workers * 4)))
+        self._pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_rounds(hashed_password) != self.rounds
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
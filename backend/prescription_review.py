@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from blob_store import BlobStore
+from image_pipeline import ImagePipeline, InvalidImage
+from job_queue import JobWorkers, PermanentJobError
+from prescriptions import (ALLOWED_CONTENT_TYPES, MAX_PRESCRIPTION_BYTES, InvalidPrescription, decode_data_url,
+                           find_prescription)
+
+QUEUE = "prescription_review"
+
+# Order statuses on the way through review
+PENDING = "Pending"
+PRESCRIPTION_REQUIRED = "Prescription Required"
+PRESCRIPTION_INVALID = "Prescription Invalid"
+AWAITING_REVIEW = "Awaiting Review"
+CONFIRMED = "Confirmed"
+REJECTED = "Prescription Rejected"
+
+# Orders younger than this are left to the request that placed them
+SWEEP_GRACE = timedelta(minutes=1)
+SWEEP_BATCH = 1000
+REVIEW_PROJECTION = {"_id": 0, "prescription_data": 0}
+
+_SIGNATURES = [(b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG\r\n\x1a\n", "image/png"), (b"%PDF-", "application/pdf")]
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1"}
+
+
+def sniff_content_type(data: bytes) -> Optional[str]:
+    """The type the file's leading bytes say it is, among the accepted prescription types."""
+    for signature, content_type in _SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in _HEIF_BRANDS:
+        return "image/heic"
+    return None
+
+
+def validate_prescription(content_type: str, data: bytes) -> str:
+    """Check an upload is what it claims to be; returns its content type or raises InvalidPrescription."""
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise InvalidPrescription(f"Unsupported prescription type: {content_type}")
+    if len(data) > MAX_PRESCRIPTION_BYTES:
+        raise InvalidPrescription("Prescription file is too large")
+    sniffed = sniff_content_type(data)
+    if sniffed is None:
+        raise InvalidPrescription("Prescription is not a readable image or PDF")
+    if sniffed != content_type and not (sniffed == "image/heic" and content_type == "image/heif"):
+        raise InvalidPrescription(f"Prescription was sent as {content_type} but is {sniffed}")
+    return content_type
+
+
+def review_priority(order: dict) -> int:
+    # prepaid orders are reviewed first
+    return 1 if order.get("payment_method") == "UPI" else 0
+
+
+async def enqueue_review(workers: JobWorkers, order: dict):
+    """Queue ``order`` for prescription processing; an order is only ever queued once."""
+    await workers.enqueue({"order_id": order["id"]}, key=order["id"], priority=review_priority(order))
+
+
+async def enqueue_missing(db, workers: JobWorkers) -> int:
+    """Queue pending orders whose enqueue did not happen (crash, Mongo error); already queued ones are skipped."""
+    cutoff = (datetime.now(timezone.utc) - SWEEP_GRACE).isoformat()
+    orders = await db.orders.find(
+        {"requires_prescription": True, "status": PENDING, "created_at": {"$lt": cutoff}},
+        {"_id": 0, "id": 1, "payment_method": 1},
+    ).limit(SWEEP_BATCH).to_list(SWEEP_BATCH)
+    for order in orders:
+        await enqueue_review(workers, order)
+    return len(orders)
+
+
+class PrescriptionProcessor:
+    """Job handler that checks an order's prescription and readies it for a pharmacist.
+
+    The order moves from Pending to Awaiting Review once a photo prescription
+    has been through the image pipeline, or to Prescription Required /
+    Prescription Invalid. Only Pending orders are touched, so a job that runs
+    twice changes nothing.
+    """
+
+    def __init__(self, db, store: BlobStore, images: ImagePipeline):
+        self.db = db
+        self.store = store
+        self.images = images
+
+    async def __call__(self, payload: dict):
+        order = await self.db.orders.find_one(
+            {"id": payload["order_id"]},
+            {"_id": 0, "id": 1, "user_id": 1, "status": 1, "prescription_id": 1, "prescription_data": 1},
+        )
+        if order is None:
+            raise PermanentJobError(f"Order {payload['order_id']} not found")
+        if order["status"] != PENDING:
+            return
+
+        review = {"checked_at": datetime.now(timezone.utc).isoformat()}
+        try:
+            content_type, data = await self._load(order)
+            if data is None:
+                status = PRESCRIPTION_REQUIRED
+            else:
+                review["content_type"] = validate_prescription(content_type, data)
+                review["size"] = len(data)
+                processed = await self._process(order, content_type, data)
+                if processed is not None:
+                    review["image_key"] = processed["key"]
+                    review["display_size"] = len(processed["display"])
+                status = AWAITING_REVIEW
+        except InvalidPrescription as e:
+            status = PRESCRIPTION_INVALID
+            review["error"] = str(e)
+
+        await self.db.orders.update_one(
+            {"id": order["id"], "status": PENDING}, {"$set": {"status": status, "prescription_review": review}}
+        )
+
+    async def _process(self, order: dict, content_type: str, data: bytes) -> Optional[dict]:
+        try:
+            # a stored prescription's id is the SHA-256 of its content
+            return await self.images.process(data, content_type, digest=order.get("prescription_id"))
+        except InvalidImage as e:
+            raise InvalidPrescription(str(e))
+
+    async def images_for(self, order_id: str) -> Optional[dict]:
+        """The display image and thumbnail of an order's prescription, reprocessed if they left the cache."""
+        order = await self.db.orders.find_one(
+            {"id": order_id},
+            {"_id": 0, "user_id": 1, "prescription_id": 1, "prescription_data": 1, "prescription_review.image_key": 1},
+        )
+        if order is None or not (order.get("prescription_review") or {}).get("image_key"):
+            return None
+        variants = await self.images.read(order["prescription_review"]["image_key"])
+        if variants is not None:
+            return {"content_type": self.images.content_type, **variants}
+        try:
+            content_type, data = await self._load(order)
+            return await self._process(order, content_type, data)
+        except InvalidPrescription:
+            return None
+
+    async def _load(self, order: dict) -> Tuple[Optional[str], Optional[bytes]]:
+        if order.get("prescription_id"):
+            record = await find_prescription(self.db, order["prescription_id"], order["user_id"])
+            if record is None:
+                raise InvalidPrescription("Prescription not found")
+            data = b"".join([chunk async for chunk in self.store.read(record["id"])])
+            return record["content_type"], data
+        if order.get("prescription_data"):
+            # orders from before uploads went to the blob store
+            return decode_data_url(order["prescription_data"])
+        return None, None
+
+
+async def awaiting_review(db, limit: int = 50) -> List[dict]:
+    """Orders waiting for a pharmacist, oldest first."""
+    return await db.orders.find({"requires_prescription": True, "status": AWAITING_REVIEW}, REVIEW_PROJECTION) \
+        .sort("created_at", 1).limit(limit).to_list(limit)
+
+
+async def decide(db, order_id: str, approved: bool, pharmacist: str, note: Optional[str] = None) -> bool:
+    """Record a pharmacist's decision; False unless the order was awaiting review."""
+    result = await db.orders.update_one(
+        {"id": order_id, "status": AWAITING_REVIEW},
+        {"$set": {
+            "status": CONFIRMED if approved else REJECTED,
+            "prescription_review.decided_by": pharmacist,
+            "prescription_review.decided_at": datetime.now(timezone.utc).isoformat(),
+            "prescription_review.note": note,
+        }},
+    )
+    return result.modified_count == 1
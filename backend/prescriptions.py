@@ -0,0 +1,53 @@
+import base64
+import binascii
+import os
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+
+from blob_store import BlobStore
+
+ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif", "application/pdf"}
+MAX_PRESCRIPTION_BYTES = int(os.environ.get('MAX_PRESCRIPTION_BYTES', str(5 * 1024 * 1024)))
+
+
+class InvalidPrescription(ValueError):
+    pass
+
+
+def decode_data_url(data_url: str) -> Tuple[str, bytes]:
+    """Split a ``data:<type>;base64,<payload>`` string as sent by FileReader.readAsDataURL."""
+    header, separator, payload = data_url.partition(",")
+    if not separator or not header.startswith("data:") or not header.endswith(";base64"):
+        raise InvalidPrescription("Prescription must be a base64 data URL")
+    try:
+        return header[len("data:"):-len(";base64")], base64.b64decode(payload, validate=True)
+    except binascii.Error:
+        raise InvalidPrescription("Prescription is not valid base64")
+
+
+async def save_prescription(store: BlobStore, db, user_id: str, chunks: AsyncIterator[bytes],
+                            content_type: str, filename: Optional[str] = None) -> dict:
+    """Store an uploaded prescription and record that ``user_id`` may read it.
+
+    Raises InvalidPrescription for unsupported types and BlobTooLarge past the size cap.
+    """
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise InvalidPrescription(f"Unsupported prescription type: {content_type}")
+
+    blob = await store.put(chunks, max_size=MAX_PRESCRIPTION_BYTES)
+    record = {
+        "id": blob["hash"],
+        "user_id": user_id,
+        "size": blob["size"],
+        "content_type": content_type,
+        "filename": filename,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.prescriptions.update_one(
+        {"id": record["id"], "user_id": user_id}, {"$setOnInsert": record}, upsert=True
+    )
+    return record
+
+
+async def find_prescription(db, prescription_id: str, user_id: str) -> Optional[dict]:
+    return await db.prescriptions.find_one({"id": prescription_id, "user_id": user_id}, {"_id": 0})
@@ -0,0 +1,237 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Relevance weight of a match in each indexed field
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+# How much an exact, prefix or fuzzy match of a query term is worth
+EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return _TOKEN_RE.findall(text.lower())
+
+
+def max_edits(term: str) -> int:
+    """Typos allowed for a query term: none for short terms, up to two for long ones."""
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def _deletes(term: str, distance: int) -> Set[str]:
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        results |= frontier
+    return results
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up as soon as it must exceed ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class ProductSearchIndex:
+    """In-process inverted index over product name, description and category.
+
+    Supports exact, prefix (autocomplete) and typo-tolerant matching. Fuzzy
+    candidates come from a symmetric-delete index so lookups never scan the
+    whole vocabulary.
+    """
+
+    def __init__(self, fuzzy_distance: int = 2):
+        self.fuzzy_distance = fuzzy_distance
+        self._products: Dict[str, dict] = {}
+        self._product_terms: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._vocabulary: List[str] = []
+        self._deletes: Dict[str, Set[str]] = {}
+        self._refreshes: Set[asyncio.Task] = set()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._products)
+
+    # Index maintenance
+
+    def _add_term(self, term: str):
+        bisect.insort(self._vocabulary, term)
+        for deleted in _deletes(term, self.fuzzy_distance):
+            self._deletes.setdefault(deleted, set()).add(term)
+
+    def _drop_term(self, term: str):
+        del self._postings[term]
+        self._vocabulary.pop(bisect.bisect_left(self._vocabulary, term))
+        for deleted in _deletes(term, self.fuzzy_distance):
+            terms = self._deletes.get(deleted)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self._deletes[deleted]
+
+    def upsert(self, product: dict):
+        product_id = product["id"]
+        self.remove(product_id)
+
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(product.get(field, "")):
+                weights[term] = max(weights.get(term, 0.0), weight)
+
+        for term, weight in weights.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._add_term(term)
+            self._postings[term][product_id] = weight
+
+        self._products[product_id] = product
+        self._product_terms[product_id] = set(weights)
+
+    def remove(self, product_id: str):
+        for term in self._product_terms.pop(product_id, ()):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                self._drop_term(term)
+        self._products.pop(product_id, None)
+
+    def clear(self):
+        self._products.clear()
+        self._product_terms.clear()
+        self._postings.clear()
+        self._vocabulary.clear()
+        self._deletes.clear()
+        self.ready = False
+
+    # Queries
+
+    def _prefix_terms(self, prefix: str) -> Iterable[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def _fuzzy_terms(self, term: str) -> Iterable[str]:
+        allowed = min(max_edits(term), self.fuzzy_distance)
+        if not allowed:
+            return
+        candidates = set()
+        for deleted in _deletes(term, allowed):
+            candidates |= self._deletes.get(deleted, set())
+        for candidate in candidates:
+            if candidate != term and edit_distance(term, candidate, allowed) <= allowed:
+                yield candidate
+
+    def _term_scores(self, term: str, allow_prefix: bool) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+
+        def add(matched: str, quality: float):
+            for product_id, weight in self._postings[matched].items():
+                score = weight * quality
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+
+        if term in self._postings:
+            add(term, EXACT)
+        if allow_prefix:
+            for matched in self._prefix_terms(term):
+                if matched != term:
+                    add(matched, PREFIX)
+        # Typo correction only kicks in for words the catalog does not contain
+        if not scores:
+            for matched in self._fuzzy_terms(term):
+                add(matched, FUZZY)
+        return scores
+
+    def search(self, query: str, category: Optional[str] = None, limit: int = 20) -> List[dict]:
+        """Return up to ``limit`` products matching every query term, best first.
+
+        The last term also matches as a prefix so partially typed words autocomplete.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        totals: Optional[Dict[str, float]] = None
+        for position, term in enumerate(terms):
+            scores = self._term_scores(term, allow_prefix=position == len(terms) - 1)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {product_id: totals[product_id] + score
+                          for product_id, score in scores.items() if product_id in totals}
+            if not totals:
+                return []
+
+        products = self._products
+        ranked = (
+            (-score, products[product_id].get("name", ""), product_id)
+            for product_id, score in totals.items()
+            if not category or products[product_id].get("category") == category
+        )
+        return [products[product_id] for _, _, product_id in heapq.nsmallest(limit, ranked)]
+
+    # Syncing with the products collection
+
+    async def build(self, db):
+        """Index the whole catalog, swapping it in only once it is complete."""
+        fresh = ProductSearchIndex(self.fuzzy_distance)
+        async for product in db.products.find({}, {"_id": 0, "reserved_by": 0}):
+            fresh.upsert(product)
+        self._products = fresh._products
+        self._product_terms = fresh._product_terms
+        self._postings = fresh._postings
+        self._vocabulary = fresh._vocabulary
+        self._deletes = fresh._deletes
+        self.ready = True
+        logger.info("Product search index built: %d products, %d terms", len(self._products), len(self._postings))
+
+    async def refresh(self, db, product_ids: Optional[Iterable[str]] = None):
+        """Re-read the given products (or the whole catalog) after they changed."""
+        if product_ids is None:
+            await self.build(db)
+            return
+        product_ids = list(product_ids)
+        found = await db.products.find(
+            {"id": {"$in": product_ids}}, {"_id": 0, "reserved_by": 0}
+        ).to_list(len(product_ids))
+        for product in found:
+            self.upsert(product)
+        for product_id in set(product_ids) - {product["id"] for product in found}:
+            self.remove(product_id)
+
+    def follow(self, db, catalog):
+        """Keep the index in step with the catalog cache's invalidation feed."""
+        def on_invalidate(product_ids):
+            task = asyncio.get_running_loop().create_task(self._refresh_logged(db, product_ids))
+            self._refreshes.add(task)
+            task.add_done_callback(self._refreshes.discard)
+        catalog.add_listener(on_invalidate)
+
+    async def _refresh_logged(self, db, product_ids):
+        try:
+            await self.refresh(db, product_ids)
+        except Exception:
+            logger.exception("Product search index refresh failed")
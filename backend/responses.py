@@ -0,0 +1,66 @@
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, Mapping, Optional, Type
+
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` as compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with :func:`dumps` instead of the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class DocumentSerializer:
+    """Shape trusted Mongo documents to a response model without validating them.
+
+    Documents this API wrote itself already match the model, so routes that opt in
+    skip FastAPI's per-item validation and re-serialization: each document is cut
+    down to the model's fields (filling plain defaults for fields older documents
+    lack) and encoded in one pass. Datetimes are stored as ISO 8601 strings and
+    emitted exactly as stored.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        # (name, default) pairs; fields with a default_factory or no default are only copied when present
+        self._fields = [
+            (name, field.default) for name, field in model.model_fields.items()
+        ]
+
+    def shape(self, document: Mapping[str, Any]) -> dict:
+        shaped = {}
+        for name, default in self._fields:
+            if name in document:
+                shaped[name] = document[name]
+            elif default is not PydanticUndefined:
+                shaped[name] = default
+        return shaped
+
+    def one(self, document: Mapping[str, Any], headers: Optional[dict] = None) -> FastJSONResponse:
+        return FastJSONResponse(self.shape(document), headers=headers)
+
+    def many(self, documents: Iterable[Mapping[str, Any]], headers: Optional[dict] = None) -> FastJSONResponse:
+        shape = self.shape
+        return FastJSONResponse([shape(document) for document in documents], headers=headers)
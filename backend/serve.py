@@ -0,0 +1,170 @@
+"""Serve ``server:app`` from several worker processes.
+
+    python serve.py --port 8001 [--workers N]
+
+The app is imported and the catalog loaded once, in this process, before the
+workers are forked from it, so they start with the catalog snapshot and search
+index already in memory and share those pages copy-on-write until their first
+invalidation. Workers accept connections from one shared listening socket and
+broadcast the invalidations they make over a Unix-socket bus (see
+invalidation_bus.py); each still follows the products change stream (or polls)
+for writes made outside the app.
+
+The supervisor restarts workers that die and forwards SIGINT/SIGTERM so every
+worker drains its connections before exiting.
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import math
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+RESTART_DELAY = 1.0
+SHUTDOWN_TIMEOUT = 30.0
+
+
+def available_cores() -> int:
+    """CPUs this process may run on, honouring the affinity mask and a cgroup v2 CPU quota."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def preload(server):
+    # A throwaway client: the app's own client must not open connections before the fork
+    from database import Database
+    database = Database.from_env()
+    try:
+        await server.preload_catalog(database.db)
+    finally:
+        database.close()
+
+
+class Supervisor:
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.children = {}  # pid -> worker number
+        self.stopping = False
+
+    def spawn(self, number: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = number
+            return
+
+        # In the worker; uvicorn installs its own graceful-shutdown signal handlers
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 1
+        try:
+            config = uvicorn.Config(self.app, log_level=self.log_level, lifespan="on")
+            uvicorn.Server(config).run(sockets=[self.sock])
+            code = 0
+        except Exception:
+            logger.exception("Worker %d crashed", number)
+        finally:
+            os._exit(code)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for number in range(self.workers):
+            self.spawn(number)
+        logger.info("Serving with %d workers: %s", self.workers, sorted(self.children))
+
+        deadline = None
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if self.stopping:
+                    deadline = deadline or time.monotonic() + SHUTDOWN_TIMEOUT
+                    if time.monotonic() > deadline:
+                        logger.warning("Workers did not stop in time; killing %s", sorted(self.children))
+                        for child in self.children:
+                            os.kill(child, signal.SIGKILL)
+                time.sleep(0.2)
+                continue
+
+            number = self.children.pop(pid)
+            if not self.stopping:
+                logger.warning("Worker %d (pid %d) exited with status %d; restarting",
+                               number, pid, os.waitstatus_to_exitcode(status))
+                time.sleep(RESTART_DELAY)
+                self.spawn(number)
+        return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve the API from one worker process per core")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "0")) or None,
+                        help="worker processes (default: $WEB_CONCURRENCY, else the available cores)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="let every worker load the catalog itself instead of sharing one preloaded copy")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    workers = args.workers or available_cores()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    bus_dir = tempfile.mkdtemp(prefix="invalidation-bus-")
+    os.environ["INVALIDATION_BUS_DIR"] = bus_dir
+    try:
+        import server
+        if not args.no_preload:
+            started = time.perf_counter()
+            asyncio.run(preload(server))
+            logger.info("Preloaded the catalog in %.2fs", time.perf_counter() - started)
+
+        sock = bind(args.host, args.port)
+        # Keep the collector from touching (and so copying) every preloaded object in each worker
+        gc.collect()
+        gc.freeze()
+        return Supervisor(server.app, sock, workers, args.log_level).run()
+    finally:
+        shutil.rmtree(bus_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,70 +1,318 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Request, status, UploadFile, File
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, PyMongoError, WaitQueueTimeoutError
 import os
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
-import bcrypt
+from datetime import date, datetime, timezone, timedelta
 import jwt
 import base64
 
+from cart_pricing import resolve_cart_items, cart_total
+from checkout import place_order, EmptyCartError, InsufficientStockError
+from indexes import ensure_indexes
+from catalog_cache import CatalogCache, PRODUCT_SORT
+from catalog_models import Product
+from product_search import ProductSearchIndex
+from pagination import decode_cursor, page_cursor, parse_fields, keyset_filter
+from blob_store import make_blob_store, iter_bytes, parse_byte_range, BlobTooLarge, CHUNK_SIZE
+from prescriptions import save_prescription, find_prescription, decode_data_url, InvalidPrescription, MAX_PRESCRIPTION_BYTES
+from password_hashing import PasswordHasher, HasherSaturated
+from auth_cache import AuthCache
+from carts import add_item, set_item_quantity, CartConflictError
+from metrics import Metrics, MetricsMiddleware
+from responses import DocumentSerializer, FastJSONResponse
+from http_cache import ResponseCache, CACHE_POLICIES, cache_key
+from compression import Compressor, CompressionMiddleware
+from database import Database
+from invalidation_bus import InvalidationBus
+from write_behind import WriteBehindQueue, WriteQueueFull
+from admission import Admission, AdmissionMiddleware, MemoryBuckets, MongoBuckets, RateLimited
+from analytics import SalesRollups, record_order_logged, day_range
+from exports import export_fields, export_query, export_stream, MEDIA_TYPES
+from job_queue import JobWorkers, MemoryJobStore, MongoJobStore
+from image_pipeline import ImagePipeline, InvalidImage
+from prescription_review import (QUEUE as PRESCRIPTION_QUEUE, PrescriptionProcessor, awaiting_review, decide,
+                                 enqueue_missing, enqueue_review)
+
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Request and Mongo command metrics, served at /metrics
+metrics = Metrics(slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', '500')))
+
+# MongoDB connection. Writes, carts, checkout and the catalog cache use the primary
+# through db, since a cached product is kept until its next change; order history,
+# reports and exports read through read_db and may hit secondaries.
+database = Database.from_env(event_listeners=[metrics.command_listener, metrics.pool_listener])
+metrics.pool_max_size = database.max_pool_size
+client = database.client
+db = database.db
+read_db = database.reads
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
+# bcrypt runs in a bounded worker pool so logins never block the event loop
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')),
+    max_workers=int(os.environ['PASSWORD_HASH_WORKERS']) if os.environ.get('PASSWORD_HASH_WORKERS') else None,
+    max_pending=int(os.environ.get('PASSWORD_HASH_QUEUE', '64')),
+    use_processes=os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread') == 'process'
+)
+
+# Verified tokens and user profiles for get_current_user
+auth_cache = AuthCache(
+    max_tokens=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '10000')),
+    user_ttl=float(os.environ.get('AUTH_USER_CACHE_TTL', '30')),
+    trust_claims=os.environ.get('AUTH_TRUST_CLAIMS', 'false').lower() == 'true',
+    revocation_poll_interval=float(os.environ.get('AUTH_REVOCATION_POLL_INTERVAL', '10'))
+)
+
+# Catalog cache shared by the product and category routes
+catalog = CatalogCache(
+    max_size=int(os.environ.get('CATALOG_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', '300')),
+    poll_interval=float(os.environ.get('CATALOG_CACHE_POLL_INTERVAL', '5')),
+    enabled=os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() == 'true',
+    invalidation=os.environ.get('CATALOG_CACHE_INVALIDATION', 'auto')
+)
+search_index = ProductSearchIndex()
+
+# Rate limits and concurrency caps for login, register and contact. Buckets live in
+# this process by default; set RATE_LIMIT_BACKEND=mongo to share them across serve.py workers.
+admission = Admission(
+    MongoBuckets(db) if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo' else MemoryBuckets(),
+    metrics=metrics,
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    trusted_proxies=int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+)
+
+# Sales and inventory reports read pre-aggregated rollups, which each order updates
+# as it is placed; the sweep catches orders whose update did not happen
+sales_rollups = SalesRollups(sweep_interval=float(os.environ.get('ANALYTICS_SWEEP_INTERVAL', '60')))
+# Prescription photos are downscaled, stripped of EXIF and re-encoded in a process
+# pool; results are cached on disk by content hash
+image_pipeline = ImagePipeline(
+    os.environ.get('IMAGE_CACHE_PATH', str(ROOT_DIR / 'image_cache')),
+    cache_max_bytes=int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024))),
+    workers=int(os.environ.get('IMAGE_WORKERS', '2')),
+    max_dimension=int(os.environ.get('IMAGE_MAX_DIMENSION', '2048')),
+    fmt=os.environ.get('IMAGE_FORMAT', 'WEBP').upper(),
+    quality=int(os.environ.get('IMAGE_QUALITY', '80')),
+    enabled=os.environ.get('IMAGE_PIPELINE_ENABLED', 'true').lower() == 'true'
+)
+
+# Everything that keeps a reference to db. Built here and again by scripts that swap
+# server.db before the app starts (scripts/loadtest.py), so nothing polls a closed client.
+def build_db_services():
+    global prescription_store, write_behind, job_store, prescription_processor, prescription_workers
+    # Prescription uploads live in GridFS or on local disk, never inside orders
+    prescription_store = make_blob_store(db)
+    # Contact messages (and other low-priority inserts) are accepted into a spill file
+    # and written to Mongo in batches
+    write_behind = WriteBehindQueue(
+        db,
+        os.environ.get('WRITE_BEHIND_PATH', str(ROOT_DIR / 'write_behind')),
+        max_batch=int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500')),
+        flush_interval=float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', '1')),
+        max_queued=int(os.environ.get('WRITE_BEHIND_MAX_QUEUED', '10000'))
+    )
+    # Orders with prescription-only items are checked off the request path by these
+    # workers, then wait for a pharmacist. JOB_QUEUE_BACKEND=memory keeps jobs in this process.
+    job_store = MemoryJobStore() if os.environ.get('JOB_QUEUE_BACKEND', 'mongo') == 'memory' else MongoJobStore(db)
+    prescription_processor = PrescriptionProcessor(db, prescription_store, image_pipeline)
+    prescription_workers = JobWorkers(
+        job_store,
+        PRESCRIPTION_QUEUE,
+        prescription_processor,
+        concurrency=int(os.environ.get('PRESCRIPTION_WORKERS', '2')),
+        visibility_timeout=float(os.environ.get('PRESCRIPTION_JOB_TIMEOUT', '60')),
+        metrics=metrics,
+        sweep=lambda: enqueue_missing(db, prescription_workers)
+    )
+
+build_db_services()
+
+# Accounts allowed to read /api/admin/* (comma-separated emails)
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+# Under serve.py every worker process has its own caches; invalidations made while
+# serving a request are broadcast to the other workers over this bus
+invalidation_bus = InvalidationBus.from_env()
+invalidation_bus.subscribe("catalog", catalog.invalidate)
+invalidation_bus.subscribe("token_revoked", auth_cache.mark_token_revoked)
+invalidation_bus.subscribe("user_revoked", lambda data: auth_cache.mark_user_revoked(data["user_id"], data["revoked_before"]))
+# Set by preload_catalog() when serve.py warms the catalog before forking workers
+catalog_preloaded_at: Optional[str] = None
+
+# gzip/brotli response compression
+compressor = Compressor(
+    min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+    enabled=os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+)
+
+# Rendered (and precompressed) catalog responses, retired when the products they show change.
+# Listings are not retired by stock changes, so their entries only live for HTTP_CACHE_LISTING_TTL.
+LISTING_CACHE_TTL = float(os.environ.get('HTTP_CACHE_LISTING_TTL', '30'))
+response_cache = ResponseCache(
+    max_bytes=int(os.environ.get('HTTP_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl=catalog.ttl,
+    enabled=catalog.enabled and os.environ.get('HTTP_CACHE_ENABLED', 'true').lower() == 'true',
+    compressor=compressor
+)
+
+# Hit rates, coalescing ratios and backlogs of the in-process caches and queues, on /metrics
+FLIGHT_COUNTERS = ("flights_calls", "flights_coalesced")
+metrics.add_stats("password_hasher", password_hasher.stats, counters=("completed", "rejected"))
+metrics.add_stats("auth_cache", auth_cache.stats,
+                  counters=("token_hits", "token_misses", "user_hits", "user_misses", "claims_used", "db_lookups_avoided"))
+metrics.add_stats("catalog_cache", catalog.stats,
+                  counters=("hits", "misses", "evictions", "invalidations", *FLIGHT_COUNTERS))
+metrics.add_stats("response_cache", response_cache.stats,
+                  counters=("hits", "misses", "not_modified", "evictions", *FLIGHT_COUNTERS))
+metrics.add_stats("write_behind", lambda: write_behind.stats(),
+                  counters=("accepted", "rejected", "inserted", "batches", "replayed", "dead_lettered"))
+metrics.add_stats("image_pipeline", image_pipeline.stats,
+                  counters=("processed", "cache_hits", "failures", "bytes_in", "bytes_out", "bytes_saved",
+                            "cache_evictions", *FLIGHT_COUNTERS))
+
+# Listing page sizes
+PRODUCT_PAGE_SIZE = int(os.environ.get('PRODUCT_PAGE_SIZE', '1000'))
+ORDER_PAGE_SIZE = int(os.environ.get('ORDER_PAGE_SIZE', '50'))
+ORDER_MAX_PAGE_SIZE = 200
+ORDER_SORT = [("created_at", -1), ("id", -1)]
+# Order lists leave out the prescription upload unless it is asked for with fields=
+ORDER_LIST_PROJECTION = {"_id": 0, "prescription_data": 0}
+
+async def preload_catalog(primary):
+    """Load the catalog snapshot and search index ahead of the workers (see serve.py)."""
+    global catalog_preloaded_at
+    catalog_preloaded_at = datetime.now(timezone.utc).isoformat()
+    await catalog.categories(primary)
+    await search_index.build(primary)
+
+def invalidate_products(product_ids):
+    """Drop products from this worker's caches and from every other worker's."""
+    product_ids = list(product_ids)
+    catalog.invalidate(product_ids)
+    invalidation_bus.publish("catalog", product_ids)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes(db)
+    await write_behind.start()
+    auth_cache.start(db)
+    sales_rollups.start(db)
+    await image_pipeline.start()
+    prescription_workers.start()
+    await invalidation_bus.start()
+    search_index.follow(db, catalog)
+    catalog.start(db)
+    if catalog_preloaded_at is None:
+        await search_index.build(db)
+    else:
+        await catalog.catch_up(db, catalog_preloaded_at)
+    try:
+        yield
+    finally:
+        invalidation_bus.close()
+        await catalog.stop()
+        await auth_cache.stop()
+        await sales_rollups.stop()
+        await prescription_workers.stop()
+        await image_pipeline.stop()
+        password_hasher.shutdown()
+        await write_behind.stop()
+        database.close()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 security = HTTPBearer()
 
+@app.exception_handler(WaitQueueTimeoutError)
+async def pool_exhausted(request, exc):
+    # Every pooled connection stayed busy for MONGO_WAIT_QUEUE_TIMEOUT_MS
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
+
+@app.exception_handler(RateLimited)
+async def rate_limited(request, exc):
+    return JSONResponse(status_code=429, content={"detail": "Too many requests, please retry later"},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 # Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HasherSaturated as e:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": str(e.retry_after)})
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherSaturated as e:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": str(e.retry_after)})
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def rehash_password(user_id: str, plain_password: str):
+    # Bring a stored hash up to the configured bcrypt cost after a successful login
+    try:
+        hashed_password = await password_hasher.hash(plain_password)
+    except HasherSaturated:
+        return
+    await db.users.update_one({"id": user_id}, {"$set": {"password": hashed_password}})
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now, "jti": str(uuid.uuid4())})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def user_claims(user: dict) -> dict:
+    # Profile fields embedded in the token so AUTH_TRUST_CLAIMS can skip the user lookup
+    return {"sub": user['id'], "email": user['email'], "phone": user['phone'], "name": user['name']}
+
+async def get_token_payload(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        payload = auth_cache.decode_token(credentials.credentials, SECRET_KEY, ALGORITHM)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if auth_cache.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return payload
+
+async def get_current_user(payload: dict = Depends(get_token_payload)):
+    user = auth_cache.user_from_claims(payload)
+    if user is None:
+        user = await auth_cache.get_user(db, payload["sub"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user['email'].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
 
 # Models
@@ -94,18 +342,6 @@ class UserResponse(BaseModel):
     phone: str
     name: str
 
-class Product(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str
-    price: float
-    image_url: str
-    category: str
-    stock: int
-    requires_prescription: bool = False
-
 class CartItem(BaseModel):
     product_id: str
     quantity: int
@@ -121,6 +357,7 @@ class Cart(BaseModel):
 class AddToCartRequest(BaseModel):
     product_id: str
     quantity: int = 1
+    request_id: Optional[str] = None  # repeated adds with the same id are applied once
 
 class UpdateCartRequest(BaseModel):
     product_id: str
@@ -131,6 +368,7 @@ class OrderProduct(BaseModel):
     name: str
     price: float
     quantity: int
+    category: Optional[str] = None
 
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -143,8 +381,10 @@ class Order(BaseModel):
     upi_id: Optional[str] = None
     delivery_address: str
     phone: str
-    status: str = "Pending"  # Pending, Confirmed, Delivered
-    prescription_data: Optional[str] = None
+    status: str = "Pending"  # Pending, Prescription Required/Invalid, Awaiting Review, Confirmed, Prescription Rejected, Delivered
+    requires_prescription: bool = False
+    prescription_id: Optional[str] = None
+    prescription_data: Optional[str] = None  # inline data URL, only on orders not yet migrated
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class CreateOrderRequest(BaseModel):
@@ -152,7 +392,8 @@ class CreateOrderRequest(BaseModel):
     upi_id: Optional[str] = None
     delivery_address: str
     phone: str
-    prescription_data: Optional[str] = None
+    prescription_id: Optional[str] = None
+    prescription_data: Optional[str] = None  # deprecated inline data URL, stored as a prescription upload
 
 class ContactMessage(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -171,6 +412,11 @@ class ContactRequest(BaseModel):
     message: str
 
 
+# Trusted documents from Mongo skip per-item response validation
+product_serializer = DocumentSerializer(Product)
+order_serializer = DocumentSerializer(Order)
+
+
 # Health Check
 @api_router.get("/")
 async def root():
@@ -179,13 +425,14 @@ async def root():
 # Auth Routes
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
+    await admission.check_account("register", user_data.email)
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     
     # Create user
     user = User(
@@ -198,10 +445,13 @@ async def register(user_data: UserRegister):
     user_dict = user.model_dump()
     user_dict['created_at'] = user_dict['created_at'].isoformat()
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Generate token
-    access_token = create_access_token({"sub": user.id})
+    access_token = create_access_token(user_claims(user.model_dump()))
     
     return {
         "token": access_token,
@@ -214,18 +464,22 @@ async def register(user_data: UserRegister):
     }
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, background_tasks: BackgroundTasks):
+    await admission.check_account("login", credentials.email)
     # Find user
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Verify password
-    if not verify_password(credentials.password, user['password']):
+    if not await verify_password(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    if password_hasher.needs_rehash(user['password']):
+        background_tasks.add_task(rehash_password, user['id'], credentials.password)
+    
     # Generate token
-    access_token = create_access_token({"sub": user['id']})
+    access_token = create_access_token(user_claims(user))
     
     return {
         "token": access_token,
@@ -237,6 +491,17 @@ async def login(credentials: UserLogin):
         }
     }
 
+@api_router.post("/auth/logout")
+async def logout(payload: dict = Depends(get_token_payload)):
+    if "jti" in payload:
+        await auth_cache.revoke_token(db, payload)
+        invalidation_bus.publish("token_revoked", payload["jti"])
+    else:
+        # Tokens issued before jti existed can only be revoked all together
+        revoked_before = await auth_cache.revoke_user(db, payload["sub"], ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        invalidation_bus.publish("user_revoked", {"user_id": payload["sub"], "revoked_before": revoked_before})
+    return {"message": "Logged out"}
+
 @api_router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
     return {
@@ -249,27 +514,61 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 # Product Routes
 @api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, search: Optional[str] = None):
-    query = {}
-    if category:
-        query['category'] = category
+async def get_products(
+    request: Request,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PRODUCT_PAGE_SIZE, ge=1, le=1000),
+    fields: Optional[str] = None
+):
     if search:
-        query['name'] = {"$regex": search, "$options": "i"}
+        return product_serializer.many(search_index.search(search, category=category, limit=limit))
     
-    products = await db.products.find(query, {"_id": 0}).to_list(1000)
-    return products
+    try:
+        after = decode_cursor("products", cursor, len(PRODUCT_SORT)) if cursor else None
+        projection = parse_fields(fields, Product.model_fields, required=("id", "name"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def render():
+        products = await catalog.list_products(db, category, after=after, limit=limit + 1, projection=projection)
+        next_cursor = page_cursor("products", products, limit, PRODUCT_SORT)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        if projection:
+            return FastJSONResponse(products, headers=headers)
+        return product_serializer.many(products, headers=headers)
+    
+    key = cache_key("products", {"category": category, "cursor": cursor, "limit": limit,
+                                 "fields": ",".join(sorted(projection)) if projection else None})
+    version = await catalog.listing_version(db)
+    return await response_cache.respond(request, key, CACHE_POLICIES["products"], version, render,
+                                        ttl=LISTING_CACHE_TTL)
+
+@api_router.get("/products/search", response_model=List[Product])
+async def search_products(q: str, category: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    return product_serializer.many(search_index.search(q, category=category, limit=limit))
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+async def get_product(product_id: str, request: Request):
+    async def render():
+        product = await catalog.get_product(db, product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product_serializer.one(product)
+    
+    key = cache_key("product", {"id": product_id})
+    return await response_cache.respond(request, key, CACHE_POLICIES["product"], catalog.product_version(product_id),
+                                        render)
 
 @api_router.get("/categories")
-async def get_categories():
-    categories = await db.products.distinct("category")
-    return {"categories": categories}
+async def get_categories(request: Request):
+    async def render():
+        categories = await catalog.categories(db)
+        return FastJSONResponse({"categories": categories})
+    
+    version = await catalog.listing_version(db)
+    return await response_cache.respond(request, "categories", CACHE_POLICIES["categories"], version, render)
 
 
 # Cart Routes
@@ -279,82 +578,31 @@ async def get_cart(current_user: dict = Depends(get_current_user)):
     if not cart:
         return {"items": [], "total": 0}
     
-    # Fetch product details for each cart item
-    cart_items_with_details = []
-    total = 0
-    
-    for item in cart['items']:
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if product:
-            cart_items_with_details.append({
-                "product": product,
-                "quantity": item['quantity'],
-                "subtotal": product['price'] * item['quantity']
-            })
-            total += product['price'] * item['quantity']
+    # Fetch product details for all cart items in one query
+    cart_items_with_details = await resolve_cart_items(db, cart['items'])
+    total = cart_total(cart_items_with_details)
     
     return {"items": cart_items_with_details, "total": total}
 
 @api_router.post("/cart/add")
 async def add_to_cart(request: AddToCartRequest, current_user: dict = Depends(get_current_user)):
     # Check if product exists
-    product = await db.products.find_one({"id": request.product_id})
+    product = await catalog.get_product(db, request.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Get or create cart
-    cart = await db.carts.find_one({"user_id": current_user['id']})
-    
-    if not cart:
-        new_cart = Cart(
-            user_id=current_user['id'],
-            items=[CartItem(product_id=request.product_id, quantity=request.quantity)]
-        )
-        cart_dict = new_cart.model_dump()
-        cart_dict['updated_at'] = cart_dict['updated_at'].isoformat()
-        await db.carts.insert_one(cart_dict)
-    else:
-        # Check if product already in cart
-        item_found = False
-        for item in cart['items']:
-            if item['product_id'] == request.product_id:
-                item['quantity'] += request.quantity
-                item_found = True
-                break
-        
-        if not item_found:
-            cart['items'].append({"product_id": request.product_id, "quantity": request.quantity})
-        
-        cart['updated_at'] = datetime.now(timezone.utc).isoformat()
-        await db.carts.update_one(
-            {"user_id": current_user['id']},
-            {"$set": {"items": cart['items'], "updated_at": cart['updated_at']}}
-        )
+    try:
+        await add_item(db, current_user['id'], request.product_id, request.quantity, request.request_id)
+    except CartConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     return {"message": "Product added to cart"}
 
 @api_router.put("/cart/update")
 async def update_cart(request: UpdateCartRequest, current_user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user['id']})
-    if not cart:
+    if not await set_item_quantity(db, current_user['id'], request.product_id, request.quantity):
         raise HTTPException(status_code=404, detail="Cart not found")
     
-    if request.quantity <= 0:
-        # Remove item from cart
-        cart['items'] = [item for item in cart['items'] if item['product_id'] != request.product_id]
-    else:
-        # Update quantity
-        for item in cart['items']:
-            if item['product_id'] == request.product_id:
-                item['quantity'] = request.quantity
-                break
-    
-    cart['updated_at'] = datetime.now(timezone.utc).isoformat()
-    await db.carts.update_one(
-        {"user_id": current_user['id']},
-        {"$set": {"items": cart['items'], "updated_at": cart['updated_at']}}
-    )
-    
     return {"message": "Cart updated"}
 
 @api_router.delete("/cart/clear")
@@ -365,74 +613,196 @@ async def clear_cart(current_user: dict = Depends(get_current_user)):
 
 # Order Routes
 @api_router.post("/orders")
-async def create_order(request: CreateOrderRequest, current_user: dict = Depends(get_current_user)):
-    # Get user's cart
-    cart = await db.carts.find_one({"user_id": current_user['id']})
-    if not cart or not cart['items']:
-        raise HTTPException(status_code=400, detail="Cart is empty")
-    
-    # Calculate total and prepare order products
-    order_products = []
-    total_amount = 0
-    
-    for item in cart['items']:
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if product:
+async def create_order(request: CreateOrderRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    prescription_id = request.prescription_id
+    if prescription_id:
+        if not await find_prescription(db, prescription_id, current_user['id']):
+            raise HTTPException(status_code=400, detail="Prescription not found")
+    elif request.prescription_data:
+        # Older clients still send the file inline as a data URL
+        try:
+            content_type, data = decode_data_url(request.prescription_data)
+            prescription = await save_prescription(
+                prescription_store, db, current_user['id'], iter_bytes(data), content_type
+            )
+        except InvalidPrescription as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except BlobTooLarge:
+            raise HTTPException(status_code=413, detail="Prescription file is too large")
+        prescription_id = prescription['id']
+    
+    def build_order(resolved_items):
+        # Calculate total and prepare order products
+        order_products = []
+        total_amount = 0
+        
+        for item in resolved_items:
+            product = item['product']
             order_products.append(OrderProduct(
                 product_id=product['id'],
                 name=product['name'],
                 price=product['price'],
-                quantity=item['quantity']
+                quantity=item['quantity'],
+                category=product.get('category')
             ))
-            total_amount += product['price'] * item['quantity']
-    
-    # Create order
-    order = Order(
-        user_id=current_user['id'],
-        products=order_products,
-        total_amount=total_amount,
-        payment_method=request.payment_method,
-        upi_id=request.upi_id,
-        delivery_address=request.delivery_address,
-        phone=request.phone,
-        prescription_data=request.prescription_data
-    )
-    
-    order_dict = order.model_dump()
-    order_dict['created_at'] = order_dict['created_at'].isoformat()
-    
-    await db.orders.insert_one(order_dict)
-    
-    # Clear cart
-    await db.carts.delete_one({"user_id": current_user['id']})
+            total_amount += item['subtotal']
+        
+        order = Order(
+            user_id=current_user['id'],
+            products=order_products,
+            total_amount=total_amount,
+            payment_method=request.payment_method,
+            upi_id=request.upi_id,
+            delivery_address=request.delivery_address,
+            phone=request.phone,
+            prescription_id=prescription_id,
+            requires_prescription=any(item['product'].get('requires_prescription') for item in resolved_items)
+        )
+        
+        order_dict = order.model_dump()
+        order_dict['created_at'] = order_dict['created_at'].isoformat()
+        order_dict['rolled_up'] = False
+        return order_dict
     
-    return {"message": "Order placed successfully", "order_id": order.id}
+    # Reserve stock, insert the order and clear the cart as one unit
+    try:
+        order = await place_order(client, db, current_user['id'], build_order)
+    except EmptyCartError:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    # Stock changed for every ordered product
+    invalidate_products(product['product_id'] for product in order['products'])
+    # Add the order to the sales rollups after the response is sent
+    background_tasks.add_task(record_order_logged, db, order)
+    if order['requires_prescription']:
+        try:
+            await enqueue_review(prescription_workers, order)
+        except PyMongoError as e:
+            # the workers' sweep queues it later
+            logger.warning("Could not queue prescription review for order %s: %s", order['id'], e)
+    
+    return {"message": "Order placed successfully", "order_id": order['id']}
 
 @api_router.get("/orders", response_model=List[Order])
-async def get_orders(current_user: dict = Depends(get_current_user)):
-    orders = await db.orders.find({"user_id": current_user['id']}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+async def get_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(ORDER_PAGE_SIZE, ge=1, le=ORDER_MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        after = decode_cursor("orders", cursor, len(ORDER_SORT)) if cursor else None
+        projection = parse_fields(fields, Order.model_fields, required=("id", "created_at"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    query = {"user_id": current_user['id']}
+    if after:
+        query.update(keyset_filter(ORDER_SORT, after))
     
-    for order in orders:
-        if isinstance(order['created_at'], str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
+    orders = await read_db.orders.find(query, projection or ORDER_LIST_PROJECTION).sort(ORDER_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = page_cursor("orders", orders, limit, ORDER_SORT)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
     
-    return orders
+    if projection:
+        return FastJSONResponse(orders, headers=headers)
+    return order_serializer.many(orders, headers=headers)
 
 @api_router.get("/orders/{order_id}", response_model=Order)
 async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
-    order = await db.orders.find_one({"id": order_id, "user_id": current_user['id']}, {"_id": 0})
+    query = {"id": order_id, "user_id": current_user['id']}
+    # A just-placed order may not have reached the secondaries yet
+    order = await read_db.orders.find_one(query, {"_id": 0}) or await db.orders.find_one(query, {"_id": 0})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    if isinstance(order['created_at'], str):
-        order['created_at'] = datetime.fromisoformat(order['created_at'])
+    return order_serializer.one(order)
+
+
+# Prescription Routes
+@api_router.post("/prescriptions")
+async def upload_prescription(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    async def chunks():
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    try:
+        prescription = await save_prescription(
+            prescription_store, db, current_user['id'], chunks(), file.content_type, file.filename
+        )
+    except InvalidPrescription as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BlobTooLarge:
+        raise HTTPException(status_code=413, detail=f"Prescription file is larger than {MAX_PRESCRIPTION_BYTES} bytes")
+    
+    return {
+        "prescription_id": prescription['id'],
+        "size": prescription['size'],
+        "content_type": prescription['content_type']
+    }
+
+@api_router.get("/prescriptions/{prescription_id}")
+async def download_prescription(
+    prescription_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    variant: Optional[Literal["display", "thumbnail"]] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    prescription = await find_prescription(db, prescription_id, current_user['id'])
+    size = await prescription_store.size(prescription_id) if prescription else None
+    if size is None:
+        raise HTTPException(status_code=404, detail="Prescription not found")
+    
+    # Downscaled copies for display; PDFs and anything the pipeline cannot handle fall through to the original
+    if variant:
+        async def load():
+            return b"".join([chunk async for chunk in prescription_store.read(prescription_id)])
+        try:
+            images = await image_pipeline.process_stored(prescription_id, prescription['content_type'], load)
+        except InvalidImage:
+            images = None
+        if images is not None:
+            return Response(images[variant], media_type=images['content_type'], headers={
+                "ETag": f'"{images["key"]}-{variant}"',
+                "Cache-Control": "private, max-age=31536000, immutable"
+            })
     
-    return order
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{prescription_id}"',
+        "Cache-Control": "private, max-age=31536000, immutable"
+    }
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        status_code = 206
+    else:
+        start, end = 0, size - 1
+        status_code = 200
+    headers["Content-Length"] = str(end - start + 1)
+    
+    return StreamingResponse(
+        prescription_store.read(prescription_id, start, end),
+        status_code=status_code,
+        media_type=prescription['content_type'],
+        headers=headers
+    )
 
 
 # Contact Route
 @api_router.post("/contact")
 async def create_contact(request: ContactRequest):
+    await admission.check_account("contact", request.email)
     contact = ContactMessage(
         name=request.name,
         email=request.email,
@@ -443,21 +813,131 @@ async def create_contact(request: ContactRequest):
     contact_dict = contact.model_dump()
     contact_dict['created_at'] = contact_dict['created_at'].isoformat()
     
-    await db.contacts.insert_one(contact_dict)
+    try:
+        write_behind.put("contacts", contact_dict)
+    except WriteQueueFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "5"})
     
     return {"message": "Message sent successfully"}
 
 
+# Admin Report Routes
+REPORT_MAX_DAYS = 366
+
+def report_range(start: Optional[date], end: Optional[date]):
+    try:
+        start, end = day_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if date.fromisoformat(end) - date.fromisoformat(start) >= timedelta(days=REPORT_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Reports cover at most {REPORT_MAX_DAYS} days")
+    return start, end
+
+@api_router.get("/admin/reports/daily")
+async def get_daily_report(start: Optional[date] = None, end: Optional[date] = None, admin: dict = Depends(get_admin_user)):
+    start, end = report_range(start, end)
+    return FastJSONResponse({"start": start, "end": end, "days": await sales_rollups.daily(read_db, start, end)})
+
+@api_router.get("/admin/reports/revenue-by-category")
+async def get_revenue_by_category(start: Optional[date] = None, end: Optional[date] = None, admin: dict = Depends(get_admin_user)):
+    start, end = report_range(start, end)
+    rows = await sales_rollups.revenue_by_category(read_db, start, end)
+    return FastJSONResponse({"start": start, "end": end, "rows": rows})
+
+@api_router.get("/admin/reports/top-products")
+async def get_top_products(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    by: Literal["units", "revenue"] = "units",
+    limit: int = Query(10, ge=1, le=100),
+    admin: dict = Depends(get_admin_user)
+):
+    start, end = report_range(start, end)
+    products = await sales_rollups.top_products(read_db, start, end, limit=limit, by=by)
+    return FastJSONResponse({"start": start, "end": end, "by": by, "products": products})
+
+@api_router.get("/admin/reports/inventory")
+async def get_inventory_report(
+    days: int = Query(7, ge=1, le=90),
+    limit: int = Query(50, ge=1, le=500),
+    admin: dict = Depends(get_admin_user)
+):
+    return FastJSONResponse({"days": days, "products": await sales_rollups.inventory(read_db, days=days, limit=limit)})
+
+
+# Prescription Review Routes
+class ReviewDecision(BaseModel):
+    approved: bool
+    note: Optional[str] = None
+
+@api_router.get("/admin/prescription-reviews")
+async def get_prescription_reviews(limit: int = Query(50, ge=1, le=200), admin: dict = Depends(get_admin_user)):
+    return FastJSONResponse({"orders": await awaiting_review(db, limit)})
+
+@api_router.get("/admin/prescription-reviews/{order_id}/{variant}")
+async def get_prescription_image(order_id: str, variant: Literal["display", "thumbnail"], admin: dict = Depends(get_admin_user)):
+    images = await prescription_processor.images_for(order_id)
+    if images is None:
+        raise HTTPException(status_code=404, detail="Prescription image not found")
+    return Response(images[variant], media_type=images['content_type'],
+                    headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+@api_router.post("/admin/prescription-reviews/{order_id}")
+async def review_prescription(order_id: str, decision: ReviewDecision, admin: dict = Depends(get_admin_user)):
+    if not await decide(db, order_id, decision.approved, admin['email'], decision.note):
+        raise HTTPException(status_code=409, detail="Order is not awaiting prescription review")
+    return {"message": "Prescription approved" if decision.approved else "Prescription rejected"}
+
+@api_router.get("/admin/jobs")
+async def get_job_queues(admin: dict = Depends(get_admin_user)):
+    return FastJSONResponse({"queues": [
+        {**prescription_workers.stats(), "depth": await job_store.depth(PRESCRIPTION_QUEUE)}
+    ]})
+
+
+# Admin Export Routes
+@api_router.get("/admin/exports/{collection}")
+async def export_collection(
+    collection: Literal["orders", "contacts"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    include: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    try:
+        fields = export_fields(collection, include)
+        query = export_query(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"{collection}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(
+        export_stream(read_db, collection, fields, query, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Innermost, so shed requests still get CORS headers and are counted in the metrics
+app.add_middleware(AdmissionMiddleware, admission=admission)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+app.add_middleware(CompressionMiddleware, compressor=compressor)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Configure logging
 logging.basicConfig(
@@ -465,7 +945,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
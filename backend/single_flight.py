@@ -0,0 +1,71 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers asking for the same key.
+
+    The first caller for a key starts ``fn()`` as a task; callers arriving while
+    it runs await the same task instead of starting their own, and all of them
+    get its result or its exception. A caller that is cancelled stops waiting
+    without disturbing the others; the shared call is cancelled only when its
+    last waiter gives up. Nothing is remembered once a call completes, so this
+    coalesces concurrent work without caching it.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finished(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finished(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # mark the exception retrieved even if every waiter was cancelled
+            flight.task.exception()
+
+    def forget(self):
+        """Make later callers start fresh calls; the ones in flight finish for their current waiters."""
+        self._flights.clear()
+
+    def stats(self) -> dict:
+        requests = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalescing_ratio": self.coalesced / requests if requests else 0.0,
+            "in_flight": len(self._flights),
+        }
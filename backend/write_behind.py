@@ -0,0 +1,253 @@
+import asyncio
+import fcntl
+import logging
+import os
+import secrets
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 500
+FLUSH_INTERVAL = 1.0
+MAX_QUEUED = 10_000
+RETRY_DELAY = 5.0
+DUPLICATE_KEY = 11000
+# Documents Mongo refused (e.g. schema validation), one JSON line each, in the spill directory
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class _Segment:
+    """One append-only spill file and the documents accepted into it."""
+
+    def __init__(self, path: Path, fd: int):
+        self.path = path
+        self.fd = fd
+        self.documents: List[Tuple[str, dict]] = []
+        self.synced = False
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WriteBehindQueue:
+    """Accepts low-priority inserts immediately and writes them to Mongo in batches.
+
+    ``put`` appends the document to a spill file and to an in-memory queue and
+    returns; a background task turns the queue into ``insert_many`` calls every
+    ``flush_interval`` seconds, or as soon as ``max_batch`` documents are waiting.
+
+    The spill files make accepted documents survive a crash. Each flush rotates
+    to a new file and deletes the old one only once everything in it is stored,
+    so after a crash the files left behind hold exactly what may be missing.
+    ``start`` replays them. Documents get their ``_id`` when accepted, so a
+    replay of a batch that did reach Mongo inserts nothing twice. Every process
+    holds a lock on its own files, which lets serve.py workers share one spill
+    directory and pick up the files of a worker that died.
+
+    Appends are not fsynced; a rotated file is, before its first insert. So a
+    process crash loses nothing, but an OS crash or power loss can lose what
+    was accepted since the last rotation (up to ``flush_interval``). Documents
+    Mongo rejects for any reason but a duplicate ``_id`` are moved to
+    ``dead-letter.jsonl`` rather than retried, so they cannot hold up the queue.
+    """
+
+    def __init__(self, db, spill_dir: str, max_batch: int = MAX_BATCH, flush_interval: float = FLUSH_INTERVAL,
+                 max_queued: int = MAX_QUEUED):
+        self.db = db
+        self.spill_dir = Path(spill_dir)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queued = max_queued
+
+        self._segment: Optional[_Segment] = None
+        # unique per start, so a reused pid never appends to an orphaned file
+        self._prefix = ""
+        self._sequence = 0
+        # rotated segments whose documents are not all stored yet, oldest first
+        self._unflushed: Deque[_Segment] = deque()
+        self._queued = 0
+        self._wake = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.accepted = 0
+        self.rejected = 0
+        self.inserted = 0
+        self.batches = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+
+    # Request path
+
+    def put(self, collection: str, document: dict):
+        """Accept ``document`` for ``collection``; raises WriteQueueFull when the backlog is at its limit."""
+        if self._queued >= self.max_queued or self._segment is None:
+            self.rejected += 1
+            raise WriteQueueFull("Write-behind queue is full")
+        document.setdefault("_id", ObjectId())
+        os.write(self._segment.fd, (json_util.dumps({"c": collection, "d": document}) + "\n").encode())
+        self._segment.documents.append((collection, document))
+        self._queued += 1
+        self.accepted += 1
+        if len(self._segment.documents) >= self.max_batch:
+            self._wake.set()
+
+    # Lifecycle
+
+    async def start(self):
+        if self._flusher is not None:
+            return
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._adopt_orphans()
+        self._prefix = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._segment = self._open_segment()
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting documents and write out everything queued."""
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        self._flusher = None
+        self._rotate(reopen=False)
+        await self.flush()
+        for segment in self._unflushed:
+            logger.warning("Write-behind: %d documents left in %s for the next start",
+                           len(segment.documents), segment.path)
+            segment.close()
+        self._unflushed.clear()
+
+    def _open_segment(self) -> _Segment:
+        self._sequence += 1
+        path = self.spill_dir / f"{self._prefix}-{self._sequence:08d}.log"
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return _Segment(path, fd)
+
+    def _adopt_orphans(self):
+        """Queue the documents of spill files no live process holds: a previous crash."""
+        for path in sorted(self.spill_dir.glob("*.log")):
+            fd = os.open(path, os.O_RDWR | os.O_APPEND)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)  # a running worker's file
+                continue
+            segment = _Segment(path, fd)
+            with open(path, "rb") as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        entry = json_util.loads(line)
+                    except ValueError:
+                        # the last line of a crashed process may be cut short
+                        logger.warning("Write-behind: skipping unreadable line %d of %s", line_number, path)
+                        continue
+                    segment.documents.append((entry["c"], entry["d"]))
+            self._unflushed.append(segment)
+            self._queued += len(segment.documents)
+            self.replayed += len(segment.documents)
+            logger.info("Write-behind: replaying %d documents from %s", len(segment.documents), path)
+
+    # Flushing
+
+    def _rotate(self, reopen: bool = True):
+        """Hand the current spill file to the flusher and start a new one."""
+        segment, self._segment = self._segment, None
+        if segment.documents:
+            self._unflushed.append(segment)
+        else:
+            segment.close()
+            os.unlink(segment.path)
+        if reopen:
+            self._segment = self._open_segment()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._segment.documents:
+                self._rotate()
+            if not await self.flush():
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def flush(self) -> bool:
+        """Store every rotated segment, oldest first; False if Mongo failed and some remain."""
+        while self._unflushed:
+            segment = self._unflushed[0]
+            try:
+                if not segment.synced:
+                    await asyncio.to_thread(os.fsync, segment.fd)
+                    segment.synced = True
+                await self._insert(segment.documents)
+            except (PyMongoError, OSError) as e:
+                logger.warning("Write-behind flush failed, %d documents queued: %s", self._queued, e)
+                return False
+            self._queued -= len(segment.documents)
+            self._unflushed.popleft()
+            segment.close()
+            os.unlink(segment.path)
+        return True
+
+    async def _insert(self, documents: List[Tuple[str, dict]]):
+        by_collection = {}
+        for collection, document in documents:
+            by_collection.setdefault(collection, []).append(document)
+        for collection, batch in by_collection.items():
+            for start in range(0, len(batch), self.max_batch):
+                chunk = batch[start:start + self.max_batch]
+                try:
+                    await self.db[collection].insert_many(chunk, ordered=False)
+                    self.inserted += len(chunk)
+                except BulkWriteError as e:
+                    if e.details.get("writeConcernErrors"):
+                        raise  # not known to be stored; the whole segment is retried
+                    # duplicates were stored by a flush that crashed before deleting its spill file;
+                    # anything else will fail the same way on every retry
+                    refused = [error for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY]
+                    if refused:
+                        await asyncio.to_thread(self._dead_letter, collection, chunk, refused)
+                    self.inserted += e.details["nInserted"]
+                self.batches += 1
+
+    def _dead_letter(self, collection: str, chunk: List[dict], errors: List[dict]):
+        """Append the refused documents of ``chunk`` to the dead-letter file; blocking."""
+        lines = "".join(
+            json_util.dumps({"c": collection, "d": chunk[error["index"]], "code": error["code"],
+                             "error": error.get("errmsg")}) + "\n"
+            for error in errors
+        )
+        fd = os.open(self.spill_dir / DEAD_LETTER_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, lines.encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.dead_lettered += len(errors)
+        logger.error("Write-behind: %d documents refused by %s moved to %s", len(errors), collection,
+                     self.spill_dir / DEAD_LETTER_FILE)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queued,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "inserted": self.inserted,
+            "batches": self.batches,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+        }
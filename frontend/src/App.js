@@ -75,6 +75,11 @@ function App() {
   };
 
   const logout = () => {
+    // Revoke the token server-side; the local session ends either way
+    const token = localStorage.getItem('token');
+    if (token) {
+      axiosInstance.post('/auth/logout', null, { headers: { Authorization: `Bearer ${token}` } }).catch(() => {});
+    }
     localStorage.removeItem('token');
     setUser(null);
     setCartCount(0);
@@ -9,6 +9,11 @@ import { RadioGroup, RadioGroupItem } from '@/components/ui/radio-group';
 import { toast } from 'sonner';
 import { axiosInstance } from '../App';
 
+// What POST /prescriptions accepts (backend/prescriptions.py ALLOWED_CONTENT_TYPES)
+const PRESCRIPTION_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'image/heic', 'image/heif', 'application/pdf'];
+const PRESCRIPTION_ACCEPT = `${PRESCRIPTION_TYPES.join(',')},.heic,.pdf`;
+const UNSUPPORTED_PRESCRIPTION = 'Unsupported file type. Upload a JPG, PNG, WebP, HEIC or PDF prescription.';
+
 const Checkout = ({ onCartUpdate }) => {
   const navigate = useNavigate();
   const [cart, setCart] = useState({ items: [], total: 0 });
@@ -41,6 +46,13 @@ const Checkout = ({ onCartUpdate }) => {
   const handleFileChange = (e) => {
     const file = e.target.files[0];
     if (file) {
+      // some browsers leave HEIC files without a type; the upload decides for those
+      if (file.type && !PRESCRIPTION_TYPES.includes(file.type)) {
+        toast.error(UNSUPPORTED_PRESCRIPTION);
+        e.target.value = '';
+        setPrescriptionFile(null);
+        return;
+      }
       setPrescriptionFile(file);
     }
   };
@@ -58,14 +70,24 @@ const Checkout = ({ onCartUpdate }) => {
     
     setSubmitting(true);
     try {
-      let prescriptionData = null;
+      let prescriptionId = null;
       if (prescriptionFile) {
-        // Convert file to base64
-        const reader = new FileReader();
-        prescriptionData = await new Promise((resolve) => {
-          reader.onloadend = () => resolve(reader.result);
-          reader.readAsDataURL(prescriptionFile);
-        });
+        // Upload the file as-is; the order only keeps a reference to it
+        const upload = new FormData();
+        upload.append('file', prescriptionFile);
+        try {
+          const uploadResponse = await axiosInstance.post('/prescriptions', upload);
+          prescriptionId = uploadResponse.data.prescription_id;
+        } catch (error) {
+          if (error.response?.status !== 400) {
+            throw error;
+          }
+          // nothing was ordered yet: let the shopper pick another file or order without one
+          const detail = error.response.data?.detail;
+          toast.error(!detail || detail.startsWith('Unsupported') ? UNSUPPORTED_PRESCRIPTION : detail);
+          setPrescriptionFile(null);
+          return;
+        }
       }
 
       const orderData = {
@@ -73,7 +95,7 @@ const Checkout = ({ onCartUpdate }) => {
         upi_id: paymentMethod === 'UPI' ? formData.upi_id : null,
         delivery_address: formData.delivery_address,
         phone: formData.phone,
-        prescription_data: prescriptionData,
+        prescription_id: prescriptionId,
       };
 
       const response = await axiosInstance.post('/orders', orderData);
@@ -205,13 +227,13 @@ const Checkout = ({ onCartUpdate }) => {
                           <p className="text-sm text-yellow-700">
                             {prescriptionFile ? prescriptionFile.name : 'Click to upload prescription'}
                           </p>
-                          <p className="text-xs text-yellow-600 mt-1">PDF, JPG, PNG (Max 5MB)</p>
+                          <p className="text-xs text-yellow-600 mt-1">PDF, JPG, PNG, WebP, HEIC (Max 5MB)</p>
                         </div>
                       </label>
                       <input
                         id="prescription"
                         type="file"
-                        accept="image/*,.pdf"
+                        accept={PRESCRIPTION_ACCEPT}
                         onChange={handleFileChange}
                         className="hidden"
                         data-testid="prescription-file-input"
@@ -7,15 +7,19 @@ import { toast } from 'sonner';
 const MyOrders = () => {
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchOrders();
   }, []);
 
-  const fetchOrders = async () => {
+  const fetchOrders = async (cursor = null) => {
     try {
-      const response = await axiosInstance.get('/orders');
-      setOrders(response.data);
+      const params = cursor ? { cursor } : {};
+      const response = await axiosInstance.get('/orders', { params });
+      setOrders((previous) => (cursor ? [...previous, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Failed to fetch orders:', error);
       toast.error('Failed to load orders');
@@ -24,6 +28,12 @@ const MyOrders = () => {
     }
   };
 
+  const loadMoreOrders = async () => {
+    setLoadingMore(true);
+    await fetchOrders(nextCursor);
+    setLoadingMore(false);
+  };
+
   const getStatusColor = (status) => {
     switch (status) {
       case 'Pending':
@@ -118,6 +128,19 @@ const MyOrders = () => {
             </Link>
           ))}
         </div>
+
+        {nextCursor && (
+          <div className="text-center mt-8">
+            <button
+              onClick={loadMoreOrders}
+              disabled={loadingMore}
+              className="bg-white border-2 border-green-600 text-green-600 px-8 py-3 rounded-full font-semibold hover:bg-green-50 transition-colors disabled:opacity-50"
+              data-testid="load-more-orders-button"
+            >
+              {loadingMore ? 'Loading...' : 'Load More Orders'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
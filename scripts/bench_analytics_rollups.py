@@ -0,0 +1,162 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from benchlib import MONGO_URL, DB_NAME, percentile
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import server
+from analytics import SalesRollups, rebuild, record_order
+from indexes import ensure_indexes
+
+ORDERS = 5_000_000
+DAYS = 90
+PRODUCTS = 2000
+CATEGORIES = ["Medicines", "Vitamins & Supplements", "Personal Care", "Baby Care",
+              "Ayurveda", "Diabetes Care", "Devices", "First Aid"]
+INSERT_BATCH = 10_000
+ITERATIONS = 10
+INCREMENTAL_ORDERS = 1000
+
+
+def catalog():
+    rng = random.Random(1)
+    return [{"id": str(uuid.uuid4()), "name": f"Product {i:04d}", "category": CATEGORIES[i % len(CATEGORIES)],
+             "price": round(rng.uniform(20, 900), 2)} for i in range(PRODUCTS)]
+
+
+def orders(products, first_day):
+    """``ORDERS`` orders spread over ``DAYS`` days ending the day before today, 1-5 lines each."""
+    rng = random.Random(2)
+    seconds = DAYS * 86400
+    for i in range(ORDERS):
+        lines = [{"product_id": product["id"], "name": product["name"], "price": product["price"],
+                  "quantity": rng.randint(1, 3), "category": product["category"]}
+                 for product in rng.sample(products, rng.randint(1, 5))]
+        created_at = first_day + timedelta(seconds=i * seconds // ORDERS)
+        yield {
+            "id": str(uuid.uuid4()), "user_id": f"bench-user-{i % 50_000}", "products": lines,
+            "total_amount": round(sum(line["price"] * line["quantity"] for line in lines), 2),
+            "payment_method": "COD", "delivery_address": "12 Bench Road, Mumbai", "phone": "+919800000000",
+            "status": "Pending", "created_at": created_at.isoformat(), "rolled_up": True,
+        }
+
+
+def after(day: str) -> str:
+    return (datetime.fromisoformat(day) + timedelta(days=1)).date().isoformat()
+
+
+# The ad-hoc reports: the same answers computed from the orders themselves
+
+async def adhoc_daily(db, start, end):
+    return await db.orders.aggregate([
+        {"$match": {"created_at": {"$gte": start, "$lt": after(end)}}},
+        {"$group": {"_id": {"$substrCP": ["$created_at", 0, 10]}, "orders": {"$sum": 1},
+                    "units": {"$sum": {"$sum": "$products.quantity"}}, "revenue": {"$sum": "$total_amount"}}},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True).to_list(None)
+
+
+async def adhoc_revenue_by_category(db, start, end):
+    return await db.orders.aggregate([
+        {"$match": {"created_at": {"$gte": start, "$lt": after(end)}}},
+        {"$unwind": "$products"},
+        {"$group": {"_id": {"day": {"$substrCP": ["$created_at", 0, 10]}, "category": "$products.category"},
+                    "units": {"$sum": "$products.quantity"},
+                    "revenue": {"$sum": {"$multiply": ["$products.price", "$products.quantity"]}}}},
+        {"$sort": {"_id.day": 1, "revenue": -1}},
+    ], allowDiskUse=True).to_list(None)
+
+
+async def adhoc_top_products(db, start, end, limit=10):
+    return await db.orders.aggregate([
+        {"$match": {"created_at": {"$gte": start, "$lt": after(end)}}},
+        {"$unwind": "$products"},
+        {"$group": {"_id": "$products.product_id", "units": {"$sum": "$products.quantity"}}},
+        {"$sort": {"units": -1, "_id": 1}},
+        {"$limit": limit},
+    ], allowDiskUse=True).to_list(limit)
+
+
+async def measure(label, fn):
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<44} rows={len(result):5d}  p50={percentile(samples, 50):10.2f}ms  p99={percentile(samples, 99):10.2f}ms")
+    return result
+
+
+async def bench_analytics_rollups():
+    db = server.db
+    await ensure_indexes(db)
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = today - timedelta(days=DAYS)
+
+    if await db.orders.estimated_document_count() != ORDERS:
+        print(f"Seeding {ORDERS:,} orders over {DAYS} days...")
+        await db.orders.delete_many({})
+        products = catalog()
+        await db.products.delete_many({})
+        await db.products.insert_many([{**product, "description": "Analytics benchmark", "image_url": "",
+                                        "stock": 10_000, "requires_prescription": False} for product in products])
+        start = time.perf_counter()
+        batch = []
+        for order in orders(products, first_day):
+            batch.append(order)
+            if len(batch) == INSERT_BATCH:
+                await db.orders.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await db.orders.insert_many(batch, ordered=False)
+        print(f"  seeded in {time.perf_counter() - start:.0f}s")
+
+    start = time.perf_counter()
+    result = await rebuild(db)
+    print(f"rebuild from scratch: {time.perf_counter() - start:.1f}s, {result['days']} days, "
+          f"{result['product_rows']:,} day x category x product rows")
+
+    rollups = SalesRollups()
+    end = (today - timedelta(days=1)).date().isoformat()
+    for days in (7, 30, DAYS):
+        start_day = (today - timedelta(days=days)).date().isoformat()
+        print(f"\n{days}-day window ({start_day} .. {end}), {ITERATIONS} runs each")
+        adhoc = await measure("ad-hoc daily totals over orders", lambda: adhoc_daily(db, start_day, end))
+        rolled = await measure("rollup daily totals", lambda: rollups.daily(db, start_day, end))
+        assert [row["orders"] for row in adhoc] == [row["orders"] for row in rolled]
+        await measure("ad-hoc revenue by category per day", lambda: adhoc_revenue_by_category(db, start_day, end))
+        await measure("rollup revenue by category per day", lambda: rollups.revenue_by_category(db, start_day, end))
+        adhoc = await measure("ad-hoc top 10 products by units", lambda: adhoc_top_products(db, start_day, end))
+        rolled = await measure("rollup top 10 products by units", lambda: rollups.top_products(db, start_day, end))
+        assert [row["units"] for row in adhoc] == [row["units"] for row in rolled]
+
+    # What the rollups cost at order time: claim the order, then two upserting bulk writes
+    products = await db.products.find({}, {"_id": 0}).limit(PRODUCTS).to_list(None)
+    placed = []
+    for _ in range(INCREMENTAL_ORDERS):
+        lines = [{"product_id": product["id"], "name": product["name"], "price": product["price"], "quantity": 1,
+                  "category": product["category"]} for product in random.sample(products, 3)]
+        placed.append({"id": str(uuid.uuid4()), "products": lines, "total_amount": sum(line["price"] for line in lines),
+                       "created_at": datetime.now(timezone.utc).isoformat(), "rolled_up": False})
+    await db.orders.insert_many([dict(order) for order in placed])
+    samples = []
+    for order in placed:
+        start = time.perf_counter()
+        await record_order(db, order)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"\nincremental rollup per order: p50={percentile(samples, 50):.2f}ms  p99={percentile(samples, 99):.2f}ms")
+
+    await db.orders.delete_many({"id": {"$in": [order["id"] for order in placed]}})
+    await db.sales_by_product.delete_many({"day": {"$gte": today.date().isoformat()}})
+    await db.sales_by_day.delete_many({"day": {"$gte": today.date().isoformat()}})
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench_analytics_rollups())
@@ -0,0 +1,44 @@
+import asyncio
+import uuid
+
+from benchlib import MONGO_URL, DB_NAME, time_async, report
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from cart_pricing import resolve_cart_items
+
+CART_SIZES = [1, 10, 50, 200]
+ITERATIONS = 200
+
+
+async def per_item_lookup(db, items):
+    resolved = []
+    for item in items:
+        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
+        if product:
+            resolved.append({"product": product, "quantity": item['quantity']})
+    return resolved
+
+
+async def bench_cart_lookup():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    await db.products.delete_many({})
+    products = [
+        {"id": str(uuid.uuid4()), "name": f"Product {i}", "description": "Benchmark product",
+         "price": 10.0 + i, "image_url": "", "category": "Bench", "stock": 1000}
+        for i in range(max(CART_SIZES))
+    ]
+    await db.products.insert_many(products)
+    await db.products.create_index("id", unique=True)
+
+    for size in CART_SIZES:
+        items = [{"product_id": p['id'], "quantity": 1} for p in products[:size]]
+        report(f"cart={size:<4} find_one per item", await time_async(lambda: per_item_lookup(db, items), ITERATIONS))
+        report(f"cart={size:<4} batched $in", await time_async(lambda: resolve_cart_items(db, items), ITERATIONS))
+
+    await db.products.drop()
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(bench_cart_lookup())
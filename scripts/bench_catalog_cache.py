@@ -0,0 +1,72 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+
+CATALOG_SIZE = 500
+REQUESTS = 3000
+CONCURRENCY = 50
+CATEGORIES = ["Medicines", "Vitamins & Supplements", "Personal Care", "Baby Care", "First Aid"]
+
+
+async def run_load(http, product_ids):
+    paths = (
+        ["/api/products"] +
+        [f"/api/products?category={category}" for category in CATEGORIES] +
+        ["/api/categories"]
+    )
+    queue = asyncio.Queue()
+    for _ in range(REQUESTS):
+        if random.random() < 0.5:
+            queue.put_nowait(f"/api/products/{random.choice(product_ids)}")
+        else:
+            queue.put_nowait(random.choice(paths))
+
+    async def worker():
+        while not queue.empty():
+            path = queue.get_nowait()
+            response = await http.get(path)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return REQUESTS / (time.perf_counter() - start)
+
+
+async def bench_catalog_cache():
+    db = server.db
+    await db.products.delete_many({})
+    products = [
+        {"id": str(uuid.uuid4()), "name": f"Product {i}", "description": "Benchmark product",
+         "price": 10.0 + i, "image_url": "https://images.unsplash.com/photo-1584308666744-24d5c474f2ae?w=500",
+         "category": CATEGORIES[i % len(CATEGORIES)], "stock": 100}
+        for i in range(CATALOG_SIZE)
+    ]
+    await db.products.insert_many(products)
+    product_ids = [product['id'] for product in products]
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for enabled in (False, True):
+            server.catalog.enabled = enabled
+            server.catalog.invalidate()
+            server.catalog.hits = server.catalog.misses = 0
+            rate = await run_load(http, product_ids)
+            stats = server.catalog.stats()
+            print(f"cache={'on ' if enabled else 'off'} {rate:8.1f} req/s  hits={stats['hits']} misses={stats['misses']}")
+
+    await db.products.drop()
+    server.client.close()
+
+if __name__ == "__main__":
+    asyncio.run(bench_catalog_cache())
@@ -0,0 +1,83 @@
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import server
+from catalog_import import CatalogImport, read_rows
+from catalog_models import Product
+
+ROWS = 100_000
+CHANGED_SHARE = 0.05
+TARGET_ROWS_PER_SEC = 50_000
+CATEGORIES = ["Medicines", "Vitamins & Supplements", "Personal Care", "Medical Devices", "Baby Care", "First Aid"]
+IMAGE_URL = "https://images.unsplash.com/photo-1584308666744-24d5c474f2ae?w=500"
+
+
+def feed_row(i, rng, price_bump=0.0):
+    return {"sku": f"DIST-{i:07d}", "name": f"Product {i:07d}", "description": "Distributor feed product",
+            "price": round(10 + i % 500 + price_bump, 2), "image_url": IMAGE_URL,
+            "category": CATEGORIES[i % len(CATEGORIES)], "stock": 100 + i % 50,
+            "requires_prescription": i % 9 == 0}
+
+
+def write_feed(path, fmt, changed=()):
+    rng = random.Random(1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = None
+        for i in range(ROWS):
+            row = feed_row(i, rng, 1.0 if i in changed else 0.0)
+            if fmt == "jsonl":
+                f.write(json.dumps(row) + "\n")
+            else:
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+
+
+async def timed_import(label, path, fmt, mode, prune=False):
+    start = time.perf_counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        stats = await CatalogImport(server.db, Product, mode=mode, prune=prune).run(read_rows(f, fmt))
+    elapsed = time.perf_counter() - start
+    rate = stats.read / elapsed
+    marker = "ok" if rate >= TARGET_ROWS_PER_SEC else "below target"
+    print(f"{label:<34} {elapsed:6.2f}s {rate:10,.0f} rows/s [{marker}]  {stats}")
+
+
+async def bench_catalog_import():
+    db = server.db
+    await db.products.drop()
+    changed = set(random.Random(2).sample(range(ROWS), int(ROWS * CHANGED_SHARE)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("jsonl", "csv"):
+            initial = os.path.join(tmp, f"initial.{fmt}")
+            updated = os.path.join(tmp, f"updated.{fmt}")
+            write_feed(initial, fmt)
+            write_feed(updated, fmt, changed)
+
+            await db.products.drop()
+            print(f"\n{ROWS:,} rows, {fmt}")
+            await timed_import("upsert into empty catalog", initial, fmt, "upsert")
+            await timed_import("upsert, nothing changed", initial, fmt, "upsert")
+            await timed_import(f"upsert, {CHANGED_SHARE:.0%} changed", updated, fmt, "upsert")
+            await timed_import("swap (staging + rename)", initial, fmt, "swap")
+
+    await db.products.drop()
+    server.client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(bench_catalog_import()))
@@ -0,0 +1,72 @@
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import benchlib  # noqa: F401 - puts backend/ on sys.path
+from benchlib import percentile
+
+from compression import Compressor, brotli
+from responses import dumps
+
+GZIP_LEVELS = [1, 6, 9]
+BROTLI_QUALITIES = [1, 4, 8, 11]
+ITERATIONS = 30
+
+IMAGE_URL = ("https://images.unsplash.com/photo-1584308666744-24d5c474f2ae?crop=entropy&cs=srgb&fm=jpg"
+             "&ixid=M3w3NTY2Nzd8MHwxfHNlYXJjaHwxfHxtZWRpY2luZXxlbnwwfHx8fDE3MDAwMDAwMDB8MA&ixlib=rb-4.0.3&q=85")
+
+
+def product_list(count=1000):
+    return [
+        {"id": str(uuid.uuid4()), "name": f"Paracetamol 500mg Tablet {i}",
+         "description": "Relieves mild to moderate pain and reduces fever. Strip of 15 tablets.",
+         "price": 25.0 + i % 300, "image_url": IMAGE_URL, "category": "Pain Relief",
+         "stock": 100 + i % 50, "requires_prescription": i % 7 == 0}
+        for i in range(count)
+    ]
+
+
+def order_history(count=200):
+    now = datetime.now(timezone.utc)
+    return [
+        {"id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()),
+         "products": [{"product_id": str(uuid.uuid4()), "name": f"Vitamin C 1000mg {j}", "price": 120.0, "quantity": 2}
+                      for j in range(4)],
+         "total_amount": 960.0, "payment_method": "UPI", "upi_id": "shopper@upi",
+         "delivery_address": "12 MG Road, Bengaluru, Karnataka 560001", "phone": "9876543210",
+         "status": "Delivered", "prescription_id": None, "created_at": (now - timedelta(days=i)).isoformat()}
+        for i in range(count)
+    ]
+
+
+def cpu_ms(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time()
+        fn()
+        samples.append((time.process_time() - start) * 1000)
+    return samples
+
+
+def bench_compression():
+    payloads = [("products x1000", dumps(product_list())), ("orders x200", dumps(order_history()))]
+    settings = [("gzip", level) for level in GZIP_LEVELS]
+    if brotli is not None:
+        settings += [("br", quality) for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli not installed; gzip only")
+
+    for label, body in payloads:
+        print(f"\n{label}: {len(body) / 1024:.1f} KiB uncompressed")
+        for encoding, level in settings:
+            compressor = Compressor(gzip_level=level, brotli_quality=level)
+            compressed = compressor.compress(body, encoding)
+            samples = cpu_ms(lambda: compressor.compress(body, encoding), ITERATIONS)
+            print(f"  {encoding:<4} level={level:<3} {len(compressed) / 1024:8.1f} KiB "
+                  f"ratio={len(body) / len(compressed):5.1f}x  cpu p50={percentile(samples, 50):7.2f}ms "
+                  f"p99={percentile(samples, 99):7.2f}ms")
+    print("\nPrecompressed catalog responses pay this cost once per catalog version instead of per request.")
+
+
+if __name__ == "__main__":
+    bench_compression()
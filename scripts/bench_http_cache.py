@@ -0,0 +1,110 @@
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+from metrics import BACKGROUND
+
+PRODUCTS = 2000
+CATEGORIES = ["Pain Relief", "Vitamins", "Cold & Flu", "Diabetes", "First Aid", "Skin Care"]
+SESSIONS = 20
+NAVIGATIONS = 50
+
+
+class BrowserCache:
+    """Keeps the last ETag and body per URL and revalidates with If-None-Match, like a browser."""
+
+    def __init__(self, revalidate):
+        self.revalidate = revalidate
+        self.entries = {}
+
+    async def get(self, http, url):
+        headers = {}
+        cached = self.entries.get(url)
+        if self.revalidate and cached:
+            headers["If-None-Match"] = cached[0]
+        response = await http.get(url, headers=headers)
+        if response.status_code == 304:
+            return cached[1], response.num_bytes_downloaded
+        if "etag" in response.headers:
+            self.entries[url] = (response.headers["etag"], response.content)
+        return response.content, response.num_bytes_downloaded
+
+
+async def browse(http, rng, revalidate, product_ids):
+    """One shopper clicking around: category pages, product pages, back to the listing."""
+    browser = BrowserCache(revalidate)
+    transferred = 0
+    for _ in range(NAVIGATIONS):
+        page = rng.random()
+        if page < 0.2:
+            url = "/api/categories"
+        elif page < 0.6:
+            url = f"/api/products?limit=50&category={rng.choice(CATEGORIES)}"
+        else:
+            url = f"/api/products/{rng.choice(product_ids[:200])}"
+        _, size = await browser.get(http, url)
+        transferred += size
+    return transferred
+
+
+def request_commands():
+    return sum(count for (route, _, _), count in server.metrics.commands.items() if route != BACKGROUND)
+
+
+async def run(label, revalidate, cache_enabled, product_ids):
+    server.response_cache.enabled = cache_enabled
+    server.response_cache.clear()
+    server.catalog.invalidate()
+    commands_before = request_commands()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        transferred = sum(await asyncio.gather(*(
+            browse(http, random.Random(session), revalidate, product_ids) for session in range(SESSIONS)
+        )))
+
+    requests = SESSIONS * NAVIGATIONS
+    commands = request_commands() - commands_before
+    print(f"{label:<34} {transferred / 1024:10.1f} KiB  {commands:6d} mongo commands  "
+          f"({commands / requests:.2f}/request)  {server.response_cache.not_modified} x 304")
+    server.response_cache.not_modified = 0
+    return transferred, commands
+
+
+async def bench_http_cache():
+    db = server.db
+    await db.products.delete_many({})
+    now = datetime.now(timezone.utc).isoformat()
+    products = [
+        {"id": str(uuid.uuid4()), "name": f"Product {i:05d}", "description": "HTTP cache benchmark product " * 4,
+         "price": 10.0 + i, "image_url": "https://example.com/p.png", "category": CATEGORIES[i % len(CATEGORIES)],
+         "stock": 100, "updated_at": now}
+        for i in range(PRODUCTS)
+    ]
+    await db.products.insert_many(products)
+    product_ids = [product["id"] for product in products]
+
+    print(f"{SESSIONS} sessions x {NAVIGATIONS} navigations")
+    before = await run("no validators", revalidate=False, cache_enabled=False, product_ids=product_ids)
+    after = await run("ETag + shared response cache", revalidate=True, cache_enabled=True, product_ids=product_ids)
+    print(f"bandwidth saved: {1 - after[0] / before[0]:.1%}, "
+          f"mongo commands saved: {before[1] - after[1]} ({1 - after[1] / before[1] if before[1] else 0:.1%})")
+
+    await db.products.drop()
+    server.client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(bench_http_cache()))
@@ -0,0 +1,97 @@
+import asyncio
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import benchlib  # noqa: F401 - puts backend/ on sys.path
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from image_pipeline import ImagePipeline
+
+IMAGES = 24
+# A 12MP phone photo, shot in portrait and stored sideways with an EXIF orientation tag
+WIDTH, HEIGHT = 4032, 3024
+JPEG_QUALITY = 92
+ORIENTATION_TAG = 0x0112
+
+
+def phone_photo(seed: int) -> bytes:
+    """A synthetic prescription photo: paper texture, handwriting-like strokes and sensor noise."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (WIDTH, HEIGHT), (rng.randint(215, 245),) * 3)
+    draw = ImageDraw.Draw(image)
+    for _ in range(400):
+        x, y = rng.randrange(WIDTH), rng.randrange(HEIGHT)
+        draw.line([(x, y), (x + rng.randint(-300, 300), y + rng.randint(-40, 40))],
+                  fill=(rng.randint(0, 80), rng.randint(0, 80), rng.randint(60, 140)), width=rng.randint(3, 9))
+    noise = Image.effect_noise((WIDTH, HEIGHT), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15).filter(ImageFilter.GaussianBlur(0.8))
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=JPEG_QUALITY, exif=exif)
+    return output.getvalue()
+
+
+async def loop_lag(samples: list, stop: asyncio.Event):
+    """How late a 10ms timer fires: the event loop's responsiveness while images are processed."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append((time.perf_counter() - start - 0.01) * 1000)
+
+
+async def run(photos, workers, fmt):
+    cache_dir = tempfile.mkdtemp(prefix="image-cache-bench-")
+    pipeline = ImagePipeline(cache_dir, workers=workers, fmt=fmt)
+    await pipeline.start()
+    try:
+        # warm the worker processes so their start-up is not timed
+        await asyncio.gather(*(pipeline.process(phone_photo(-n), "image/jpeg") for n in range(workers)))
+        pipeline.processed = pipeline.bytes_in = pipeline.bytes_out = 0
+
+        lag, stop = [], asyncio.Event()
+        ticker = asyncio.create_task(loop_lag(lag, stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(pipeline.process(photo, "image/jpeg") for photo in photos))
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(pipeline.process(photo, "image/jpeg") for photo in photos))
+        cached = time.perf_counter() - start
+        stop.set()
+        await ticker
+        return elapsed, cached, max(lag), pipeline.stats(), results
+    finally:
+        await pipeline.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+async def bench_image_pipeline():
+    print(f"Generating {IMAGES} {WIDTH}x{HEIGHT} JPEG photos...")
+    photos = [phone_photo(n) for n in range(IMAGES)]
+    total_in = sum(map(len, photos))
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{IMAGES} photos, {total_in / IMAGES / 1024:.0f} KiB each on average, {cores} cores available")
+    print(f"{'format':<7}{'workers':>8}{'images/s':>10}{'per core':>10}{'cached/s':>10}{'display KiB':>13}"
+          f"{'thumb KiB':>11}{'saved':>8}{'max loop lag':>14}")
+    for fmt in ("WEBP", "JPEG"):
+        for workers in sorted({1, 2, cores}):
+            elapsed, cached, lag, stats, results = await run(photos, workers, fmt)
+            display = sum(len(result["display"]) for result in results) / IMAGES / 1024
+            thumbnail = sum(len(result["thumbnail"]) for result in results) / IMAGES / 1024
+            rate = IMAGES / elapsed
+            print(f"{fmt:<7}{workers:>8}{rate:>10.1f}{rate / min(workers, cores):>10.1f}{IMAGES / cached:>10.0f}"
+                  f"{display:>13.0f}{thumbnail:>11.1f}{stats['bytes_saved'] / stats['bytes_in']:>8.0%}{lag:>12.1f}ms")
+
+    with Image.open(io.BytesIO(results[0]["display"])) as image:
+        print(f"output: {image.size[0]}x{image.size[1]} {image.format}, EXIF "
+              f"{'kept' if image.getexif() else 'stripped'} (portrait, so the orientation tag was applied)")
+
+
+if __name__ == "__main__":
+    asyncio.run(bench_image_pipeline())
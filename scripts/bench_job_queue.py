@@ -0,0 +1,60 @@
+import asyncio
+import os
+import time
+
+from benchlib import MONGO_URL, DB_NAME, percentile
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import server
+from indexes import ensure_indexes
+from job_queue import JobWorkers, MemoryJobStore, MongoJobStore
+
+JOBS = 5000
+HANDLER_MS = 5  # simulated processing time per job
+FAILURE_EVERY = 50  # one job in this many fails once and is retried
+
+
+async def run(store, concurrency):
+    """Enqueue ``JOBS`` jobs up front and time the workers draining them."""
+    latencies = []
+    failed = set()
+
+    async def handler(payload):
+        await asyncio.sleep(HANDLER_MS / 1000)
+        if payload["n"] % FAILURE_EVERY == 0 and payload["n"] not in failed:
+            failed.add(payload["n"])
+            raise RuntimeError("transient failure")
+        latencies.append((time.time() - payload["enqueued"]) * 1000)
+
+    workers = JobWorkers(store, "bench", handler, concurrency=concurrency, poll_interval=0.05, backoff_base=0.05,
+                         backoff_max=0.1)
+    for n in range(JOBS):
+        await store.enqueue("bench", {"n": n, "enqueued": time.time()}, priority=n % 3)
+    start = time.perf_counter()
+    workers.start()
+    while len(latencies) < JOBS:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    await workers.stop()
+    return elapsed, latencies, workers.stats()
+
+
+async def bench_job_queue():
+    db = server.db
+    await ensure_indexes(db)
+    print(f"{JOBS:,} jobs of {HANDLER_MS}ms, 1 in {FAILURE_EVERY} retried once")
+    print(f"{'store':<8}{'workers':>8}{'jobs/s':>10}{'latency p50':>14}{'p99':>10}{'retried':>9}")
+    for label, make_store in (("memory", MemoryJobStore), ("mongo", lambda: MongoJobStore(db))):
+        for concurrency in (1, 4, 16, 64):
+            await db.jobs.delete_many({"queue": "bench"})
+            elapsed, latencies, stats = await run(make_store(), concurrency)
+            print(f"{label:<8}{concurrency:>8}{JOBS / elapsed:>10,.0f}{percentile(latencies, 50):>12.0f}ms"
+                  f"{percentile(latencies, 99):>8.0f}ms{stats['retried']:>9}")
+    await db.jobs.delete_many({"queue": "bench"})
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench_job_queue())
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+import uuid
+
+from benchlib import MONGO_URL, DB_NAME, report
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+from admission import MemoryBuckets
+from password_hashing import PasswordHasher, _hash, _verify
+
+LOGINS = 200
+PROBES = 100
+PASSWORD = "StormPass123!"
+
+
+class InlineHasher(PasswordHasher):
+    """The original behaviour: bcrypt runs on the event loop thread."""
+
+    async def hash(self, password):
+        return _hash(password, self.rounds)
+
+    async def verify(self, password, hashed_password):
+        return _verify(password, hashed_password)
+
+
+async def probe_products(http, stop):
+    samples = []
+    while not stop.is_set() and len(samples) < PROBES:
+        start = time.perf_counter()
+        await http.get("/api/products?limit=20")
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return samples
+
+
+async def login_storm(http, email):
+    statuses = await asyncio.gather(*(
+        http.post("/api/auth/login", json={"email": email, "password": PASSWORD}) for _ in range(LOGINS)
+    ))
+    return [response.status_code for response in statuses]
+
+
+async def bench_login_storm():
+    db = server.db
+    email = f"storm-{uuid.uuid4()}@example.com"
+    await db.users.insert_one({
+        "id": str(uuid.uuid4()), "email": email, "phone": "0", "name": "Storm",
+        "password": _hash(PASSWORD, server.password_hasher.rounds)
+    })
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        await http.get("/api/products?limit=20")
+        report("/api/products, idle", await probe_products(http, asyncio.Event()))
+
+        pooled = server.password_hasher
+        admission = server.admission
+        runs = (("inline bcrypt", InlineHasher(rounds=pooled.rounds), False),
+                ("worker pool", pooled, False),
+                ("worker pool + admission control", pooled, True))
+        for label, hasher, admission_enabled in runs:
+            server.password_hasher = hasher
+            admission.enabled = admission_enabled
+            admission.buckets = MemoryBuckets()
+            stop = asyncio.Event()
+            probes = asyncio.create_task(probe_products(http, stop))
+            start = time.perf_counter()
+            statuses = await login_storm(http, email)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            report(f"/api/products during storm, {label}", await probes)
+            print(f"    {LOGINS} logins in {elapsed:.2f}s: {statuses.count(200)} ok, "
+                  f"{statuses.count(503)} shed with 503, {statuses.count(429)} rate limited with 429")
+        server.password_hasher = pooled
+        shed = {reason: count for (route_class, reason), count in server.metrics.shed.items() if route_class == "login"}
+        print(f"    shed by admission control: {shed}")
+
+    await db.users.delete_many({"email": email})
+    server.password_hasher.shutdown()
+    server.client.close()
+
+if __name__ == "__main__":
+    asyncio.run(bench_login_storm())
@@ -0,0 +1,95 @@
+import asyncio
+import base64
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from benchlib import MONGO_URL, DB_NAME, percentile
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+from typing import List
+
+import httpx
+from pydantic import TypeAdapter
+
+import server
+
+ORDERS = 5000
+PRESCRIPTION_SHARE = 0.1
+PRESCRIPTION_BYTES = 100_000
+ITERATIONS = 20
+
+
+async def legacy_get_orders(db, user_id):
+    """The original handler: every order, full documents, re-validated through Pydantic."""
+    orders = await db.orders.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    for order in orders:
+        if isinstance(order['created_at'], str):
+            order['created_at'] = datetime.fromisoformat(order['created_at'])
+    adapter = TypeAdapter(List[server.Order])
+    return adapter.dump_json(adapter.validate_python(orders))
+
+
+async def measure(label, fn):
+    samples, size = [], 0
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        size = len(await fn())
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<42} payload={size / 1024:10.1f} KiB  p50={percentile(samples, 50):8.2f}ms  p99={percentile(samples, 99):8.2f}ms")
+
+
+async def bench_order_listing():
+    db = server.db
+    user_id = str(uuid.uuid4())
+    await db.orders.delete_many({})
+
+    prescription = "data:image/jpeg;base64," + base64.b64encode(os.urandom(PRESCRIPTION_BYTES)).decode()
+    start = datetime.now(timezone.utc)
+    orders = []
+    for i in range(ORDERS):
+        orders.append({
+            "id": str(uuid.uuid4()), "user_id": user_id,
+            "products": [{"product_id": str(uuid.uuid4()), "name": f"Product {n}", "price": 99.0, "quantity": 1} for n in range(5)],
+            "total_amount": 495.0, "payment_method": "COD", "upi_id": None,
+            "delivery_address": "12 Bench Road, Mumbai", "phone": "+919800000000", "status": "Pending",
+            "prescription_data": prescription if random.random() < PRESCRIPTION_SHARE else None,
+            "created_at": (start - timedelta(minutes=i)).isoformat(),
+        })
+    for offset in range(0, ORDERS, 500):
+        await db.orders.insert_many(orders[offset:offset + 500])
+
+    headers = {"Authorization": f"Bearer {server.create_access_token({'sub': user_id})}"}
+    await db.users.insert_one({"id": user_id, "email": f"{user_id}@bench.test", "phone": "0", "name": "Bench", "password": "x"})
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def fetch(params):
+            response = await http.get("/api/orders", params=params, headers=headers)
+            response.raise_for_status()
+            return response.content
+
+        await measure("before: to_list(1000), full documents", lambda: legacy_get_orders(db, user_id))
+        await measure("after: first page (default size)", lambda: fetch({}))
+        await measure("after: first page, fields=status,total_amount", lambda: fetch({"fields": "status,total_amount"}))
+
+        pages, cursor = 0, None
+        start_walk = time.perf_counter()
+        while True:
+            response = await http.get("/api/orders", params={"limit": 200, **({"cursor": cursor} if cursor else {})}, headers=headers)
+            pages += 1
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        print(f"walked all {ORDERS} orders in {pages} pages of 200 in {(time.perf_counter() - start_walk) * 1000:.1f}ms")
+
+    await db.orders.delete_many({"user_id": user_id})
+    await db.users.delete_many({"id": user_id})
+    server.client.close()
+
+if __name__ == "__main__":
+    asyncio.run(bench_order_listing())
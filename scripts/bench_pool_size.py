@@ -0,0 +1,43 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+LOADTEST = Path(__file__).resolve().parent / "loadtest.py"
+POOL_SIZES = [5, 10, 25, 50, 100]
+
+
+def run_loadtest(pool_size, args, output):
+    env = {**os.environ, "MONGO_MAX_POOL_SIZE": str(pool_size)}
+    command = [sys.executable, str(LOADTEST), "--mongo", "local", "--duration", str(args.duration),
+               "--concurrency", str(args.concurrency), "--output", output]
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+def bench_pool_size(args):
+    """Run the load suite once per pool size, each in a fresh process."""
+    print(f"{'pool':>6}{'req/s':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak in use':>13}{'mean wait ms':>14}{'failures':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pool_size in args.pool_sizes:
+            results = run_loadtest(pool_size, args, os.path.join(tmp, f"pool-{pool_size}.json"))
+            routes = results["routes"].values()
+            p95 = max(route["p95_ms"] for route in routes)
+            p99 = max(route["p99_ms"] for route in routes)
+            pools = (results.get("pool") or {}).values()
+            peak = max((pool["peak_in_use"] for pool in pools), default=0)
+            wait = max((pool["mean_wait_ms"] for pool in pools), default=0.0)
+            failures = sum(pool["failures"] for pool in pools)
+            print(f"{pool_size:>6}{results['req_per_sec']:>10.1f}{p95:>10.2f}{p99:>10.2f}{peak:>13}{wait:>14.3f}{failures:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the load suite as the Mongo pool size grows")
+    parser.add_argument("--pool-sizes", type=lambda value: [int(v) for v in value.split(",")], default=POOL_SIZES)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=100)
+    bench_pool_size(parser.parse_args())
@@ -0,0 +1,68 @@
+import random
+import time
+
+from benchlib import percentile, report
+
+from product_search import ProductSearchIndex
+
+SKUS = 100_000
+QUERIES = 500
+
+STEMS = ["paracetamol", "ibuprofen", "amoxicillin", "cetirizine", "azithromycin", "omeprazole", "metformin",
+         "atorvastatin", "aspirin", "vitamin", "calcium", "omega", "zinc", "sanitizer", "antiseptic", "bandage",
+         "thermometer", "glucometer", "oximeter", "nebulizer", "diapers", "lotion", "shampoo", "sunscreen"]
+FORMS = ["tablets", "capsules", "syrup", "gel", "cream", "drops", "spray", "powder", "solution", "strips"]
+CATEGORIES = ["Medicines", "Vitamins & Supplements", "Personal Care", "Medical Devices", "Baby Care", "First Aid"]
+BRANDS = [f"brand{i}" for i in range(2000)]
+
+
+def synthetic_product(i):
+    stem = random.choice(STEMS)
+    form = random.choice(FORMS)
+    return {
+        "id": f"sku-{i}",
+        "name": f"{random.choice(BRANDS)} {stem} {random.choice([10, 50, 100, 250, 500])}mg {form}",
+        "description": f"{stem} {form} for everyday care by {random.choice(BRANDS)}",
+        "category": random.choice(CATEGORIES),
+        "price": round(random.uniform(10, 2000), 2),
+        "image_url": "",
+        "stock": random.randint(0, 500),
+    }
+
+
+def time_queries(index, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, limit=20)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_search():
+    random.seed(7)
+    index = ProductSearchIndex()
+
+    start = time.perf_counter()
+    for i in range(SKUS):
+        index.upsert(synthetic_product(i))
+    build = time.perf_counter() - start
+    print(f"indexed {SKUS} SKUs in {build:.2f}s ({SKUS / build:.0f} SKUs/s), {len(index._postings)} terms")
+
+    workloads = {
+        "exact term": [random.choice(STEMS) for _ in range(QUERIES)],
+        "prefix (autocomplete)": [random.choice(STEMS)[:random.randint(3, 5)] for _ in range(QUERIES)],
+        "fuzzy (one typo)": [stem[:2] + stem[3:] for stem in random.choices(STEMS, k=QUERIES)],
+        "two terms": [f"{random.choice(STEMS)} {random.choice(FORMS)}" for _ in range(QUERIES)],
+        "brand + stem": [f"{random.choice(BRANDS)} {random.choice(STEMS)}" for _ in range(QUERIES)],
+    }
+    for label, queries in workloads.items():
+        report(label, time_queries(index, queries))
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.upsert(synthetic_product(random.randrange(SKUS)))
+    print(f"incremental update: {(time.perf_counter() - start) / 1000 * 1000:.3f}ms per product")
+
+if __name__ == "__main__":
+    bench_search()
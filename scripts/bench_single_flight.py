@@ -0,0 +1,79 @@
+import asyncio
+import os
+import time
+import uuid
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+from single_flight import SingleFlight
+
+REQUESTS = 1000
+PRODUCTS = 500
+CATEGORIES = ["Medicines", "Vitamins & Supplements", "Personal Care", "Baby Care"]
+
+
+class NoFlight(SingleFlight):
+    """Every caller runs its own query, as before coalescing."""
+
+    async def do(self, key, fn):
+        self.calls += 1
+        return await fn()
+
+
+def catalog_commands() -> int:
+    return sum(count for (route, _, collection), count in server.metrics.commands.items()
+               if collection == "products" and route != "(background)")
+
+
+async def burst(http, path):
+    """``REQUESTS`` identical concurrent requests; returns (seconds, Mongo commands, statuses)."""
+    before = catalog_commands()
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(http.get(path) for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    return elapsed, catalog_commands() - before, {response.status_code for response in responses}
+
+
+async def bench_single_flight():
+    db = server.db
+    await db.products.delete_many({})
+    products = [{"id": str(uuid.uuid4()), "name": f"Product {i:04d}", "description": "Single-flight benchmark",
+                 "price": 10.0 + i, "image_url": "", "category": CATEGORIES[i % len(CATEGORIES)], "stock": 100,
+                 "requires_prescription": False} for i in range(PRODUCTS)]
+    await db.products.insert_many(products)
+    paths = [("categories", "/api/categories"),
+             ("listing", "/api/products?category=Medicines&limit=50"),
+             ("product", f"/api/products/{products[0]['id']}")]
+
+    # The caches are off, so every request that is not coalesced reaches Mongo
+    catalog, response_cache = server.catalog, server.response_cache
+    catalog.enabled = False
+    response_cache.enabled = False
+
+    print(f"{REQUESTS} concurrent identical requests per route, catalog and response caches off")
+    print(f"{'route':<12}{'mode':<16}{'mongo ops':>10}{'elapsed':>10}{'req/s':>10}")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        for label, path in paths:
+            for mode, flights in (("per request", NoFlight), ("single-flight", SingleFlight)):
+                catalog._flights = flights()
+                response_cache._flights = flights()
+                elapsed, commands, statuses = await burst(http, path)
+                assert statuses == {200}, statuses
+                print(f"{label:<12}{mode:<16}{commands:>10}{elapsed * 1000:>8.0f}ms{REQUESTS / elapsed:>10.0f}")
+            stats = response_cache._flights.stats()
+            print(f"{'':<12}coalescing ratio {stats['coalescing_ratio']:.3f} "
+                  f"({stats['calls']} renders for {stats['calls'] + stats['coalesced']} requests)")
+
+    await db.products.delete_many({})
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench_single_flight())
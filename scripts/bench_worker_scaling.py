@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import uuid
+
+from benchlib import BACKEND_DIR, MONGO_URL, DB_NAME, percentile
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+SERVE = BACKEND_DIR / "serve.py"
+PRODUCTS = 2000
+CATEGORIES = ["Medicines", "Vitamins & Supplements", "Personal Care", "Medical Devices", "Baby Care", "First Aid"]
+
+
+def catalog_paths(product_ids):
+    rng = random.Random()
+    while True:
+        roll = rng.random()
+        if roll < 0.4:
+            yield f"/api/products/{rng.choice(product_ids)}"
+        elif roll < 0.7:
+            yield f"/api/products?limit=50&category={rng.choice(CATEGORIES)}"
+        elif roll < 0.9:
+            yield f"/api/products/search?q={rng.choice(['vitamin', 'tablet', 'baby', 'first aid'])}"
+        else:
+            yield "/api/categories"
+
+
+async def drive(base_url, product_ids, concurrency, duration):
+    """Hit the catalog routes from ``concurrency`` keep-alive connections for ``duration`` seconds."""
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    paths = catalog_paths(product_ids)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        async def user():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await http.get(next(paths))
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.TransportError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(base_url, product_ids, concurrency, duration):
+    return asyncio.run(drive(base_url, product_ids, concurrency, duration))
+
+
+async def seed():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[DB_NAME]
+    await db.products.delete_many({})
+    products = [{"id": str(uuid.uuid4()), "name": f"Vitamin tablet {i:05d}", "description": "Scaling benchmark product",
+                 "price": 10.0 + i % 400, "image_url": "", "category": CATEGORIES[i % len(CATEGORIES)],
+                 "stock": 100, "requires_prescription": False} for i in range(PRODUCTS)]
+    await db.products.insert_many(products)
+    client.close()
+    return [product["id"] for product in products]
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("workers did not start")
+
+
+def bench_worker_scaling(args):
+    """Catalog throughput of serve.py as the worker count goes from 1 to N.
+
+    The load comes from ``--clients`` separate processes so the generator does
+    not become the bottleneck; give the server and the clients disjoint cores
+    (for example with taskset) for clean numbers.
+    """
+    product_ids = asyncio.run(seed())
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"{'workers':>8}{'req/s':>10}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    baseline = None
+    for workers in args.workers:
+        server = subprocess.Popen([sys.executable, str(SERVE), "--host", "127.0.0.1", "--port", str(args.port),
+                                   "--workers", str(workers), "--log-level", "warning"], cwd=BACKEND_DIR)
+        try:
+            wait_until_ready(base_url)
+            with multiprocessing.Pool(args.clients) as pool:
+                # warm every worker's caches before measuring
+                pool.starmap(client_process, [(base_url, product_ids, args.concurrency, 2)] * args.clients)
+                results = pool.starmap(client_process,
+                                       [(base_url, product_ids, args.concurrency, args.duration)] * args.clients)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+        latencies = [latency for samples, _ in results for latency in samples]
+        errors = sum(errors for _, errors in results)
+        rate = len(latencies) / args.duration
+        baseline = baseline or rate
+        print(f"{workers:>8}{rate:>10.1f}{rate / baseline:>8.2f}x{percentile(latencies, 50):>9.2f}"
+              f"{percentile(latencies, 99):>9.2f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Requests per second as serve.py goes from 1 to N workers")
+    parser.add_argument("--workers", type=lambda value: [int(v) for v in value.split(",")],
+                        default=sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))),
+                        help="comma-separated worker counts (default: powers of two up to the core count)")
+    parser.add_argument("--clients", type=int, default=max(1, cores // 2), help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per load generator process")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8766)
+    bench_worker_scaling(parser.parse_args())
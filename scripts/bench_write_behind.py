@@ -0,0 +1,81 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+from benchlib import MONGO_URL, DB_NAME, percentile
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import server
+from write_behind import WriteBehindQueue
+
+MESSAGES = 20_000
+CONCURRENCY = 100
+
+
+def contact(i):
+    return {"id": str(uuid.uuid4()), "name": f"Customer {i}", "email": f"customer{i}@example.com",
+            "phone": "9876543210", "message": "Do you stock the 10ml pediatric syrup? Please call back.",
+            "created_at": datetime.now(timezone.utc).isoformat()}
+
+
+async def unbatched(collection):
+    """One awaited insert_one per message, ``CONCURRENCY`` requests at a time."""
+    latencies = []
+    pending = iter(range(MESSAGES))
+
+    async def request_loop():
+        for i in pending:
+            start = time.perf_counter()
+            await collection.insert_one(contact(i))
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+    await asyncio.gather(*(request_loop() for _ in range(CONCURRENCY)))
+    return latencies
+
+
+async def batched(db, spill_dir, batch_size):
+    queue = WriteBehindQueue(db, spill_dir, max_batch=batch_size, flush_interval=0.05, max_queued=MESSAGES)
+    await queue.start()
+    latencies = []
+    for i in range(MESSAGES):
+        start = time.perf_counter()
+        queue.put("bench_contacts", contact(i))
+        latencies.append((time.perf_counter() - start) * 1e6)
+        if i % CONCURRENCY == 0:
+            await asyncio.sleep(0)  # let the flusher run, as it would between requests
+    await queue.stop()
+    return latencies
+
+
+async def bench_write_behind():
+    db = server.db
+    spill_dir = tempfile.mkdtemp(prefix="write-behind-bench-")
+    print(f"{MESSAGES:,} contact messages")
+    print(f"{'mode':<28}{'inserts/s':>12}{'request p50':>14}{'request p99':>14}")
+    try:
+        runs = [("insert_one per request", lambda: unbatched(db.bench_contacts))]
+        runs += [(f"write-behind, batch {size}", lambda size=size: batched(db, spill_dir, size))
+                 for size in (100, 500, 1000)]
+        for label, run in runs:
+            await db.bench_contacts.drop()
+            start = time.perf_counter()
+            latencies = await run()
+            elapsed = time.perf_counter() - start
+            stored = await db.bench_contacts.count_documents({})
+            assert stored == MESSAGES, f"{label}: {stored} of {MESSAGES} stored"
+            print(f"{label:<28}{MESSAGES / elapsed:>12,.0f}{percentile(latencies, 50):>12.1f}us"
+                  f"{percentile(latencies, 99):>12.1f}us")
+    finally:
+        await db.bench_contacts.drop()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench_write_behind())
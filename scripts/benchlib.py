@@ -0,0 +1,33 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+# Benchmarks import backend modules directly, the same way uvicorn loads server:app
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("BENCH_DB_NAME", "bench_database")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def time_async(fn, iterations):
+    """Await ``fn()`` ``iterations`` times and return per-call latencies in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<40} p50={percentile(samples, 50):8.3f}ms  p99={percentile(samples, 99):8.3f}ms  n={len(samples)}")
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv
+
+load_dotenv(BACKEND_DIR / '.env')
+
+from catalog_import import CatalogImport, CatalogImportError, read_rows, BATCH_SIZE, CONCURRENCY
+from catalog_models import Product
+from database import Database
+
+
+def detect_format(path: str) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise CatalogImportError(f"Cannot tell the format of {path}; pass --format")
+
+
+async def import_catalog(args) -> int:
+    fmt = args.format or detect_format(args.path)
+    start = time.perf_counter()
+
+    def progress(stats):
+        elapsed = time.perf_counter() - start
+        print(f"\r{stats}  {stats.read / elapsed:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+    database = Database.from_env()
+    importer = CatalogImport(database.db, Product, mode=args.mode, batch_size=args.batch_size, concurrency=args.concurrency,
+                             sku_field=args.sku_field, prune=args.prune, on_batch=progress)
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    try:
+        stats = await importer.run(read_rows(stream, fmt))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        database.close()
+
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    for error in stats.errors:
+        print(f"invalid: {error}")
+    print(f"{stats} in {elapsed:.1f}s ({stats.read / elapsed:,.0f} rows/s, mode={args.mode})")
+    return 1 if stats.invalid else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a CSV or JSON Lines product feed into the catalog")
+    parser.add_argument("path", help="feed file, or - for stdin (with --format)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="feed format (default: from the file extension)")
+    parser.add_argument("--mode", choices=["upsert", "swap"], default="upsert",
+                        help="upsert into the live catalog, or build a staging copy and swap it in atomically")
+    parser.add_argument("--prune", action="store_true", help="upsert mode: delete products whose SKU is not in the feed")
+    parser.add_argument("--sku-field", default="sku", help="feed column holding the stable SKU")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="batches written in parallel")
+    sys.exit(asyncio.run(import_catalog(parser.parse_args())))
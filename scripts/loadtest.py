@@ -0,0 +1,342 @@
+"""Mixed-workload load test for the whole API.
+
+Boots ``server:app`` in-process against a local mongod (``--mongo local``) or the
+mongomock-motor stand-in (``--mongo memory``), seeds users and products, and drives
+browse / search / cart / checkout / order-history sessions through an async client.
+Reports req/s, p50/p95/p99 per route and Mongo commands per request (local only),
+and can save results as JSON and compare them against an earlier run.
+
+mongomock does not implement the arrayFilters updates behind ``/api/cart/add`` and
+``/api/cart/update``, so ``--mongo memory`` leaves those two routes out and fills
+carts for checkout directly in the database; use ``--mongo local`` to measure them.
+
+    python scripts/loadtest.py --mongo memory --duration 20 --output run.json
+    python scripts/loadtest.py --mongo local --compare run.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchlib import MONGO_URL, DB_NAME, percentile
+
+from pymongo import monitoring
+
+# Route label of the request being driven, read by the command listener
+current_route = contextvars.ContextVar("current_route", default=None)
+
+CATEGORIES = ["Pain Relief", "Vitamins", "Cold & Flu", "Diabetes", "First Aid", "Skin Care", "Baby Care", "Digestive"]
+WORDS = ["paracetamol", "ibuprofen", "vitamin", "zinc", "cough", "syrup", "tablet", "capsule",
+         "cream", "gel", "bandage", "insulin", "strip", "lotion", "drops", "powder"]
+SEARCH_TERMS = ["para", "vitamin", "cough syrup", "ibuprofn", "zinc tablet", "cream", "insulin", "drops"]
+
+# Cart mutations use arrayFilters, which mongomock does not implement
+MEMORY_SKIPPED_ACTIONS = ("cart_add", "cart_update")
+
+# Relative weight of each shopper action in the mixed workload
+ACTIONS = {
+    "browse": 35,
+    "product": 15,
+    "search": 20,
+    "cart_add": 12,
+    "cart_update": 5,
+    "cart_view": 5,
+    "checkout": 3,
+    "orders": 5,
+}
+
+REGRESSION_THRESHOLD = 0.10
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Count Mongo commands per route label."""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def started(self, event):
+        self.counts[current_route.get() or "(background)"] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo", choices=["local", "memory"], default="local",
+                        help="run against MONGO_URL or the in-memory mongomock stand-in")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20, help="number of concurrent shopper sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead of --duration")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="compare against a results JSON file from an earlier run")
+    return parser.parse_args()
+
+
+def load_server(mode):
+    """Import ``server`` wired to the selected Mongo backend and return ``(server, counter)``."""
+    os.environ.setdefault("MONGO_URL", MONGO_URL)
+    os.environ["DB_NAME"] = DB_NAME
+    if mode == "memory":
+        # mongomock has no change streams or GridFS
+        os.environ["CATALOG_CACHE_INVALIDATION"] = "poll"
+        os.environ.setdefault("PRESCRIPTION_STORE", "local")
+
+    import server
+    import checkout
+
+    counter = None
+    server.database.close()
+    if mode == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+
+        server.client = AsyncMongoMockClient()
+        server.db = server.read_db = server.client[DB_NAME]
+        checkout._transactions_supported = False
+    else:
+        from database import Database
+
+        counter = CommandCounter()
+        metrics = server.metrics
+        database = Database.from_env(event_listeners=[counter, metrics.command_listener, metrics.pool_listener])
+        server.database = database
+        server.client = database.client
+        server.db = database.db
+        server.read_db = database.reads
+    # the write-behind queue and the prescription workers were built on the closed client
+    server.build_db_services()
+    return server, counter
+
+
+async def seed(server, users, products, rng):
+    db = server.db
+    for name in ("users", "products", "carts", "orders"):
+        await db[name].delete_many({})
+
+    now = datetime.now(timezone.utc).isoformat()
+    await db.products.insert_many([
+        {"id": str(uuid.uuid4()),
+         "name": f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}",
+         "description": " ".join(rng.choices(WORDS, k=8)),
+         "price": round(rng.uniform(10, 500), 2), "image_url": "",
+         "category": rng.choice(CATEGORIES), "stock": 10 ** 9,
+         "created_at": now, "updated_at": now}
+        for i in range(products)
+    ])
+
+    accounts = [
+        {"id": str(uuid.uuid4()), "email": f"load-{i}-{uuid.uuid4().hex[:8]}@example.com",
+         "phone": "9999999999", "name": f"Shopper {i}", "password": "x", "created_at": now}
+        for i in range(users)
+    ]
+    await db.users.insert_many([dict(account) for account in accounts])
+    return [(account["id"], {"Authorization": f"Bearer {server.create_access_token(server.user_claims(account))}"})
+            for account in accounts]
+
+
+class Workload:
+    def __init__(self, http, tokens, product_ids, args, db=None):
+        self.http = http
+        self.tokens = tokens
+        self.product_ids = product_ids
+        # with ``db``, carts are filled in the database instead of through the cart routes
+        self.db = db
+        self.deadline = None if args.requests else time.perf_counter() + args.duration
+        self.remaining = args.requests
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        actions = {action: weight for action, weight in ACTIONS.items()
+                   if db is None or action not in MEMORY_SKIPPED_ACTIONS}
+        self.actions = list(actions)
+        self.weights = list(actions.values())
+
+    def more(self):
+        if self.remaining is not None:
+            self.remaining -= 1
+            return self.remaining >= 0
+        return time.perf_counter() < self.deadline
+
+    async def call(self, route, method, url, **kwargs):
+        token = current_route.set(route)
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, **kwargs)
+        finally:
+            current_route.reset(token)
+        self.latencies[route].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    async def fill_cart(self, user_id, product_id, quantity):
+        """Untimed stand-in for ``/api/cart/add`` when the backend cannot run it."""
+        await self.db.carts.update_one(
+            {"user_id": user_id},
+            {"$push": {"items": {"product_id": product_id, "quantity": quantity}},
+             "$setOnInsert": {"id": str(uuid.uuid4())}},
+            upsert=True
+        )
+
+    async def session(self, rng):
+        user_id, headers = rng.choice(self.tokens)
+        cursor = None
+        in_cart = []
+        while self.more():
+            action = rng.choices(self.actions, self.weights)[0]
+            if action == "checkout" and not in_cart and self.db is not None:
+                product_id = rng.choice(self.product_ids)
+                await self.fill_cart(user_id, product_id, rng.randint(1, 3))
+                in_cart.append(product_id)
+            if action in ("cart_update", "checkout") and not in_cart:
+                action = "cart_add"
+            if action == "browse":
+                params = {"limit": 50}
+                if cursor:
+                    params["cursor"] = cursor
+                elif rng.random() < 0.5:
+                    params["category"] = rng.choice(CATEGORIES)
+                response = await self.call("GET /api/products", "GET", "/api/products", params=params)
+                cursor = response.headers.get("x-next-cursor") if rng.random() < 0.7 else None
+            elif action == "product":
+                product_id = rng.choice(self.product_ids)
+                await self.call("GET /api/products/{id}", "GET", f"/api/products/{product_id}")
+            elif action == "search":
+                await self.call("GET /api/products/search", "GET", "/api/products/search",
+                                params={"q": rng.choice(SEARCH_TERMS)})
+            elif action == "cart_add":
+                product_id = rng.choice(self.product_ids)
+                await self.call("POST /api/cart/add", "POST", "/api/cart/add", headers=headers,
+                                json={"product_id": product_id, "quantity": rng.randint(1, 3),
+                                      "request_id": str(uuid.uuid4())})
+                in_cart.append(product_id)
+            elif action == "cart_update":
+                product_id = rng.choice(in_cart)
+                quantity = rng.randint(0, 4)
+                await self.call("PUT /api/cart/update", "PUT", "/api/cart/update", headers=headers,
+                                json={"product_id": product_id, "quantity": quantity})
+                if quantity == 0:
+                    in_cart = [p for p in in_cart if p != product_id]
+            elif action == "cart_view":
+                await self.call("GET /api/cart", "GET", "/api/cart", headers=headers)
+            elif action == "checkout":
+                await self.call("POST /api/orders", "POST", "/api/orders", headers=headers,
+                                json={"payment_method": "cod", "delivery_address": "1 Load Test Road",
+                                      "phone": "9999999999"})
+                in_cart = []
+            elif action == "orders":
+                await self.call("GET /api/orders", "GET", "/api/orders", headers=headers, params={"limit": 20})
+
+
+def summarize(workload, counter, elapsed, args, pool=None):
+    routes = {}
+    for route, samples in sorted(workload.latencies.items()):
+        count = len(samples)
+        routes[route] = {
+            "requests": count,
+            "errors": workload.errors[route],
+            "req_per_sec": count / elapsed,
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+            "mongo_ops_per_request": counter.counts[route] / count if counter else None,
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {"mongo": args.mongo, "users": args.users, "products": args.products,
+                   "concurrency": args.concurrency, "duration": args.duration,
+                   "requests": args.requests, "seed": args.seed,
+                   "max_pool_size": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))},
+        "elapsed_sec": elapsed,
+        "total_requests": total,
+        "req_per_sec": total / elapsed,
+        "background_mongo_ops": counter.counts.get("(background)", 0) if counter else None,
+        "pool": pool,
+        "routes": routes,
+    }
+
+
+def print_results(results):
+    print(f"\n{results['total_requests']} requests in {results['elapsed_sec']:.1f}s "
+          f"= {results['req_per_sec']:.1f} req/s ({results['config']['mongo']} mongo)\n")
+    print(f"{'route':<28}{'n':>7}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ops/req':>9}")
+    for route, stats in results["routes"].items():
+        ops = stats["mongo_ops_per_request"]
+        print(f"{route:<28}{stats['requests']:>7}{stats['errors']:>6}{stats['req_per_sec']:>9.1f}"
+              f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{'n/a' if ops is None else format(ops, '.2f'):>9}")
+    for server, pool in (results.get("pool") or {}).items():
+        print(f"\npool {server}: max={pool['max_size']} peak in use={pool['peak_in_use']} "
+              f"checkouts={pool['checkouts']} mean wait={pool['mean_wait_ms']:.3f}ms failures={pool['failures']}")
+
+
+def compare(results, baseline_path):
+    """Print per-route deltas against a baseline run; return the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline["config"] != results["config"]:
+        print(f"\nnote: baseline config differs: {baseline['config']}")
+
+    def delta(new, old):
+        return (new - old) / old if old else 0.0
+
+    print(f"\nvs {baseline_path} ({baseline['timestamp']}), regressions over {REGRESSION_THRESHOLD:.0%} marked with !")
+    regressions = 0
+    for route, stats in results["routes"].items():
+        old = baseline["routes"].get(route)
+        if old is None:
+            print(f"{route:<28} (new route)")
+            continue
+        throughput = delta(stats["req_per_sec"], old["req_per_sec"])
+        p95 = delta(stats["p95_ms"], old["p95_ms"])
+        p99 = delta(stats["p99_ms"], old["p99_ms"])
+        flagged = throughput < -REGRESSION_THRESHOLD or p95 > REGRESSION_THRESHOLD
+        regressions += flagged
+        print(f"{route:<28} req/s {throughput:+7.1%}  p95 {p95:+7.1%}  p99 {p99:+7.1%}{'  !' if flagged else ''}")
+    return regressions
+
+
+async def loadtest(args):
+    import httpx
+
+    server, counter = load_server(args.mongo)
+    rng = random.Random(args.seed)
+    tokens = await seed(server, args.users, args.products, rng)
+    product_ids = [p["id"] async for p in server.db.products.find({}, {"_id": 0, "id": 1})]
+
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as http:
+            workload = Workload(http, tokens, product_ids, args, db=server.db if args.mongo == "memory" else None)
+            if counter:
+                counter.counts.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*(workload.session(random.Random(args.seed + i)) for i in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+
+    results = summarize(workload, counter, elapsed, args, server.metrics.pool_stats() if counter else None)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        return 1 if compare(results, args.compare) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(loadtest(parse_args())))
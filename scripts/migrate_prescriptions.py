@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from blob_store import make_blob_store, iter_bytes, BlobTooLarge
+from prescriptions import save_prescription, decode_data_url, InvalidPrescription
+
+# Orders carrying inline blobs are large, so pull only a few per round-trip
+BATCH_SIZE = 20
+
+
+async def migrate_prescriptions(dry_run: bool):
+    load_dotenv(BACKEND_DIR / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    store = make_blob_store(db)
+
+    migrated = skipped = 0
+    query = {"prescription_data": {"$type": "string"}}
+    cursor = db.orders.find(query, {"_id": 0, "id": 1, "user_id": 1, "prescription_data": 1}, batch_size=BATCH_SIZE)
+    async for order in cursor:
+        try:
+            content_type, data = decode_data_url(order['prescription_data'])
+            if dry_run:
+                print(f"would migrate order {order['id']}: {content_type}, {len(data)} bytes")
+                migrated += 1
+                continue
+            prescription = await save_prescription(store, db, order['user_id'], iter_bytes(data), content_type)
+        except (InvalidPrescription, BlobTooLarge) as e:
+            print(f"skipped order {order['id']}: {e or 'prescription too large'}")
+            skipped += 1
+            continue
+
+        await db.orders.update_one(
+            {"id": order['id'], "prescription_data": {"$type": "string"}},
+            {"$set": {"prescription_id": prescription['id']}, "$unset": {"prescription_data": ""}}
+        )
+        migrated += 1
+
+    print(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} prescriptions, skipped {skipped}")
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline base64 prescriptions out of orders into the blob store")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be migrated without writing")
+    args = parser.parse_args()
+    asyncio.run(migrate_prescriptions(args.dry_run))
@@ -1,6 +1,14 @@
 import asyncio
+import re
+import sys
+from pathlib import Path
 from motor.motor_asyncio import AsyncIOMotorClient
-import uuid
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from catalog_import import CatalogImport
+from catalog_models import Product
 
 # MongoDB connection
 MONGO_URL = "mongodb://localhost:27017"
@@ -84,25 +92,18 @@ products_data = [
     {"name": "Throat Lozenges", "description": "Soothes sore throat", "price": 65.00, "category": "Medicines", "stock": 400, "requires_prescription": False, "image_url": "https://images.unsplash.com/photo-1471864190281-a93a3070b6de?w=500"},
 ]
 
+def seed_sku(name: str) -> str:
+    return "SEED-" + re.sub(r"[^A-Z0-9]+", "-", name.upper()).strip("-")
+
 async def seed_products():
     client = AsyncIOMotorClient(MONGO_URL)
     db = client[DB_NAME]
     
-    # Clear existing products
-    await db.products.delete_many({})
-    print("Cleared existing products")
-    
-    # Insert new products
-    products = []
-    for product_data in products_data:
-        product = {
-            "id": str(uuid.uuid4()),
-            **product_data
-        }
-        products.append(product)
-    
-    await db.products.insert_many(products)
-    print(f"Inserted {len(products)} products")
+    # Build the seed catalog in a staging collection and swap it in, so the
+    # storefront is never empty; seeded SKUs keep their product ids across reseeds
+    rows = ({"sku": seed_sku(product_data["name"]), **product_data} for product_data in products_data)
+    stats = await CatalogImport(db, Product, mode="swap").run(rows)
+    print(f"Seeded products: {stats}")
     
     client.close()
 
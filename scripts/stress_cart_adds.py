@@ -0,0 +1,82 @@
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+from indexes import ensure_indexes
+
+ADDS = 500
+PRODUCTS = 10
+REPLAYS = 100
+
+
+async def stress_cart_adds():
+    db = server.db
+    await ensure_indexes(db)
+    await db.carts.delete_many({})
+    await db.products.delete_many({})
+
+    product_ids = [str(uuid.uuid4()) for _ in range(PRODUCTS)]
+    await db.products.insert_many([
+        {"id": product_id, "name": f"Product {i}", "description": "Stress test product",
+         "price": 10.0, "image_url": "", "category": "Stress", "stock": 1000}
+        for i, product_id in enumerate(product_ids)
+    ])
+    user_id = str(uuid.uuid4())
+    await db.users.insert_one({"id": user_id, "email": f"{user_id}@stress.test", "phone": "0", "name": "Shopper", "password": "x"})
+    headers = {"Authorization": f"Bearer {server.create_access_token({'sub': user_id})}"}
+
+    adds = [
+        {"product_id": random.choice(product_ids), "quantity": random.randint(1, 3), "request_id": str(uuid.uuid4())}
+        for _ in range(ADDS)
+    ]
+    expected = {}
+    for add in adds:
+        expected[add['product_id']] = expected.get(add['product_id'], 0) + add['quantity']
+    # Replayed requests (a client retrying after a timeout) race their original and must not count twice
+    replayed = set(random.sample(range(ADDS), REPLAYS))
+    requests = []
+    for i, add in enumerate(adds):
+        requests.append(add)
+        if i in replayed:
+            requests.append(add)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress") as http:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(http.post("/api/cart/add", json=add, headers=headers) for add in requests))
+        elapsed = time.perf_counter() - start
+
+    statuses = [response.status_code for response in responses]
+    cart = await db.carts.find_one({"user_id": user_id})
+    actual = {item['product_id']: item['quantity'] for item in cart['items']}
+
+    print(f"{len(requests)} adds ({REPLAYS} replays) in {elapsed:.2f}s, {len(requests) / elapsed:.1f} adds/sec, "
+          f"{statuses.count(200)} ok, {len(statuses) - statuses.count(200)} failed")
+    print(f"cart lines={len(cart['items'])} distinct products={len(expected)}")
+
+    await db.carts.delete_many({"user_id": user_id})
+    await db.users.delete_many({"id": user_id})
+    server.client.close()
+
+    if actual != expected or len(cart['items']) != len(expected):
+        print("FAIL: lost or duplicated updates")
+        for product_id in expected:
+            if actual.get(product_id) != expected[product_id]:
+                print(f"  {product_id}: expected {expected[product_id]}, got {actual.get(product_id)}")
+        return 1
+    print("OK: every quantity is exact")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(stress_cart_adds()))
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+
+SHOPPERS = int(os.environ.get("STRESS_SHOPPERS", "500"))
+HOT_SKU_STOCK = int(os.environ.get("STRESS_STOCK", "200"))
+
+
+async def stress_checkout():
+    db = server.db
+    await db.users.delete_many({})
+    await db.carts.delete_many({})
+    await db.orders.delete_many({})
+    await db.products.delete_many({})
+
+    hot_sku = {"id": str(uuid.uuid4()), "name": "Hot SKU", "description": "Stress test product",
+               "price": 99.0, "image_url": "", "category": "Stress", "stock": HOT_SKU_STOCK}
+    await db.products.insert_one(hot_sku)
+
+    # Users and carts are inserted directly so bcrypt does not dominate the run
+    user_ids = [str(uuid.uuid4()) for _ in range(SHOPPERS)]
+    await db.users.insert_many([
+        {"id": user_id, "email": f"{user_id}@stress.test", "phone": "0", "name": "Shopper", "password": "x"}
+        for user_id in user_ids
+    ])
+    await db.carts.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": user_id, "items": [{"product_id": hot_sku['id'], "quantity": 1}]}
+        for user_id in user_ids
+    ])
+
+    order_request = {"payment_method": "COD", "delivery_address": "Stress Street", "phone": "0"}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress") as http:
+        async def checkout(user_id):
+            token = server.create_access_token({"sub": user_id})
+            response = await http.post("/api/orders", json=order_request,
+                                       headers={"Authorization": f"Bearer {token}"})
+            return response.status_code
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(checkout(user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - start
+
+    placed = statuses.count(200)
+    rejected = statuses.count(409)
+    remaining = (await db.products.find_one({"id": hot_sku['id']}))['stock']
+    order_count = await db.orders.count_documents({})
+
+    print(f"shoppers={SHOPPERS} stock={HOT_SKU_STOCK} placed={placed} rejected={rejected} "
+          f"other={SHOPPERS - placed - rejected}")
+    print(f"orders in db={order_count} remaining stock={remaining}")
+    print(f"{SHOPPERS / elapsed:.1f} checkouts/sec, {placed / elapsed:.1f} orders/sec")
+
+    server.client.close()
+
+    expected = min(SHOPPERS, HOT_SKU_STOCK)
+    if placed != expected or order_count != expected or remaining != HOT_SKU_STOCK - expected:
+        print("FAIL: stock and orders are inconsistent")
+        return 1
+    print("OK: no overselling")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(stress_checkout()))
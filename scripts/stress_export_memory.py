@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from benchlib import MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+ORDERS = 10_000_000
+ORDERS_PER_DAY = 1000
+PRESCRIPTION_SHARE = 100  # one order in this many carries an inline prescription
+PRESCRIPTION_BYTES = 50_000
+INSERT_BATCH = 10_000
+# How much more the full export may use than the one-day export
+MAX_GROWTH_MB = 32
+FIRST_DAY = datetime(2000, 1, 1, tzinfo=timezone.utc)
+ADMIN_EMAIL = "export-admin@bench.test"
+
+
+def maxrss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def seed(db):
+    if await db.orders.estimated_document_count() == ORDERS:
+        return
+    print(f"Seeding {ORDERS:,} orders, {ORDERS_PER_DAY} a day...")
+    await db.orders.delete_many({})
+    prescription = "data:image/jpeg;base64," + "A" * PRESCRIPTION_BYTES
+    batch = []
+    for i in range(ORDERS):
+        batch.append({
+            "id": str(uuid.uuid4()), "user_id": f"bench-user-{i % 50_000}",
+            "products": [{"product_id": f"p{i % 2000}", "name": "Paracetamol 500mg", "price": 32.5, "quantity": 2,
+                          "category": "Medicines"}],
+            "total_amount": 65.0, "payment_method": "COD", "upi_id": None,
+            "delivery_address": "12 Bench Road, Mumbai", "phone": "+919800000000", "status": "Pending",
+            "prescription_data": prescription if i % PRESCRIPTION_SHARE == 0 else None,
+            "created_at": (FIRST_DAY + timedelta(seconds=i * 86400 // ORDERS_PER_DAY)).isoformat(),
+        })
+        if len(batch) == INSERT_BATCH:
+            await db.orders.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.orders.insert_many(batch, ordered=False)
+
+
+async def export(params):
+    """Stream one export through the app in this process and report its size and peak memory."""
+    from urllib.parse import urlencode
+
+    import server
+
+    server.ADMIN_EMAILS = {ADMIN_EMAIL}
+    user = await server.db.users.find_one({"email": ADMIN_EMAIL})
+    token = server.create_access_token({'sub': user['id']})
+
+    # Drive the ASGI app directly: test clients buffer the whole body, this counts and drops each chunk
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": "/api/admin/exports/orders", "raw_path": b"/api/admin/exports/orders",
+             "query_string": urlencode(params).encode(), "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+             "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())]}
+    received = {"lines": 0, "bytes": 0}
+    done = asyncio.Event()
+
+    async def receive():
+        if not received.get("requested"):
+            received["requested"] = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+        elif message["type"] == "http.response.body":
+            received["lines"] += message.get("body", b"").count(b"\n")
+            received["bytes"] += len(message.get("body", b""))
+            if not message.get("more_body"):
+                done.set()
+
+    baseline = maxrss_mb()
+    start = time.perf_counter()
+    await server.app(scope, receive, send)
+    print(json.dumps({"lines": received["lines"], "bytes": received["bytes"], "seconds": time.perf_counter() - start,
+                      "baseline_mb": baseline, "peak_mb": maxrss_mb()}))
+
+
+def run_export(params: dict) -> dict:
+    # A fresh process per export, so the peak RSS belongs to that export alone
+    output = subprocess.run([sys.executable, __file__, "--export", json.dumps(params)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def stress_export_memory():
+    import server
+
+    db = server.db
+    await seed(db)
+    await db.users.delete_many({"email": ADMIN_EMAIL})
+    await db.users.insert_one({"id": str(uuid.uuid4()), "email": ADMIN_EMAIL, "phone": "0", "name": "Export", "password": "x"})
+    server.client.close()
+
+    day = FIRST_DAY.date().isoformat()
+    runs = [
+        (f"one day ({ORDERS_PER_DAY:,} orders), ndjson", {"start": day, "end": day}),
+        (f"all {ORDERS:,} orders, ndjson", {}),
+        (f"all {ORDERS:,} orders, csv", {"format": "csv"}),
+        (f"all {ORDERS:,} orders, ndjson + prescription_data", {"include": "prescription_data"}),
+    ]
+    print(f"{'export':<52}{'rows':>12}{'MiB':>10}{'rows/s':>10}{'peak RSS':>11}")
+    results = []
+    for label, params in runs:
+        result = run_export(params)
+        rows = result["lines"] - (1 if params.get("format") == "csv" else 0)
+        results.append(result)
+        print(f"{label:<52}{rows:>12,}{result['bytes'] / 2**20:>10.0f}{rows / result['seconds']:>10,.0f}"
+              f"{result['peak_mb']:>9.0f}MB")
+
+    small = results[0]["peak_mb"]
+    for (label, _), result in zip(runs[1:], results[1:]):
+        growth = result["peak_mb"] - small
+        assert growth < MAX_GROWTH_MB, f"{label}: peak RSS grew {growth:.0f}MB over the one-day export"
+    print(f"peak RSS stayed within {MAX_GROWTH_MB}MB of the one-day export")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--export":
+        asyncio.run(export(json.loads(sys.argv[2])))
+    else:
+        asyncio.run(stress_export_memory())
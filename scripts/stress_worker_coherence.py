@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from benchlib import BACKEND_DIR, MONGO_URL, DB_NAME
+
+os.environ.setdefault("MONGO_URL", MONGO_URL)
+os.environ["DB_NAME"] = DB_NAME
+
+import httpx
+
+import server
+
+SERVE = BACKEND_DIR / "serve.py"
+POLL_INTERVAL = 5.0
+# Writes made outside the app reach every worker through its own poll
+FEED_BOUND = 2 * POLL_INTERVAL + 1
+# Writes made by a worker reach the others over the invalidation bus, well inside one poll
+BUS_BOUND = 1.0
+
+
+def start_workers(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "CATALOG_CACHE_INVALIDATION": "poll", "CATALOG_CACHE_POLL_INTERVAL": str(POLL_INTERVAL)}
+    return subprocess.Popen([sys.executable, str(SERVE), "--host", "127.0.0.1", "--port", str(port),
+                             "--workers", str(workers), "--log-level", "warning"], cwd=BACKEND_DIR, env=env)
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while True:
+            try:
+                if (await http.get("/api/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("workers did not start")
+            await asyncio.sleep(0.2)
+
+
+async def connect_to_every_worker(base_url: str, workers: int) -> dict:
+    """One keep-alive connection per worker, keyed by the worker's pid."""
+    clients = {}
+    for _ in range(50 * workers):
+        http = httpx.AsyncClient(base_url=base_url)
+        pid = re.search(r'server_process_info\{pid="(\d+)"\}', (await http.get("/metrics")).text).group(1)
+        if pid in clients:
+            await http.aclose()
+        else:
+            clients[pid] = http
+        if len(clients) == workers:
+            return clients
+    raise RuntimeError(f"only reached {len(clients)} of {workers} workers")
+
+
+async def time_until_visible(clients: dict, check, bound: float) -> dict:
+    """Seconds until ``check(http)`` holds on each worker, or None if it did not within ``bound``."""
+    start = time.monotonic()
+    seen = {}
+    while len(seen) < len(clients) and time.monotonic() - start < bound:
+        for pid, http in clients.items():
+            if pid not in seen and await check(http):
+                seen[pid] = time.monotonic() - start
+        await asyncio.sleep(0.05)
+    return {pid: seen.get(pid) for pid in clients}
+
+
+def report(label: str, delays: dict, bound: float) -> bool:
+    ok = all(delay is not None for delay in delays.values())
+    shown = ", ".join(f"{pid}={'stale' if delay is None else f'{delay:.2f}s'}" for pid, delay in delays.items())
+    print(f"{'OK  ' if ok else 'FAIL'} {label} (bound {bound:.1f}s): {shown}")
+    return ok
+
+
+async def stress_worker_coherence(args) -> int:
+    db = server.db
+    await db.products.delete_many({})
+    await db.carts.delete_many({})
+    await db.orders.delete_many({})
+    await db.revoked_tokens.delete_many({})
+
+    now = datetime.now(timezone.utc).isoformat()
+    product = {"id": str(uuid.uuid4()), "name": "Coherence Probe", "description": "Worker coherence check",
+               "price": 100.0, "image_url": "", "category": "Stress", "stock": 1000,
+               "requires_prescription": False, "updated_at": now}
+    await db.products.insert_one(dict(product))
+    user_id = str(uuid.uuid4())
+    await db.users.insert_one({"id": user_id, "email": f"{user_id}@stress.test", "phone": "0", "name": "Shopper",
+                               "password": "x"})
+    headers = {"Authorization": f"Bearer {server.create_access_token({'sub': user_id})}"}
+    product_url = f"/api/products/{product['id']}"
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    process = start_workers(args.workers, args.port)
+    clients = {}
+    try:
+        await wait_until_ready(base_url)
+        clients = await connect_to_every_worker(base_url, args.workers)
+        for http in clients.values():
+            assert (await http.get(product_url)).json()["price"] == 100.0
+
+        # 1. A price change written straight to Mongo, the way a catalog import does
+        await db.products.update_one({"id": product["id"]}, {"$set": {
+            "price": 120.0, "updated_at": datetime.now(timezone.utc).isoformat()}})
+
+        async def new_price(http):
+            return (await http.get(product_url)).json()["price"] == 120.0
+        passed = report("price update visible in every worker", await time_until_visible(clients, new_price, FEED_BOUND),
+                        FEED_BOUND)
+
+        # 2. Stock taken by an order placed through one worker
+        first = next(iter(clients.values()))
+        await db.carts.insert_one({"id": str(uuid.uuid4()), "user_id": user_id,
+                                   "items": [{"product_id": product["id"], "quantity": 3}]})
+        response = await first.post("/api/orders", headers=headers,
+                                    json={"payment_method": "COD", "delivery_address": "Stress Street", "phone": "0"})
+        assert response.status_code == 200, response.text
+
+        async def new_stock(http):
+            return (await http.get(product_url)).json()["stock"] == 997
+        passed &= report("order stock visible in every worker", await time_until_visible(clients, new_stock, BUS_BOUND),
+                         BUS_BOUND)
+
+        # 3. A logout handled by one worker
+        assert (await first.post("/api/auth/logout", headers=headers)).status_code == 200
+
+        async def rejected(http):
+            return (await http.get("/api/auth/me", headers=headers)).status_code == 401
+        passed &= report("logout honoured by every worker", await time_until_visible(clients, rejected, BUS_BOUND),
+                         BUS_BOUND)
+    finally:
+        for http in clients.values():
+            await http.aclose()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        server.client.close()
+
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that cache invalidations reach every serve.py worker in time")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    sys.exit(asyncio.run(stress_worker_coherence(parser.parse_args())))